@@ -19,6 +19,10 @@ The `postgresql` module provides methods for interacting with the PostgreSQL ins
 Any charm using this library should import the `psycopg2` or `psycopg2-binary` dependency.
 """
 import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Set, Tuple
 
 import psycopg2
@@ -32,14 +36,25 @@ LIBAPI = 0
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
-LIBPATCH = 17
+LIBPATCH = 30
 
 INVALID_EXTRA_USER_ROLE_BLOCKING_MESSAGE = "invalid role(s) for extra user roles"
 
+# Maximum number of databases processed at the same time (e.g. when updating extensions).
+DATABASES_MAX_WORKERS = 8
+
+# Size in bytes of the memory units and in milliseconds of the time units accepted by PostgreSQL.
+MEMORY_UNITS = {"B": 1, "kB": 1024, "MB": 1024**2, "GB": 1024**3, "TB": 1024**4}
+TIME_UNITS = {"us": 0.001, "ms": 1, "s": 1000, "min": 60000, "h": 3600000, "d": 86400000}
+
 
 logger = logging.getLogger(__name__)
 
 
+class PostgreSQLCheckBackupInProgressError(Exception):
+    """Exception raised when checking whether a backup is in progress fails."""
+
+
 class PostgreSQLCreateDatabaseError(Exception):
     """Exception raised when creating a database fails."""
 
@@ -64,10 +79,26 @@ class PostgreSQLEnableDisableExtensionError(Exception):
     """Exception raised when enabling/disabling an extension fails."""
 
 
+class PostgreSQLGetParametersError(Exception):
+    """Exception raised when retrieving the parameters settings fails."""
+
+
 class PostgreSQLGetPostgreSQLVersionError(Exception):
     """Exception raised when retrieving PostgreSQL version fails."""
 
 
+class PostgreSQLInvalidParameterError(Exception):
+    """Exception raised when a parameter or its value is not valid."""
+
+    def __init__(self, message: str = None):
+        super().__init__(message)
+        self.message = message
+
+
+class PostgreSQLListDatabasesError(Exception):
+    """Exception raised when retrieving PostgreSQL databases list fails."""
+
+
 class PostgreSQLListUsersError(Exception):
     """Exception raised when retrieving PostgreSQL users list fails."""
 
@@ -76,6 +107,20 @@ class PostgreSQLUpdateUserPasswordError(Exception):
     """Exception raised when updating a user password fails."""
 
 
+class _CachedConnection(psycopg2.extensions.connection):
+    """Connection kept open when the methods using it close it, so it can be reused.
+
+    Only used when the connections cache is enabled through `PostgreSQL(cache_connections=True)`.
+    """
+
+    def close(self) -> None:
+        """Keep the connection open until it's closed through `PostgreSQL.close_all`."""
+
+    def force_close(self) -> None:
+        """Closes the connection."""
+        super().close()
+
+
 class PostgreSQL:
     """Class to encapsulate all operations related to interacting with PostgreSQL instance."""
 
@@ -87,6 +132,7 @@ class PostgreSQL:
         password: str,
         database: str,
         system_users: List[str] = [],
+        cache_connections: bool = False,
     ):
         self.primary_host = primary_host
         self.current_host = current_host
@@ -94,12 +140,28 @@ class PostgreSQL:
         self.password = password
         self.database = database
         self.system_users = system_users
+        # Connections to the default database, reused (when enabled) until `close_all` is called.
+        self.cache_connections = cache_connections
+        self._connections: Dict[Tuple[str, str], _CachedConnection] = {}
+        self._connections_lock = threading.Lock()
+
+    def close_all(self) -> None:
+        """Closes all the cached connections."""
+        with self._connections_lock:
+            for connection in self._connections.values():
+                connection.force_close()
+            self._connections.clear()
 
     def _connect_to_database(
         self, database: str = None, connect_to_current_host: bool = False
     ) -> psycopg2.extensions.connection:
         """Creates a connection to the database.
 
+        When `cache_connections` is enabled, connections to the default database are cached
+        by host and reused (after checking they're still healthy) until `close_all` is called,
+        so closing them has no effect. Connections to other databases, which are usually used
+        once, are never cached.
+
         Args:
             database: database to connect to (defaults to the database
                 provided when the object for this class was created).
@@ -110,9 +172,37 @@ class PostgreSQL:
              psycopg2 connection object.
         """
         host = self.current_host if connect_to_current_host else self.primary_host
+        database = database if database else self.database
+        if not self.cache_connections or database != self.database:
+            return self._create_connection(host, database)
+
+        key = (host, database)
+        with self._connections_lock:
+            connection = self._connections.pop(key, None)
+            if connection is not None:
+                try:
+                    # Polling an idle connection detects when the server closed it.
+                    if not connection.closed:
+                        connection.poll()
+                        self._connections[key] = connection
+                        return connection
+                except psycopg2.Error:
+                    pass
+                logger.debug(f"Reconnecting to database {database} on {host}")
+                connection.force_close()
+
+            connection = self._create_connection(host, database, _CachedConnection)
+            self._connections[key] = connection
+            return connection
+
+    def _create_connection(
+        self, host: str, database: str, connection_factory: type = None
+    ) -> psycopg2.extensions.connection:
+        """Creates a new connection to a database in a host."""
         connection = psycopg2.connect(
-            f"dbname='{database if database else self.database}' user='{self.user}' host='{host}'"
-            f"password='{self.password}' connect_timeout=1"
+            f"dbname='{database}' user='{self.user}' host='{host}'"
+            f"password='{self.password}' connect_timeout=1",
+            connection_factory=connection_factory,
         )
         connection.autocommit = True
         return connection
@@ -120,60 +210,122 @@ class PostgreSQL:
     def create_database(self, database: str, user: str, plugins: List[str] = []) -> None:
         """Creates a new database and grant privileges to a user on it.
 
+        The privileges and extensions are checked before being granted or enabled,
+        so calling this method again for an existing database doesn't change it.
+
         Args:
             database: database to be created.
             user: user that will have access to the database.
             plugins: extensions to enable in the new database.
         """
+        connection = None
         try:
             connection = self._connect_to_database()
-            cursor = connection.cursor()
-            cursor.execute(f"SELECT datname FROM pg_database WHERE datname='{database}';")
-            if cursor.fetchone() is None:
-                cursor.execute(sql.SQL("CREATE DATABASE {};").format(sql.Identifier(database)))
-            cursor.execute(
-                sql.SQL("REVOKE ALL PRIVILEGES ON DATABASE {} FROM PUBLIC;").format(
-                    sql.Identifier(database)
-                )
-            )
-            for user_to_grant_access in [user, "admin"] + self.system_users:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT datname FROM pg_database WHERE datname = %s;", (database,))
+                if cursor.fetchone() is None:
+                    cursor.execute(sql.SQL("CREATE DATABASE {};").format(sql.Identifier(database)))
                 cursor.execute(
-                    sql.SQL("GRANT ALL PRIVILEGES ON DATABASE {} TO {};").format(
-                        sql.Identifier(database), sql.Identifier(user_to_grant_access)
+                    sql.SQL(
+                        """DO $$
+DECLARE
+    database_name TEXT := {database};
+    grantee TEXT;
+BEGIN
+    IF has_database_privilege('public', database_name, 'CONNECT')
+        OR has_database_privilege('public', database_name, 'CREATE')
+        OR has_database_privilege('public', database_name, 'TEMPORARY') THEN
+        EXECUTE format('REVOKE ALL PRIVILEGES ON DATABASE %I FROM PUBLIC;', database_name);
+    END IF;
+    FOREACH grantee IN ARRAY {grantees}::TEXT[] LOOP
+        IF NOT (has_database_privilege(grantee, database_name, 'CONNECT')
+            AND has_database_privilege(grantee, database_name, 'CREATE')
+            AND has_database_privilege(grantee, database_name, 'TEMPORARY')) THEN
+            EXECUTE format(
+                'GRANT ALL PRIVILEGES ON DATABASE %I TO %I;', database_name, grantee
+            );
+        END IF;
+    END LOOP;
+END;
+$$;"""
+                    ).format(
+                        database=sql.Literal(database),
+                        grantees=sql.Literal([user, "admin"] + self.system_users),
                     )
                 )
-            with self._connect_to_database(database=database) as conn:
-                with conn.cursor() as curs:
-                    statements = []
-                    curs.execute(
-                        "SELECT schema_name FROM information_schema.schemata WHERE schema_name NOT LIKE 'pg_%' and schema_name <> 'information_schema';"
-                    )
-                    for row in curs:
-                        schema = sql.Identifier(row[0])
-                        statements.append(
-                            sql.SQL(
-                                "GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA {} TO {};"
-                            ).format(schema, sql.Identifier(user))
-                        )
-                        statements.append(
-                            sql.SQL(
-                                "GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA {} TO {};"
-                            ).format(schema, sql.Identifier(user))
-                        )
-                        statements.append(
-                            sql.SQL(
-                                "GRANT ALL PRIVILEGES ON ALL FUNCTIONS IN SCHEMA {} TO {};"
-                            ).format(schema, sql.Identifier(user))
-                        )
-                    for statement in statements:
-                        curs.execute(statement)
         except psycopg2.Error as e:
             logger.error(f"Failed to create database: {e}")
             raise PostgreSQLCreateDatabaseError()
+        finally:
+            if connection is not None:
+                connection.close()
 
-        # Enable preset extensions
-        for plugin in plugins:
-            self.enable_disable_extension(plugin, True, database)
+        # Grant the privileges on the existing objects and enable the preset extensions in
+        # a single batch.
+        connection = None
+        try:
+            with self._connect_to_database(
+                database=database
+            ) as connection, connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL(
+                        """DO $$
+DECLARE
+    grantee TEXT := {user};
+    schema_row RECORD;
+    extension_name TEXT;
+BEGIN
+    FOR schema_row IN SELECT oid, nspname FROM pg_namespace
+        WHERE nspname NOT LIKE 'pg_%' AND nspname <> 'information_schema' LOOP
+        IF EXISTS (SELECT 1 FROM pg_class
+            WHERE relnamespace = schema_row.oid AND relkind IN ('r', 'p', 'v', 'm', 'f')
+            AND NOT (has_table_privilege(grantee, oid, 'SELECT')
+                AND has_table_privilege(grantee, oid, 'INSERT')
+                AND has_table_privilege(grantee, oid, 'UPDATE')
+                AND has_table_privilege(grantee, oid, 'DELETE')
+                AND has_table_privilege(grantee, oid, 'TRUNCATE')
+                AND has_table_privilege(grantee, oid, 'REFERENCES')
+                AND has_table_privilege(grantee, oid, 'TRIGGER'))) THEN
+            EXECUTE format(
+                'GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA %I TO %I;', schema_row.nspname, grantee
+            );
+        END IF;
+        IF EXISTS (SELECT 1 FROM pg_class
+            WHERE relnamespace = schema_row.oid AND relkind = 'S'
+            AND NOT (has_sequence_privilege(grantee, oid, 'USAGE')
+                AND has_sequence_privilege(grantee, oid, 'SELECT')
+                AND has_sequence_privilege(grantee, oid, 'UPDATE'))) THEN
+            EXECUTE format(
+                'GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA %I TO %I;',
+                schema_row.nspname,
+                grantee
+            );
+        END IF;
+        IF EXISTS (SELECT 1 FROM pg_proc
+            WHERE pronamespace = schema_row.oid AND prokind IN ('f', 'a', 'w')
+            AND NOT has_function_privilege(grantee, oid, 'EXECUTE')) THEN
+            EXECUTE format(
+                'GRANT ALL PRIVILEGES ON ALL FUNCTIONS IN SCHEMA %I TO %I;',
+                schema_row.nspname,
+                grantee
+            );
+        END IF;
+    END LOOP;
+    FOREACH extension_name IN ARRAY {plugins}::TEXT[] LOOP
+        IF NOT EXISTS (SELECT 1 FROM pg_extension WHERE extname = extension_name) THEN
+            EXECUTE format('CREATE EXTENSION %I;', extension_name);
+        END IF;
+    END LOOP;
+END;
+$$;"""
+                    ).format(user=sql.Literal(user), plugins=sql.Literal(list(plugins)))
+                )
+        except psycopg2.Error as e:
+            logger.error(f"Failed to set up database: {e}")
+            raise PostgreSQLCreateDatabaseError()
+        finally:
+            if connection is not None:
+                connection.close()
 
     def create_user(
         self, user: str, password: str = None, admin: bool = False, extra_user_roles: str = None
@@ -239,36 +391,73 @@ class PostgreSQL:
         Args:
             user: user to be deleted.
         """
-        # First of all, check whether the user exists. Otherwise, do nothing.
-        users = self.list_users()
-        if user not in users:
-            return
-
-        # List all databases.
+        start_time = time.monotonic()
+        connection = None
         try:
-            with self._connect_to_database() as connection, connection.cursor() as cursor:
+            connection = self._connect_to_database()
+            with connection.cursor() as cursor:
+                # First of all, check whether the user exists. Otherwise, do nothing.
+                cursor.execute("SELECT 1 FROM pg_catalog.pg_user WHERE usename = %s;", (user,))
+                if cursor.fetchone() is None:
+                    return
+
+                # List all databases.
                 cursor.execute("SELECT datname FROM pg_database WHERE datistemplate = false;")
                 databases = [row[0] for row in cursor.fetchall()]
+            listing_time = time.monotonic()
+            logger.debug(
+                f"Listed {len(databases)} databases to delete user {user}"
+                f" in {listing_time - start_time:.2f}s"
+            )
 
             # Existing objects need to be reassigned in each database
             # before the user can be deleted.
-            for database in databases:
-                with self._connect_to_database(
-                    database
-                ) as connection, connection.cursor() as cursor:
-                    cursor.execute(
-                        sql.SQL("REASSIGN OWNED BY {} TO {};").format(
-                            sql.Identifier(user), sql.Identifier(self.user)
-                        )
+            with ThreadPoolExecutor(
+                max_workers=max(1, min(DATABASES_MAX_WORKERS, len(databases)))
+            ) as executor:
+                # Consume the results to raise any error from the workers.
+                list(
+                    executor.map(
+                        lambda database: self._reassign_and_drop_owned_objects(user, database),
+                        databases,
                     )
-                    cursor.execute(sql.SQL("DROP OWNED BY {};").format(sql.Identifier(user)))
+                )
+            reassigning_time = time.monotonic()
+            logger.debug(
+                f"Reassigned the objects owned by user {user}"
+                f" in {reassigning_time - listing_time:.2f}s"
+            )
 
             # Delete the user.
-            with self._connect_to_database() as connection, connection.cursor() as cursor:
+            with connection.cursor() as cursor:
                 cursor.execute(sql.SQL("DROP ROLE {};").format(sql.Identifier(user)))
+            logger.debug(f"Dropped user {user} in {time.monotonic() - reassigning_time:.2f}s")
         except psycopg2.Error as e:
             logger.error(f"Failed to delete user: {e}")
             raise PostgreSQLDeleteUserError()
+        finally:
+            if connection is not None:
+                connection.close()
+
+    def _reassign_and_drop_owned_objects(self, user: str, database: str) -> None:
+        """Reassigns the objects owned by a user in a database and drops its privileges.
+
+        Args:
+            user: user whose objects should be reassigned.
+            database: database where the objects are.
+        """
+        connection = None
+        try:
+            with self._connect_to_database(database) as connection, connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL("REASSIGN OWNED BY {} TO {};").format(
+                        sql.Identifier(user), sql.Identifier(self.user)
+                    )
+                )
+                cursor.execute(sql.SQL("DROP OWNED BY {};").format(sql.Identifier(user)))
+        finally:
+            if connection is not None:
+                connection.close()
 
     def enable_disable_extension(self, extension: str, enable: bool, database: str = None) -> None:
         """Enables or disables a PostgreSQL extension.
@@ -310,6 +499,105 @@ class PostgreSQL:
             if connection is not None:
                 connection.close()
 
+    def enable_disable_extensions(self, extensions: Dict[str, bool], database: str = None) -> None:
+        """Enables or disables multiple PostgreSQL extensions.
+
+        The installed extensions of each database are read once and only the needed changes
+        are applied, using a single connection per database. The databases are processed
+        concurrently.
+
+        Args:
+            extensions: dictionary with whether each extension should be enabled.
+            database: optional database where to enable/disable the extensions.
+
+        Raises:
+            PostgreSQLEnableDisableExtensionError if the operation fails (only after trying
+                to change all the extensions, when some of them fail).
+        """
+        connection = None
+        try:
+            if database is not None:
+                databases = [database]
+            else:
+                # Retrieve all the databases.
+                with self._connect_to_database() as connection, connection.cursor() as cursor:
+                    cursor.execute("SELECT datname FROM pg_database WHERE NOT datistemplate;")
+                    databases = [database[0] for database in cursor.fetchall()]
+
+            with ThreadPoolExecutor(
+                max_workers=max(1, min(DATABASES_MAX_WORKERS, len(databases)))
+            ) as executor:
+                failed_extensions = {
+                    database: failed
+                    for database, failed in zip(
+                        databases,
+                        executor.map(
+                            lambda database: self._enable_disable_extensions_in_database(
+                                extensions, database
+                            ),
+                            databases,
+                        ),
+                    )
+                    if failed
+                }
+        except psycopg2.Error as e:
+            logger.error(f"Failed to enable/disable extensions: {e}")
+            raise PostgreSQLEnableDisableExtensionError()
+        finally:
+            if connection is not None:
+                connection.close()
+
+        if failed_extensions:
+            raise PostgreSQLEnableDisableExtensionError(
+                "; ".join(
+                    f"{', '.join(failed)} in {database}"
+                    for database, failed in failed_extensions.items()
+                )
+            )
+
+    def _enable_disable_extensions_in_database(
+        self, extensions: Dict[str, bool], database: str
+    ) -> List[str]:
+        """Enables or disables the extensions in a database that aren't in the desired state.
+
+        Each statement runs in its own transaction (the connection is in autocommit mode),
+        so an extension that fails to be enabled/disabled doesn't undo the other changes.
+
+        Args:
+            extensions: dictionary with whether each extension should be enabled.
+            database: database where to enable/disable the extensions.
+
+        Returns:
+            the extensions that failed to be enabled/disabled.
+        """
+        failed_extensions = []
+        connection = self._connect_to_database(database=database)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT extname FROM pg_extension;")
+                installed_extensions = {extension[0] for extension in cursor.fetchall()}
+                for extension, enable in extensions.items():
+                    if enable and extension not in installed_extensions:
+                        statement = "CREATE EXTENSION IF NOT EXISTS {};"
+                    elif not enable and extension in installed_extensions:
+                        statement = "DROP EXTENSION IF EXISTS {};"
+                    else:
+                        continue
+                    try:
+                        cursor.execute(sql.SQL(statement).format(sql.Identifier(extension)))
+                    except psycopg2.errors.UniqueViolation:
+                        # The extension was created concurrently by another session.
+                        pass
+                    except psycopg2.Error as e:
+                        logger.error(
+                            f"Failed to {'enable' if enable else 'disable'} extension"
+                            f" {extension} in database {database}: {e}"
+                        )
+                        failed_extensions.append(extension)
+        finally:
+            connection.close()
+        return failed_extensions
+
     def get_postgresql_version(self) -> str:
         """Returns the PostgreSQL version.
 
@@ -345,6 +633,21 @@ class PostgreSQL:
             # Connection errors happen when PostgreSQL has not started yet.
             return False
 
+    def list_databases(self) -> Set[str]:
+        """Returns the list of PostgreSQL databases.
+
+        Returns:
+            List of PostgreSQL databases.
+        """
+        try:
+            with self._connect_to_database() as connection, connection.cursor() as cursor:
+                cursor.execute("SELECT datname FROM pg_catalog.pg_database;")
+                databases = cursor.fetchall()
+                return {database[0] for database in databases}
+        except psycopg2.Error as e:
+            logger.error(f"Failed to list PostgreSQL databases: {e}")
+            raise PostgreSQLListDatabasesError()
+
     def list_users(self) -> Set[str]:
         """Returns the list of PostgreSQL database users.
 
@@ -443,9 +746,149 @@ class PostgreSQL:
             if connection:
                 connection.close()
 
+    def is_backup_in_progress(self) -> bool:
+        """Returns whether pgBackRest is creating a backup of the cluster.
+
+        pgBackRest always connects to the primary to create a backup, even when copying
+        the files from a replica, identifying itself in the connection application name.
+
+        Raises:
+            PostgreSQLCheckBackupInProgressError if the primary couldn't be queried.
+        """
+        connection = None
+        try:
+            with self._connect_to_database() as connection, connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT COUNT(*) FROM pg_stat_activity"
+                    " WHERE application_name = 'pgBackRest [backup]';"
+                )
+                return cursor.fetchone()[0] > 0
+        except psycopg2.Error as e:
+            logger.error(f"Failed to check if a backup is in progress: {e}")
+            raise PostgreSQLCheckBackupInProgressError()
+        finally:
+            if connection:
+                connection.close()
+
+    def _get_parameters_settings(self, names: List[str]) -> Dict[str, Tuple]:
+        """Returns the settings of the parameters from pg_settings.
+
+        Args:
+            names: names of the parameters.
+
+        Returns:
+            Dictionary with the context, type, unit, minimum value, maximum value
+                and accepted values of each existing parameter.
+        """
+        connection = None
+        try:
+            with self._connect_to_database() as connection, connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT name, context, vartype, unit, min_val, max_val, enumvals"
+                    " FROM pg_settings WHERE name = ANY(%s);",
+                    (list(names),),
+                )
+                return {row[0]: row[1:] for row in cursor.fetchall()}
+        except psycopg2.Error as e:
+            logger.error(f"Failed to get the parameters settings: {e}")
+            raise PostgreSQLGetParametersError()
+        finally:
+            if connection is not None:
+                connection.close()
+
+    def get_parameters_context(self, names: List[str]) -> Dict[str, str]:
+        """Returns the context of the parameters (when their changes take effect).
+
+        Args:
+            names: names of the parameters.
+
+        Returns:
+            Dictionary with the context of each parameter, like `postmaster` (which
+                needs a restart) or `sighup` (which needs a reload). Custom parameters
+                (like the ones from extensions) have the `user` context.
+        """
+        settings = self._get_parameters_settings(names)
+        return {name: settings[name][0] if name in settings else "user" for name in names}
+
+    def validate_parameters(self, parameters: Dict[str, str]) -> Dict[str, str]:
+        """Validates the parameters values against their settings in pg_settings.
+
+        Args:
+            parameters: dictionary with the parameters values.
+
+        Returns:
+            Dictionary with the context of each parameter.
+
+        Raises:
+            PostgreSQLInvalidParameterError if any parameter or value is not valid.
+        """
+        settings = self._get_parameters_settings(list(parameters))
+        contexts = {}
+        for name, value in parameters.items():
+            if name not in settings:
+                # Only custom parameters, which have a dot in the name, can be unknown.
+                if "." not in name:
+                    raise PostgreSQLInvalidParameterError(f"unknown parameter {name}")
+                contexts[name] = "user"
+                continue
+
+            context, vartype, unit, min_value, max_value, accepted_values = settings[name]
+            if context == "internal":
+                raise PostgreSQLInvalidParameterError(f"{name} cannot be changed")
+            if vartype == "bool":
+                valid = value.lower() in ["on", "off", "true", "false", "yes", "no", "1", "0"]
+            elif vartype == "enum":
+                valid = value.lower() in [accepted.lower() for accepted in accepted_values]
+            elif vartype in ["integer", "real"]:
+                number = self._convert_to_parameter_unit(value, unit)
+                valid = (
+                    number is not None
+                    and float(min_value) <= number <= float(max_value)
+                    and (vartype == "real" or unit is not None or number.is_integer())
+                )
+            else:
+                valid = True
+            if not valid:
+                raise PostgreSQLInvalidParameterError(f"invalid value {value} for {name}")
+            contexts[name] = context
+        return contexts
+
+    @staticmethod
+    def _convert_to_parameter_unit(value: str, unit: Optional[str]) -> Optional[float]:
+        """Converts a numeric value (optionally with a memory or time unit) to the parameter unit.
+
+        Args:
+            value: the value to convert, e.g. "64MB" or "30s".
+            unit: the unit of the parameter in pg_settings, e.g. "8kB" or "ms".
+
+        Returns:
+            The value in the parameter unit or None if the value is not valid.
+        """
+        match = re.fullmatch(r"\s*(-?\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*", value)
+        if match is None:
+            return None
+        number, value_unit = float(match.group(1)), match.group(2)
+        if not value_unit:
+            return number
+        if unit is None:
+            return None
+
+        # Units like "8kB" are a multiple of a base unit.
+        unit_match = re.fullmatch(r"(\d*)(\w+)", unit)
+        unit_multiple = int(unit_match.group(1) or 1)
+        for units in [MEMORY_UNITS, TIME_UNITS]:
+            if value_unit in units and unit_match.group(2) in units:
+                return number * units[value_unit] / (units[unit_match.group(2)] * unit_multiple)
+        return None
+
     @staticmethod
     def build_postgresql_parameters(
-        profile: str, available_memory: int, limit_memory: Optional[int] = None
+        profile: str,
+        available_memory: int,
+        limit_memory: Optional[int] = None,
+        available_cpu_cores: Optional[float] = None,
+        storage_size: Optional[int] = None,
+        workload_type: str = "mixed",
     ) -> Optional[Dict[str, str]]:
         """Builds the PostgreSQL parameters.
 
@@ -453,25 +896,86 @@ class PostgreSQL:
             profile: the profile to use.
             available_memory: available memory to use in calculation in bytes.
             limit_memory: (optional) limit memory to use in calculation in bytes.
+            available_cpu_cores: (optional) CPU cores available to the database.
+            storage_size: (optional) size of the data volume in bytes.
+            workload_type: the kind of workload the database serves
+                (`oltp`, `olap` or `mixed`).
 
         Returns:
             Dictionary with the PostgreSQL parameters.
         """
         if limit_memory:
             available_memory = min(available_memory, limit_memory)
-        logger.debug(f"Building PostgreSQL parameters for {profile=} and {available_memory=}")
-        if profile == "production":
-            # Use 25% of the available memory for shared_buffers.
-            # and the remaind as cache memory.
-            shared_buffers = int(available_memory * 0.25)
-            effective_cache_size = int(available_memory - shared_buffers)
-
-            parameters = {
-                "shared_buffers": f"{int(shared_buffers/10**6)}MB",
-                "effective_cache_size": f"{int(effective_cache_size/10**6)}MB",
-            }
-
-            return parameters
-        else:
+        logger.debug(
+            f"Building PostgreSQL parameters for {profile=}, {available_memory=},"
+            f" {available_cpu_cores=}, {storage_size=} and {workload_type=}"
+        )
+        if profile != "production":
             # Return default
             return {"shared_buffers": "128MB"}
+
+        # Use 25% of the available memory for shared_buffers.
+        # and the remaind as cache memory.
+        shared_buffers = int(available_memory * 0.25)
+        effective_cache_size = int(available_memory - shared_buffers)
+
+        parameters = {
+            "shared_buffers": f"{int(shared_buffers/10**6)}MB",
+            "effective_cache_size": f"{int(effective_cache_size/10**6)}MB",
+            # Spread the checkpoint writes over most of the interval between checkpoints.
+            "checkpoint_completion_target": "0.9",
+            # Same as the PostgreSQL automatic value (3% of shared_buffers, up to 16MB).
+            "wal_buffers": f"{max(64, min(16384, int(shared_buffers * 0.03 / 1024)))}kB",
+        }
+
+        # Size the parallelism settings from the available CPU cores.
+        parallel_workers_per_gather = 1
+        if available_cpu_cores:
+            cpu_cores = max(1, int(available_cpu_cores))
+            parallel_workers_per_gather = cpu_cores // 2
+            if workload_type != "olap":
+                # Concurrent short queries benefit more from free cores than from parallelism.
+                parallel_workers_per_gather = min(4, parallel_workers_per_gather)
+            parameters.update(
+                {
+                    # Leave room for the logical replication and other background workers.
+                    "max_worker_processes": str(max(8, cpu_cores + 4)),
+                    "max_parallel_workers": str(cpu_cores),
+                    "max_parallel_workers_per_gather": str(parallel_workers_per_gather),
+                    "max_parallel_maintenance_workers": str(min(4, cpu_cores // 2)),
+                    # One autovacuum worker for every four cores (at least the default three).
+                    "autovacuum_max_workers": str(min(8, max(3, cpu_cores // 4))),
+                }
+            )
+
+        # Split the memory not used by shared_buffers between the (default 100) connections,
+        # the operations of each query (fewer in analytical workloads) and the parallel workers.
+        operations_per_query = {"oltp": 4, "mixed": 3, "olap": 2}.get(workload_type, 3)
+        work_mem = (available_memory - shared_buffers) / (100 * operations_per_query)
+        work_mem = work_mem / max(1, parallel_workers_per_gather)
+        maintenance_work_mem = available_memory / (8 if workload_type == "olap" else 16)
+        parameters.update(
+            {
+                "work_mem": f"{max(64, int(work_mem / 1024))}kB",
+                "maintenance_work_mem": f"{min(2048, max(64, int(maintenance_work_mem / 2**20)))}MB",
+            }
+        )
+
+        # Write heavy workloads benefit from fewer (and larger) checkpoints, as long as the WAL
+        # fits in the data volume.
+        min_wal_size, max_wal_size = {
+            "oltp": (2048, 8192),
+            "mixed": (1024, 4096),
+            "olap": (4096, 16384),
+        }.get(workload_type, (1024, 4096))
+        if storage_size:
+            max_wal_size = max(64, min(max_wal_size, int(storage_size / 4 / 2**20)))
+            min_wal_size = max(32, min(min_wal_size, max_wal_size // 4))
+        parameters.update(
+            {
+                "min_wal_size": f"{min_wal_size}MB",
+                "max_wal_size": f"{max_wal_size}MB",
+            }
+        )
+
+        return parameters
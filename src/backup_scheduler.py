@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Scheduler of the pgBackRest backups.
+
+It runs as a Pebble service in the workload container of the unit designated to create
+the backups, so it only depends on the Python standard library.
+"""
+import argparse
+import logging
+import os
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Allowed range of each field of a schedule: minute, hour, day of month, month and day of week.
+SCHEDULE_FIELDS_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+# Backup types (pgBackRest names) in order of precedence when more than one is due.
+BACKUP_TYPES = ["full", "diff", "incr"]
+
+
+class CronSchedule:
+    """A cron-like schedule: minute, hour, day of month, month and day of week.
+
+    Each field accepts `*`, numbers, ranges (`1-5`), steps (`*/15`, `0-30/10`) and lists
+    of them (`0,30`). Sunday is both 0 and 7 in the day of week field.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != len(SCHEDULE_FIELDS_RANGES):
+            raise ValueError(f"Schedule must have {len(SCHEDULE_FIELDS_RANGES)} fields")
+
+        self.expression = expression
+        (
+            self.minutes,
+            self.hours,
+            self.days,
+            self.months,
+            self.weekdays,
+        ) = (
+            self._parse_field(field, *field_range)
+            for field, field_range in zip(fields, SCHEDULE_FIELDS_RANGES)
+        )
+        if 7 in self.weekdays:
+            self.weekdays.add(0)
+        # As in cron, when both days fields are restricted (don't start with `*`),
+        # a date matching either is due.
+        self._any_day = fields[2].startswith("*") or fields[4].startswith("*")
+
+    @staticmethod
+    def _parse_field(field: str, minimum: int, maximum: int) -> Set[int]:
+        """Returns the values allowed by a schedule field."""
+        values = set()
+        for item in field.split(","):
+            values_range, _, step = item.partition("/")
+            if values_range == "*":
+                start, end = minimum, maximum
+            else:
+                start, _, end = values_range.partition("-")
+                start, end = int(start), int(end or (maximum if step else start))
+            step = int(step or 1)
+            if not minimum <= start <= end <= maximum or step < 1:
+                raise ValueError(f"Invalid schedule field: {field}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def is_due(self, moment: datetime) -> bool:
+        """Whether the schedule is due at the given minute."""
+        day_matches = moment.day in self.days
+        weekday_matches = (moment.isoweekday() % 7) in self.weekdays
+        return (
+            moment.minute in self.minutes
+            and moment.hour in self.hours
+            and moment.month in self.months
+            and (
+                (day_matches and weekday_matches)
+                if self._any_day
+                else (day_matches or weekday_matches)
+            )
+        )
+
+
+def get_due_backup_type(
+    schedules: List[Tuple[str, Optional[CronSchedule]]], moment: datetime
+) -> Optional[str]:
+    """Returns the type of the backup that is due at the given minute (if any)."""
+    return next(
+        (
+            backup_type
+            for backup_type, schedule in schedules
+            if schedule is not None and schedule.is_due(moment)
+        ),
+        None,
+    )
+
+
+def run(command: List[str]) -> subprocess.CompletedProcess:
+    """Run a pgBackRest command, logging its failure."""
+    logger.info(f"Running {' '.join(command)}")
+    process = subprocess.run(command, capture_output=True, text=True)
+    if process.returncode != 0:
+        logger.error(f"Command failed with code {process.returncode}: {process.stderr}")
+    return process
+
+
+def save_logs(logs_path: str, moment: datetime, process: subprocess.CompletedProcess) -> None:
+    """Save the output of a backup, which the charm uploads to S3 later."""
+    os.makedirs(logs_path, exist_ok=True)
+    with open(os.path.join(logs_path, f"{moment:%Y%m%d-%H%M%S}.log"), "w") as file:
+        file.write(f"Stdout:\n{process.stdout}\n\nStderr:\n{process.stderr}\n")
+
+
+def main() -> None:
+    """Create the backups and expire the old ones following the schedules."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stanza", required=True)
+    parser.add_argument("--full")
+    parser.add_argument("--diff")
+    parser.add_argument("--incr")
+    parser.add_argument("--retention-days", type=int, default=0)
+    parser.add_argument("--no-backup-standby", action="store_true")
+    parser.add_argument("--logs-path")
+    args = parser.parse_args()
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO)
+
+    schedules = [
+        (
+            backup_type,
+            CronSchedule(getattr(args, backup_type)) if getattr(args, backup_type) else None,
+        )
+        for backup_type in BACKUP_TYPES
+    ]
+    pgbackrest = ["pgbackrest", f"--stanza={args.stanza}"]
+    while True:
+        # Wake up at the start of the next minute.
+        now = datetime.now(timezone.utc)
+        moment = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        time.sleep((moment - now).total_seconds())
+
+        backup_type = get_due_backup_type(schedules, moment)
+        if backup_type is None:
+            continue
+        # The backups older than the retention by count are expired by pgBackRest
+        # after each backup, but the retention by age needs an explicit expiration.
+        command = [*pgbackrest, "--log-level-console=debug", f"--type={backup_type}", "backup"]
+        if args.no_backup_standby:
+            command.append("--no-backup-standby")
+        process = run(command)
+        if args.logs_path:
+            save_logs(args.logs_path, moment, process)
+        if args.retention_days:
+            run(
+                [
+                    *pgbackrest,
+                    "--repo1-retention-full-type=time",
+                    f"--repo1-retention-full={args.retention_days}",
+                    "expire",
+                ]
+            )
+
+
+if __name__ == "__main__":
+    main()
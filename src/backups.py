@@ -6,8 +6,9 @@ import json
 import logging
 import os
 import re
+import shlex
 import tempfile
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Dict, List, Optional, OrderedDict, Tuple
 
 import boto3 as boto3
@@ -21,10 +22,11 @@ from ops.charm import ActionEvent
 from ops.framework import Object
 from ops.jujuversion import JujuVersion
 from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus
-from ops.pebble import ChangeError, ExecError
+from ops.pebble import APIError, ChangeError, ExecError, PathError
 from tenacity import RetryError, Retrying, stop_after_attempt, wait_fixed
 
 from constants import BACKUP_USER, WORKLOAD_OS_GROUP, WORKLOAD_OS_USER
+from tracing import tracer
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +42,21 @@ S3_BLOCK_MESSAGES = [
     FAILED_TO_INITIALIZE_STANZA_ERROR_MESSAGE,
 ]
 
+# Backup types accepted by the create-backup action and their pgBackRest names.
+BACKUP_TYPE_OVERRIDES = {"full": "full", "differential": "diff", "incremental": "incr"}
+# Parameters of the restore action with the point-in-time recovery targets, by pgBackRest type.
+RESTORE_TARGET_PARAMS = {
+    "time": "restore-to-time",
+    "lsn": "restore-to-lsn",
+    "xid": "restore-to-xid",
+}
+# Number of WAL files waiting to be archived from which the archiving lag is reported.
+ARCHIVE_LAG_THRESHOLD = 64
+# Script (from the charm source) run by the scheduled backups service.
+SCHEDULER_FILE = "backup_scheduler.py"
+# Directory (in the storage path) where the scheduled backups service saves the backup logs.
+SCHEDULER_LOGS_DIR = "backup-logs"
+
 
 class PostgreSQLBackups(Object):
     """In this class, we manage PostgreSQL backups."""
@@ -158,6 +175,7 @@ class PostgreSQLBackups(Object):
             aws_secret_access_key=s3_parameters["secret-key"],
             region_name=s3_parameters["region"],
         )
+        tracer.trace_boto3_session(session)
 
         try:
             s3 = session.resource("s3", endpoint_url=self._construct_endpoint(s3_parameters))
@@ -215,11 +233,17 @@ class PostgreSQLBackups(Object):
 
     def _format_backup_list(self, backup_list) -> str:
         """Formats provided list of backups as a table."""
-        backups = ["{:<21s} | {:<12s} | {:s}".format("backup-id", "backup-type", "backup-status")]
+        backups = [
+            "{:<21s} | {:<12s} | {:<21s} | {:s}".format(
+                "backup-id", "backup-type", "reference-backup-id", "backup-status"
+            )
+        ]
         backups.append("-" * len(backups[0]))
-        for backup_id, backup_type, backup_status in backup_list:
+        for backup_id, backup_type, reference_backup_id, backup_status in backup_list:
             backups.append(
-                "{:<21s} | {:<12s} | {:s}".format(backup_id, backup_type, backup_status)
+                "{:<21s} | {:<12s} | {:<21s} | {:s}".format(
+                    backup_id, backup_type, reference_backup_id, backup_status
+                )
             )
         return "\n".join(backups)
 
@@ -229,49 +253,337 @@ class PostgreSQLBackups(Object):
         List contains successful and failed backups in order of ascending time.
         """
         backup_list = []
-        output, _ = self._execute_command(["pgbackrest", "info", "--output=json"])
-        backups = json.loads(output)[0]["backup"]
-        for backup in backups:
-            backup_id = datetime.strftime(
-                datetime.strptime(backup["label"][:-1], "%Y%m%d-%H%M%S"), "%Y-%m-%dT%H:%M:%SZ"
-            )
+        for backup_id, backup in self._get_backups(show_failed=True).items():
             error = backup["error"]
             backup_status = "finished"
             if error:
                 backup_status = f"failed: {error}"
-            backup_list.append((backup_id, "physical", backup_status))
+            backup_list.append(
+                (backup_id, backup["type"], backup["reference"] or "None", backup_status)
+            )
         return self._format_backup_list(backup_list)
 
-    def _list_backups(self, show_failed: bool) -> OrderedDict[str, str]:
-        """Retrieve the list of backups.
+    @staticmethod
+    def _get_backup_id_from_logs(logs: str) -> Optional[str]:
+        """Returns the backup id (the pgBackRest backup label) reported in a backup output."""
+        backup_label_stdout_line = re.findall(
+            r"(new backup label = )([0-9]{8}[-][0-9]{6}F(?:_[0-9]{8}[-][0-9]{6}[DI])?)$",
+            logs,
+            re.MULTILINE,
+        )
+        return backup_label_stdout_line[0][1] if len(backup_label_stdout_line) > 0 else None
+
+    @staticmethod
+    def _parse_backup_id(label: str) -> str:
+        """Returns the backup id from a pgBackRest backup label.
+
+        Differential and incremental backup labels are prefixed with the label
+        of the full backup they are based on (e.g. 20230101-090000F_20230102-090000D).
+        """
+        return datetime.strftime(
+            datetime.strptime(label.split("_")[-1][:-1], "%Y%m%d-%H%M%S"), "%Y-%m-%dT%H:%M:%SZ"
+        )
+
+    def _get_repository_info(self) -> Optional[Dict]:
+        """Returns the pgBackRest information about the stanza (backups and archived WAL)."""
+        output, _ = self._execute_command(["pgbackrest", "info", "--output=json"])
+        return next(iter(json.loads(output)), None)
+
+    def _get_backups(
+        self, show_failed: bool, repository_info: Optional[Dict] = None
+    ) -> OrderedDict[str, Dict]:
+        """Retrieve the details of the backups.
 
         Args:
             show_failed: whether to also return the failed backups.
+            repository_info: the pgBackRest stanza information, if already retrieved.
 
         Returns:
-            a dict of previously created backups (id + stanza name) or an empty list
-                if there is no backups in the S3 bucket.
+            a dict of previously created backups (id + details: the pgBackRest label, type,
+                reference (id of the backup it's based on), error, stanza name, and the
+                time, LSN and WAL file at which the backup stopped).
         """
-        output, _ = self._execute_command(["pgbackrest", "info", "--output=json"])
-        repository_info = next(iter(json.loads(output)), None)
+        if repository_info is None:
+            repository_info = self._get_repository_info()
 
         # If there are no backups, returns an empty dict.
         if repository_info is None:
-            return OrderedDict[str, str]()
+            return OrderedDict[str, Dict]()
 
-        backups = repository_info["backup"]
+        backup_types = {value: key for key, value in BACKUP_TYPE_OVERRIDES.items()}
         stanza_name = repository_info["name"]
-        return OrderedDict[str, str](
+        return OrderedDict[str, Dict](
             (
-                datetime.strftime(
-                    datetime.strptime(backup["label"][:-1], "%Y%m%d-%H%M%S"), "%Y-%m-%dT%H:%M:%SZ"
-                ),
-                stanza_name,
+                self._parse_backup_id(backup["label"]),
+                {
+                    "label": backup["label"],
+                    "type": backup_types.get(backup.get("type"), "full"),
+                    "reference": self._parse_backup_id(backup["prior"])
+                    if backup.get("prior")
+                    else None,
+                    "error": backup["error"],
+                    "stanza": stanza_name,
+                    "stop-time": backup.get("timestamp", {}).get("stop"),
+                    "stop-lsn": backup.get("lsn", {}).get("stop"),
+                    "stop-wal": backup.get("archive", {}).get("stop"),
+                },
             )
-            for backup in backups
+            for backup in repository_info["backup"]
             if show_failed or not backup["error"]
         )
 
+    def _get_backup_chain(self, backup_id: str, backups: OrderedDict[str, Dict]) -> List[str]:
+        """Returns the ids of the backups needed to restore a backup.
+
+        Args:
+            backup_id: id of the backup to restore.
+            backups: the details of the successful backups.
+
+        Returns:
+            the ids of the backups, from the full backup to the requested one,
+                or an empty list if one of them is missing or failed.
+        """
+        chain = []
+        while backup_id is not None:
+            if backup_id not in backups or backup_id in chain:
+                return []
+            chain.insert(0, backup_id)
+            backup_id = backups[backup_id]["reference"]
+        return chain
+
+    @staticmethod
+    def _parse_lsn(lsn: str) -> int:
+        """Returns the position of a PostgreSQL LSN (e.g. 0/3000028) as a number."""
+        high, low = lsn.split("/")
+        return (int(high, 16) << 32) + int(low, 16)
+
+    @staticmethod
+    def _get_wal_file_end_lsn(wal_file: str) -> int:
+        """Returns the position of the end of a WAL file (with the default size of 16MB)."""
+        return (int(wal_file[8:16], 16) << 32) + ((int(wal_file[16:24], 16) + 1) << 24)
+
+    def _parse_restore_target(self, params: Dict) -> Tuple[str, Optional[str]]:
+        """Returns the pgBackRest recovery type and target requested in the restore action.
+
+        Raises:
+            ValueError: if more than one target is requested or the target is invalid.
+        """
+        targets = {
+            restore_type: str(params[param])
+            for restore_type, param in RESTORE_TARGET_PARAMS.items()
+            if params.get(param)
+        }
+        if not targets:
+            return "immediate", None
+        if len(targets) > 1:
+            raise ValueError(
+                f"Only one of {', '.join(RESTORE_TARGET_PARAMS.values())} can be provided"
+            )
+
+        restore_type, target = targets.popitem()
+        if restore_type == "time":
+            try:
+                moment = datetime.fromisoformat(target.replace("Z", "+00:00"))
+            except ValueError:
+                raise ValueError(
+                    f"Invalid restore-to-time: {target} (format = %Y-%m-%dT%H:%M:%SZ)"
+                )
+            if moment.tzinfo is None:
+                moment = moment.replace(tzinfo=timezone.utc)
+            return restore_type, moment.astimezone(timezone.utc).isoformat(sep=" ")
+
+        pattern = r"[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}" if restore_type == "lsn" else r"[0-9]+"
+        if not re.fullmatch(pattern, target):
+            raise ValueError(f"Invalid {RESTORE_TARGET_PARAMS[restore_type]}: {target}")
+        return restore_type, target
+
+    def _is_backup_before_target(
+        self, backup: Dict, restore_type: str, restore_target: Optional[str]
+    ) -> bool:
+        """Returns whether a backup finished before the point-in-time recovery target.
+
+        The transaction IDs aren't tracked in the backups, so any backup is assumed to
+        be before a transaction ID target.
+        """
+        if restore_type == "time":
+            return (
+                backup["stop-time"] is not None
+                and backup["stop-time"] <= datetime.fromisoformat(restore_target).timestamp()
+            )
+        if restore_type == "lsn":
+            return backup["stop-lsn"] is not None and self._parse_lsn(
+                backup["stop-lsn"]
+            ) <= self._parse_lsn(restore_target)
+        return True
+
+    def _validate_archived_wal(
+        self, backup: Dict, restore_type: str, restore_target: str, repository_info: Dict
+    ) -> Optional[str]:
+        """Validate the point-in-time recovery target against the archived WAL files.
+
+        The transaction IDs aren't tracked in the archived WAL files information, so
+        a transaction ID target isn't validated.
+
+        Returns:
+            an error message if the WAL files needed to reach the target weren't archived.
+        """
+        archive = max(
+            (archive for archive in repository_info.get("archive", []) if archive.get("max")),
+            key=lambda archive: archive["max"][8:],
+            default=None,
+        )
+        archive_max = archive["max"] if archive is not None else None
+        if archive_max is None or (
+            backup["stop-wal"] is not None and backup["stop-wal"][8:] > archive_max[8:]
+        ):
+            return "The WAL files needed to restore the backup weren't archived"
+        if restore_type == "time":
+            return self._validate_restore_target_time(restore_target, repository_info, archive)
+        if restore_type == "lsn" and self._parse_lsn(restore_target) >= self._get_wal_file_end_lsn(
+            archive_max
+        ):
+            return (
+                f"Restore target LSN {restore_target} is after the last archived WAL file"
+                f" ({archive_max})"
+            )
+        return None
+
+    def _validate_restore_target_time(
+        self, restore_target: str, repository_info: Dict, archive: Dict
+    ) -> Optional[str]:
+        """Validate a point-in-time recovery target time against the archived WAL files.
+
+        The time of the WAL records isn't tracked in the repository information, so the
+        WAL files are known to reach the target when a backup stopped after it (and its
+        WAL files were archived) or when the last WAL file was archived after it.
+
+        Returns:
+            an error message if the WAL files can't be proven to reach the target.
+        """
+        moment = datetime.fromisoformat(restore_target)
+        if moment > datetime.now(timezone.utc):
+            return f"Restore target time {restore_target} is in the future"
+
+        backups = self._get_backups(show_failed=False, repository_info=repository_info)
+        if any(
+            backup["stop-time"] is not None
+            and backup["stop-time"] >= moment.timestamp()
+            and backup["stop-wal"] is not None
+            and backup["stop-wal"][8:] <= archive["max"][8:]
+            for backup in backups.values()
+        ):
+            return None
+
+        archived_at = self._get_wal_file_archive_time(
+            repository_info["name"], archive["id"], archive["max"]
+        )
+        if archived_at is None:
+            return f"Failed to check that the WAL files up to {restore_target} were archived"
+        if moment >= archived_at:
+            return (
+                f"Restore target time {restore_target} is after the last archived WAL file"
+                f" ({archive['max']}, archived at {archived_at.isoformat(sep=' ')})"
+            )
+        return None
+
+    def _get_wal_file_archive_time(
+        self, stanza: str, archive_id: str, wal_file: str
+    ) -> Optional[datetime]:
+        """Returns when a WAL file was archived (the time of its S3 object).
+
+        Returns:
+            the archive time or None if the WAL file couldn't be found in the S3 bucket.
+        """
+        s3_parameters, missing_parameters = self._retrieve_s3_parameters()
+        if missing_parameters:
+            return None
+
+        # pgBackRest adds the checksum and the compression extension to the file name.
+        prefix = os.path.join(
+            s3_parameters["path"], "archive", stanza, archive_id, wal_file[:16], wal_file
+        ).lstrip("/")
+        try:
+            session = boto3.session.Session(
+                aws_access_key_id=s3_parameters["access-key"],
+                aws_secret_access_key=s3_parameters["secret-key"],
+                region_name=s3_parameters["region"],
+            )
+            tracer.trace_boto3_session(session)
+
+            s3 = session.resource("s3", endpoint_url=self._construct_endpoint(s3_parameters))
+            objects = s3.Bucket(s3_parameters["bucket"]).objects.filter(Prefix=prefix)
+            return max((s3_object.last_modified for s3_object in objects), default=None)
+        except Exception as e:
+            logger.exception(
+                f"Failed to get the archive time of the WAL file {wal_file}", exc_info=e
+            )
+            return None
+
+    def _choose_backup_to_restore(
+        self,
+        backup_id: Optional[str],
+        restore_type: str,
+        restore_target: Optional[str],
+        repository_info: Optional[Dict],
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """Choose the backup to restore and validate the restore target against it.
+
+        Without a backup id, the latest backup (that can be restored) finished before
+        the point-in-time recovery target is chosen.
+
+        Returns:
+            the id of the backup to restore (or None) and an error message if there's
+                no valid backup to restore.
+        """
+        backups = self._get_backups(show_failed=False, repository_info=repository_info)
+        if backup_id is None:
+            backup_id = next(
+                (
+                    candidate_id
+                    for candidate_id, backup in reversed(backups.items())
+                    if self._is_backup_before_target(backup, restore_type, restore_target)
+                    and self._get_backup_chain(candidate_id, backups)
+                ),
+                None,
+            )
+            if backup_id is None:
+                return None, f"No backup to restore finished before {restore_target}"
+        elif backup_id not in backups:
+            return None, f"Invalid backup-id: {backup_id}"
+        elif not self._is_backup_before_target(backups[backup_id], restore_type, restore_target):
+            return None, f"Backup {backup_id} finished after {restore_target}"
+
+        backup_chain = self._get_backup_chain(backup_id, backups)
+        if not backup_chain:
+            return None, (
+                f"Backup {backup_id} is based on a backup that is missing or failed,"
+                " so it cannot be restored"
+            )
+        logger.info(f"Backups needed to restore backup-id {backup_id}: {', '.join(backup_chain)}")
+
+        if restore_type != "immediate":
+            error_message = self._validate_archived_wal(
+                backups[backup_id], restore_type, restore_target, repository_info
+            )
+            if error_message:
+                return None, error_message
+        return backup_id, None
+
+    def _list_backups(self, show_failed: bool) -> OrderedDict[str, str]:
+        """Retrieve the list of backups.
+
+        Args:
+            show_failed: whether to also return the failed backups.
+
+        Returns:
+            a dict of previously created backups (id + stanza name) or an empty list
+                if there is no backups in the S3 bucket.
+        """
+        return OrderedDict[str, str](
+            (backup_id, backup["stanza"])
+            for backup_id, backup in self._get_backups(show_failed).items()
+        )
+
     def _initialise_stanza(self) -> None:
         """Initialize the stanza.
 
@@ -389,6 +701,21 @@ class PostgreSQLBackups(Object):
 
         self._initialise_stanza()
 
+    def _get_backup_command(self, backup_type: str) -> List[str]:
+        """Returns the pgBackRest command that creates a backup of the requested type."""
+        command = [
+            "pgbackrest",
+            f"--stanza={self.stanza_name}",
+            "--log-level-console=debug",
+            f"--type={BACKUP_TYPE_OVERRIDES[backup_type]}",
+            "backup",
+        ]
+        if self.charm.is_primary:
+            # Force the backup to run in the primary if it's not possible to run it
+            # on the replicas (that happens when TLS is not enabled).
+            command.append("--no-backup-standby")
+        return command
+
     def _on_create_backup_action(self, event) -> None:
         """Request that pgBackRest creates a backup."""
         can_unit_perform_backup, validation_message = self._can_unit_perform_backup()
@@ -397,6 +724,16 @@ class PostgreSQLBackups(Object):
             event.fail(validation_message)
             return
 
+        backup_type = event.params.get("type", "full")
+        if backup_type not in BACKUP_TYPE_OVERRIDES:
+            error_message = (
+                f"Invalid backup type: {backup_type}."
+                f" Possible values: {', '.join(BACKUP_TYPE_OVERRIDES)}"
+            )
+            logger.error(f"Backup failed: {error_message}")
+            event.fail(error_message)
+            return
+
         # Retrieve the S3 Parameters to use when uploading the backup logs to S3.
         s3_parameters, _ = self._retrieve_s3_parameters()
 
@@ -433,32 +770,16 @@ Juju Version: {str(juju_version)}
         self.charm.update_config(is_creating_backup=True)
 
         try:
-            command = [
-                "pgbackrest",
-                f"--stanza={self.stanza_name}",
-                "--log-level-console=debug",
-                "--type=full",
-                "backup",
-            ]
-            if self.charm.is_primary:
-                # Force the backup to run in the primary if it's not possible to run it
-                # on the replicas (that happens when TLS is not enabled).
-                command.append("--no-backup-standby")
-            stdout, stderr = self._execute_command(command)
+            stdout, stderr = self._execute_command(self._get_backup_command(backup_type))
             backup_id = list(self._list_backups(show_failed=True).keys())[-1]
         except ExecError as e:
             logger.exception(e)
 
-            # Recover the backup id from the logs.
-            backup_label_stdout_line = re.findall(
-                r"(new backup label = )([0-9]{8}[-][0-9]{6}[F])$", e.stdout, re.MULTILINE
+            # Recover the backup id from the logs or generate it from the current date and time
+            # if the backup failed before generating the backup label (our backup id).
+            backup_id = self._get_backup_id_from_logs(e.stdout) or datetime.strftime(
+                datetime.now(), "%Y%m%d-%H%M%SF"
             )
-            if len(backup_label_stdout_line) > 0:
-                backup_id = backup_label_stdout_line[0][1]
-            else:
-                # Generate a backup id from the current date and time if the backup failed before
-                # generating the backup label (our backup id).
-                backup_id = datetime.strftime(datetime.now(), "%Y%m%d-%H%M%SF")
 
             # Upload the logs to S3.
             logs = f"""Stdout:
@@ -523,7 +844,10 @@ Stderr:
 
         try:
             formatted_list = self._generate_backup_list_output()
-            event.set_results({"backups": formatted_list})
+            transfer_settings = ", ".join(
+                f"{option}={value}" for option, value in self._get_transfer_settings().items()
+            )
+            event.set_results({"backups": formatted_list, "transfer-settings": transfer_settings})
         except ExecError as e:
             logger.exception(e)
             event.fail(f"Failed to list PostgreSQL backups with error: {str(e)}")
@@ -534,16 +858,24 @@ Stderr:
             return
 
         backup_id = event.params.get("backup-id")
-        logger.info(f"A restore with backup-id {backup_id} has been requested on unit")
+        restore_type, restore_target = self._parse_restore_target(event.params)
+        logger.info(
+            f"A restore with backup-id {backup_id} and target {restore_target} has been"
+            " requested on unit"
+        )
 
-        # Validate the provided backup id.
-        logger.info("Validating provided backup-id")
-        backups = self._list_backups(show_failed=False)
-        if backup_id not in backups.keys():
-            error_message = f"Invalid backup-id: {backup_id}"
+        # Validate the provided backup id (or choose the backup to restore), the backups
+        # it's based on and the restore target, before changing anything in the workload.
+        logger.info("Validating provided backup-id and restore target")
+        repository_info = self._get_repository_info()
+        backup_id, error_message = self._choose_backup_to_restore(
+            backup_id, restore_type, restore_target, repository_info
+        )
+        if error_message:
             logger.error(f"Restore failed: {error_message}")
             event.fail(error_message)
             return
+        backup = self._get_backups(show_failed=False, repository_info=repository_info)[backup_id]
 
         self.charm.unit.status = MaintenanceStatus("restoring backup")
 
@@ -597,8 +929,10 @@ Stderr:
         logger.info("Configuring Patroni to restore the backup")
         self.charm.app_peer_data.update(
             {
-                "restoring-backup": f'{datetime.strftime(datetime.strptime(backup_id, "%Y-%m-%dT%H:%M:%SZ"), "%Y%m%d-%H%M%S")}F',
-                "restore-stanza": backups[backup_id],
+                "restoring-backup": backup["label"],
+                "restore-stanza": backup["stanza"],
+                "restore-type": restore_type,
+                "restore-target": restore_target or "",
             }
         )
         self.charm.update_config()
@@ -621,8 +955,18 @@ Stderr:
             event.fail(validation_message)
             return False
 
-        if not event.params.get("backup-id"):
-            error_message = "Missing backup-id to restore"
+        try:
+            restore_type, _ = self._parse_restore_target(event.params)
+        except ValueError as e:
+            logger.error(f"Restore failed: {e}")
+            event.fail(str(e))
+            return False
+
+        if not event.params.get("backup-id") and restore_type == "immediate":
+            error_message = (
+                "Missing backup-id or restore target"
+                f" ({', '.join(RESTORE_TARGET_PARAMS.values())}) to restore"
+            )
             logger.error(f"Restore failed: {error_message}")
             event.fail(error_message)
             return False
@@ -661,6 +1005,45 @@ Stderr:
 
         return True
 
+    @property
+    def _spool_path(self) -> str:
+        """Path of the pgBackRest spool directory used by the asynchronous WAL archiving."""
+        return f"{self.charm._storage_path}/pgbackrest-spool"
+
+    def get_archive_lag(self) -> int:
+        """Returns the number of WAL files waiting to be archived in this unit."""
+        if not self.charm.app_peer_data.get("stanza") or not self.container.can_connect():
+            return 0
+        try:
+            return len(
+                self.container.list_files(
+                    f"{self.charm._storage_path}/pgdata/pg_wal/archive_status", pattern="*.ready"
+                )
+            )
+        except (PathError, APIError) as e:
+            logger.warning(f"Failed to get the WAL files waiting to be archived: {e}")
+            return 0
+
+    def _get_transfer_settings(self) -> Dict[str, str]:
+        """Returns the pgBackRest options that tune the transfer of the backups and WAL files.
+
+        The number of processes defaults to half of the CPU cores available for the workload.
+        """
+        config = self.charm.config
+        process_max = config.backup_process_max or max(
+            1, int(self.charm.get_available_cpu_cores() // 2)
+        )
+        settings = {
+            "process-max": str(process_max),
+            "compress-type": config.backup_compress_type,
+        }
+        if config.backup_compress_level is not None:
+            settings["compress-level"] = str(config.backup_compress_level)
+        if config.backup_buffer_size:
+            settings["buffer-size"] = config.backup_buffer_size
+        settings["repo1-bundle"] = "y" if config.backup_bundle else "n"
+        return settings
+
     def _render_pgbackrest_conf_file(self) -> bool:
         """Render the pgBackRest configuration file."""
         s3_parameters, missing_parameters = self._retrieve_s3_parameters()
@@ -687,7 +1070,25 @@ Stderr:
             stanza=self.stanza_name,
             storage_path=self.charm._storage_path,
             user=BACKUP_USER,
+            retention_full=self.charm.config.backup_retention_full or 9999999,
+            transfer_settings=self._get_transfer_settings(),
+            archive_async=self.charm.config.backup_archive_async,
+            spool_path=self._spool_path,
+            archive_push_queue_max=(
+                self.charm.config.backup_archive_push_queue_max
+                if self.charm.config.backup_archive_async
+                else None
+            ),
         )
+        if self.charm.config.backup_archive_async and not self.container.exists(self._spool_path):
+            self.container.make_dir(
+                self._spool_path,
+                make_parents=True,
+                permissions=0o770,
+                user=WORKLOAD_OS_USER,
+                group=WORKLOAD_OS_GROUP,
+            )
+
         # Delete the original file and render the one with the right info.
         filename = "/etc/pgbackrest.conf"
         self.container.push(
@@ -771,6 +1172,168 @@ Stderr:
         self.container.restart(self.charm.pgbackrest_server_service)
         return True
 
+    @property
+    def _backup_schedules(self) -> Dict[str, str]:
+        """The schedules of the backups, indexed by pgBackRest backup type."""
+        schedules = {
+            "full": self.charm.config.backup_schedule_full,
+            "differential": self.charm.config.backup_schedule_differential,
+            "incremental": self.charm.config.backup_schedule_incremental,
+        }
+        return {
+            BACKUP_TYPE_OVERRIDES[backup_type]: schedule
+            for backup_type, schedule in schedules.items()
+            if schedule
+        }
+
+    def generate_scheduler_service(self) -> Dict:
+        """Generate the scheduled backups service definition.
+
+        The service is started and stopped by update_backup_scheduler, as only the unit
+        designated to create the backups runs it.
+        """
+        command = [
+            "python3",
+            f"{self.charm._storage_path}/{SCHEDULER_FILE}",
+            f"--stanza={self.stanza_name}",
+            *(
+                f"--{backup_type}={schedule}"
+                for backup_type, schedule in self._backup_schedules.items()
+            ),
+        ]
+        if self.charm.config.backup_retention_days:
+            command.append(f"--retention-days={self.charm.config.backup_retention_days}")
+        command.append(f"--logs-path={self.charm._storage_path}/{SCHEDULER_LOGS_DIR}")
+        if not self._can_replicas_create_backups:
+            # Run the backups in the primary, as the replicas can't create them without TLS.
+            command.append("--no-backup-standby")
+        return {
+            "override": "replace",
+            "summary": "pgBackRest scheduled backups",
+            "command": shlex.join(command),
+            "startup": "disabled",
+            "user": WORKLOAD_OS_USER,
+            "group": WORKLOAD_OS_GROUP,
+        }
+
+    @property
+    def _can_replicas_create_backups(self) -> bool:
+        """Whether the scheduled backups can be created in a replica (TLS is enabled)."""
+        return self.charm.is_tls_enabled and self.charm.app.planned_units() > 1
+
+    def _get_backup_member(self) -> Optional[str]:
+        """Returns the name of the cluster member designated to create the scheduled backups.
+
+        It's the first running replica when the replicas can create the backups (TLS is
+        enabled), otherwise the primary, following the same rules as the create-backup action.
+        """
+        snapshot = self.charm._patroni.cluster_snapshot
+        if self._can_replicas_create_backups:
+            replicas = sorted(
+                member.name
+                for member in snapshot.members
+                if member.role != "leader" and member.state in ["running", "streaming"]
+            )
+            return next(iter(replicas), None)
+        return snapshot.primary.name if snapshot.primary else None
+
+    def update_backup_scheduler(self) -> None:
+        """Start or stop the scheduled backups service in this unit.
+
+        The service runs only in the unit designated to create the backups, while
+        there are backup schedules set and the stanza is initialised.
+        """
+        if not self.container.can_connect():
+            return
+
+        self._upload_scheduled_backup_logs()
+
+        service = self.charm.pgbackrest_scheduler_service
+        plan_service = self.container.get_plan().services.get(service)
+        if plan_service is None:
+            # The service wasn't added to the Pebble plan yet.
+            return
+        services = self.container.get_services(service)
+
+        should_run = bool(self._backup_schedules) and "stanza" in self.charm.app_peer_data
+        if should_run:
+            try:
+                member = self._get_backup_member()
+            except RetryError:
+                logger.warning("Failed to get the cluster member that creates the backups")
+                return
+            should_run = member == self.charm.unit.name.replace("/", "-")
+
+        is_running = services[service].is_running()
+        service_definition = self.generate_scheduler_service()
+        if plan_service.command != service_definition["command"]:
+            # Keep the service in sync with the settings used to choose the backup member
+            # (e.g. TLS was enabled or disabled since the layer was added).
+            logger.info("Updating the scheduled backups service")
+            self.container.add_layer(
+                self.charm._postgresql_service,
+                {"services": {service: service_definition}},
+                combine=True,
+            )
+            if is_running:
+                self.container.stop(service)
+                is_running = False
+        if should_run and not is_running:
+            # Push the scheduler script, which may have changed on a charm refresh.
+            with open(os.path.join(os.path.dirname(__file__), SCHEDULER_FILE)) as file:
+                self.container.push(
+                    f"{self.charm._storage_path}/{SCHEDULER_FILE}",
+                    file.read(),
+                    user=WORKLOAD_OS_USER,
+                    group=WORKLOAD_OS_GROUP,
+                    make_dirs=True,
+                )
+            logger.info("Starting the scheduled backups service")
+            self.container.start(service)
+        elif not should_run and is_running:
+            logger.info("Stopping the scheduled backups service")
+            self.container.stop(service)
+
+    def _upload_scheduled_backup_logs(self) -> None:
+        """Upload to S3 the logs of the backups created by the scheduled backups service.
+
+        They are uploaded to the same path as the logs of the create-backup action and
+        removed from the workload container once uploaded.
+        """
+        logs_path = f"{self.charm._storage_path}/{SCHEDULER_LOGS_DIR}"
+        if not self.container.exists(logs_path):
+            return
+
+        are_backup_settings_ok, _ = self._are_backup_settings_ok()
+        if not are_backup_settings_ok:
+            return
+
+        s3_parameters, _ = self._retrieve_s3_parameters()
+        files = self.container.list_files(logs_path, pattern="*.log")
+        for file in sorted(files, key=lambda file: file.name):
+            logs = self.container.pull(file.path).read()
+            # As in the create-backup action, generate the backup id from the backup date
+            # and time if the backup failed before generating the backup label.
+            backup_id = self._get_backup_id_from_logs(logs) or f"{file.name[: -len('.log')]}F"
+            if not self._upload_content_to_s3(
+                logs,
+                os.path.join(
+                    s3_parameters["path"],
+                    f"backup/{self.stanza_name}/{backup_id}/backup.log",
+                ),
+                s3_parameters,
+            ):
+                logger.warning(f"Failed to upload the logs of the scheduled backup {backup_id}")
+                continue
+            self.container.remove_path(file.path)
+
+    def update_backup_settings(self) -> None:
+        """Apply the backups retention and schedule settings."""
+        are_backup_settings_ok, _ = self._are_backup_settings_ok()
+        if are_backup_settings_ok and self.container.can_connect():
+            self._render_pgbackrest_conf_file()
+        self.update_backup_scheduler()
+
     def _upload_content_to_s3(
         self: str,
         content: str,
@@ -799,6 +1362,7 @@ Stderr:
                 aws_secret_access_key=s3_parameters["secret-key"],
                 region_name=s3_parameters["region"],
             )
+            tracer.trace_boto3_session(session)
 
             s3 = session.resource("s3", endpoint_url=self._construct_endpoint(s3_parameters))
             bucket = s3.Bucket(bucket_name)
@@ -3,10 +3,13 @@
 # See LICENSE file for licensing details.
 
 """Charmed Kubernetes Operator for the PostgreSQL database."""
+import hashlib
 import itertools
 import json
 import logging
-from typing import Dict, List, Optional
+import os
+import time
+from typing import Dict, List, Optional, Set
 
 from charms.data_platform_libs.v0.data_models import TypedCharmBase
 from charms.grafana_k8s.v0.grafana_dashboard import GrafanaDashboardProvider
@@ -15,15 +18,26 @@ from charms.observability_libs.v1.kubernetes_service_patch import KubernetesServ
 from charms.postgresql_k8s.v0.postgresql import (
     PostgreSQL,
     PostgreSQLEnableDisableExtensionError,
+    PostgreSQLGetParametersError,
+    PostgreSQLInvalidParameterError,
+    PostgreSQLListDatabasesError,
+    PostgreSQLListUsersError,
     PostgreSQLUpdateUserPasswordError,
 )
 from charms.postgresql_k8s.v0.postgresql_tls import PostgreSQLTLS
 from charms.prometheus_k8s.v0.prometheus_scrape import MetricsEndpointProvider
 from charms.rolling_ops.v0.rollingops import RollingOpsManager, RunWithLock
+from jinja2 import Template
 from lightkube import ApiError, Client
 from lightkube.models.core_v1 import ServicePort, ServiceSpec
 from lightkube.models.meta_v1 import ObjectMeta
-from lightkube.resources.core_v1 import Endpoints, Node, Pod, Service
+from lightkube.resources.core_v1 import (
+    Endpoints,
+    Node,
+    PersistentVolumeClaim,
+    Pod,
+    Service,
+)
 from ops import JujuVersion
 from ops.charm import (
     ActionEvent,
@@ -32,6 +46,7 @@ from ops.charm import (
     RelationDepartedEvent,
     WorkloadEvent,
 )
+from ops.framework import StoredState
 from ops.main import main
 from ops.model import (
     ActiveStatus,
@@ -47,15 +62,18 @@ from ops.pebble import ChangeError, Layer, PathError, ProtocolError, ServiceStat
 from requests import ConnectionError
 from tenacity import RetryError, Retrying, stop_after_attempt, wait_fixed
 
-from backups import PostgreSQLBackups
+from backups import ARCHIVE_LAG_THRESHOLD, PostgreSQLBackups
 from config import CharmConfig
 from constants import (
     APP_SCOPE,
     BACKUP_USER,
+    DATABASE_PORT,
     METRICS_PORT,
     MONITORING_PASSWORD_KEY,
     MONITORING_USER,
     PEER,
+    PGBOUNCER_PORT,
+    PGBOUNCER_USERLIST_KEY,
     POSTGRES_LOG_FILES,
     REPLICATION_PASSWORD_KEY,
     REPLICATION_USER,
@@ -75,11 +93,12 @@ from constants import (
     WORKLOAD_OS_GROUP,
     WORKLOAD_OS_USER,
 )
-from patroni import NotReadyError, Patroni
+from patroni import DCS_ONLY_PARAMETERS, NotReadyError, Patroni
 from relations.db import EXTENSIONS_BLOCKING_MESSAGE, DbProvides
 from relations.postgresql_provider import PostgreSQLProvider
+from tracing import tracer
 from upgrade import PostgreSQLUpgrade, get_postgresql_k8s_dependencies_model
-from utils import any_memory_to_bytes, new_password
+from utils import any_cpu_to_cores, any_memory_to_bytes, new_password
 
 logger = logging.getLogger(__name__)
 
@@ -87,20 +106,82 @@ logger = logging.getLogger(__name__)
 logging.getLogger("httpcore").setLevel(logging.ERROR)
 logging.getLogger("httpx").setLevel(logging.ERROR)
 
+INVALID_PARAMETERS_BLOCKING_MESSAGE = "invalid parameters in the config"
+
+# Pod label selected by the replicas service when the lag-aware read routing is enabled.
+READ_ELIGIBLE_LABEL = "read-eligible"
+
+# Minimum interval (in seconds) between the checks of the data volume size in update-status.
+STORAGE_SIZE_CHECK_INTERVAL = 3600
+
+# File (in the unit state directory, which is kept on refresh) keeping the profiles of
+# the last hooks.
+HOOK_PROFILES_FILE = ".hook-profiles.json"
+# Methods of the Kubernetes and Pebble clients whose calls are traced.
+K8S_CLIENT_METHODS = ["apply", "create", "delete", "get", "list", "patch", "replace"]
+PEBBLE_CLIENT_METHODS = [
+    "add_layer",
+    "exec",
+    "get_checks",
+    "get_plan",
+    "get_services",
+    "get_system_info",
+    "list_files",
+    "make_dir",
+    "pull",
+    "push",
+    "remove_path",
+    "replan_services",
+    "restart_services",
+    "send_signal",
+    "start_services",
+    "stop_services",
+    "wait_change",
+]
+
 
 class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
     """Charmed Operator for the PostgreSQL database."""
 
     config_type = CharmConfig
+    _stored = StoredState()
 
     def __init__(self, *args):
         super().__init__(*args)
+        # Bookkeeping of what was applied in this unit, which is kept in the local unit
+        # state, as updating the peer relation data would trigger a relation changed event
+        # in all the other units.
+        self._stored.set_default(
+            client_relations_options_hash=None,
+            patroni_config_hash=None,
+            postgresql_parameters=None,
+            services_options_hash=None,
+            pgbouncer_config_hash=None,
+            resources_budget={},
+            storage_size_checked_at=0.0,
+            user_parameters="{}",
+        )
 
         self.secrets = {APP_SCOPE: {}, UNIT_SCOPE: {}}
+        # Objects used to interact with Patroni and PostgreSQL, which are shared during the
+        # hook execution (until the data used to build them changes).
+        self._cached_patroni = None
+        self._cached_postgresql = None
+        # Kubernetes client and pod of this unit, also shared during the hook execution.
+        self._cached_k8s_client = None
+        self._cached_pod = None
+        # Calls to the external services made during the hook and number of Patroni/PostgreSQL
+        # objects built and secrets read (emitted after the hook, even when it fails).
+        tracer.reset()
+        self._hook_counters = tracer.counters
+        for container in self.unit.containers.values():
+            tracer.trace_methods(container.pebble, "pebble", PEBBLE_CLIENT_METHODS)
 
         self._postgresql_service = "postgresql"
         self.pgbackrest_server_service = "pgbackrest server"
+        self.pgbackrest_scheduler_service = "pgbackrest scheduler"
         self._metrics_service = "metrics_server"
+        self._pgbouncer_service = "pgbouncer"
         self._unit = self.model.unit.name
         self._name = self.model.app.name
         self._namespace = self.model.name
@@ -120,6 +201,7 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         self.framework.observe(self.on.set_password_action, self._on_set_password)
         self.framework.observe(self.on.get_primary_action, self._on_get_primary)
         self.framework.observe(self.on.update_status, self._on_update_status)
+        self.framework.observe(self.framework.on.commit, self._on_commit)
         self._storage_path = self.meta.storages["pgdata"].location
 
         self.upgrade = PostgreSQLUpgrade(
@@ -248,6 +330,8 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         if scope not in [APP_SCOPE, UNIT_SCOPE]:
             raise RuntimeError("Unknown secret scope.")
 
+        self._hook_counters["secret reads"] += 1
+
         if scope == UNIT_SCOPE:
             result = self.unit_peer_data.get(key, None)
         else:
@@ -316,6 +400,9 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         if scope not in [APP_SCOPE, UNIT_SCOPE]:
             raise RuntimeError("Unknown secret scope.")
 
+        # The passwords used to build the Patroni and PostgreSQL objects may change.
+        self._reset_cached_objects()
+
         if not value:
             return self.remove_secret(scope, key)
 
@@ -362,6 +449,8 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         if scope not in [APP_SCOPE, UNIT_SCOPE]:
             raise RuntimeError("Unknown secret scope.")
 
+        self._reset_cached_objects()
+
         juju_version = JujuVersion.from_environ()
         if juju_version.has_secrets:
             return self._juju_secret_remove(scope, key)
@@ -378,19 +467,36 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
     @property
     def postgresql(self) -> PostgreSQL:
         """Returns an instance of the object used to interact with the database."""
-        return PostgreSQL(
-            primary_host=self.primary_endpoint,
-            current_host=self.endpoint,
-            user=USER,
-            password=self.get_secret(APP_SCOPE, f"{USER}-password"),
-            database="postgres",
-            system_users=SYSTEM_USERS,
-        )
+        if self._cached_postgresql is None:
+            self._hook_counters["PostgreSQL objects"] += 1
+            self._cached_postgresql = PostgreSQL(
+                primary_host=self.primary_endpoint,
+                current_host=self.endpoint,
+                user=USER,
+                password=self.get_secret(APP_SCOPE, f"{USER}-password"),
+                database="postgres",
+                system_users=SYSTEM_USERS,
+                cache_connections=True,
+            )
+            tracer.trace_methods(self._cached_postgresql, "postgresql", ["_create_connection"])
+        return self._cached_postgresql
+
+    def _reset_cached_objects(self) -> None:
+        """Discard the Patroni and PostgreSQL objects, so they are built again when needed."""
+        self._cached_patroni = None
+        if self._cached_postgresql is not None:
+            self._cached_postgresql.close_all()
+        self._cached_postgresql = None
+
+    def _on_commit(self, _) -> None:
+        """Close the database connections at the end of the hook."""
+        if self._cached_postgresql is not None:
+            self._cached_postgresql.close_all()
 
     @property
     def endpoint(self) -> str:
         """Returns the endpoint of this instance's pod."""
-        return f'{self._unit.replace("/", "-")}.{self._build_service_name("endpoints")}'
+        return self.get_member_endpoint(self._unit.replace("/", "-"))
 
     @property
     def primary_endpoint(self) -> str:
@@ -492,6 +598,7 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
             return
 
         self.postgresql_client_relation.update_read_only_endpoint()
+        self._update_read_eligible_labels()
 
         self.backup.check_stanza()
 
@@ -507,6 +614,8 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         else:
             self.unit_peer_data.pop("start-tls-server", None)
 
+        self.backup.update_backup_scheduler()
+
         if not self.is_blocked:
             self.unit.status = ActiveStatus()
 
@@ -522,27 +631,69 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
 
         # update config on every run
         self.update_config()
+        self._refresh_storage_size(force=True)
+
+        # Enable or disable the PgBouncer service and apply the backups settings.
+        if self.unit.get_container("postgresql").can_connect():
+            self._update_pebble_layers()
+            self.backup.update_backup_settings()
 
         if not self.unit.is_leader():
             return
 
+        # Enable or disable the lag-aware routing of the read-only traffic and the PgBouncer
+        # port in the services (only when the options that affect them change).
+        self._update_read_eligible_labels()
+        options_hash = self._get_options_hash(["pgbouncer_enabled", "read_only_lag_aware_routing"])
+        if options_hash != self._stored.services_options_hash:
+            try:
+                self._create_services()
+                self._stored.services_options_hash = options_hash
+            except ApiError:
+                logger.exception("failed to update k8s services")
+
         # Enable and/or disable the extensions.
         self.enable_disable_extensions()
 
-        # Unblock the charm after extensions are enabled (only if it's blocked due to application
-        # charms requesting extensions).
-        if self.unit.status.message != EXTENSIONS_BLOCKING_MESSAGE:
-            return
+        # Share or stop sharing the PgBouncer endpoints with the client applications and
+        # unblock the charm after extensions are enabled (only if it's blocked due to
+        # application charms requesting extensions). The relations are only visited
+        # when the options that affect them change.
+        options_hash = self._get_options_hash([*self.config.plugin_keys(), "pgbouncer_enabled"])
+        if (
+            options_hash != self._stored.client_relations_options_hash
+            or self.unit.status.message == EXTENSIONS_BLOCKING_MESSAGE
+        ) and self.reconcile_client_relations():
+            self._stored.client_relations_options_hash = options_hash
+
+    def _get_options_hash(self, options: List[str]) -> str:
+        """Returns the hash of the values of the given config options."""
+        values = {option: self.config[option] for option in options}
+        return hashlib.sha256(json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def reconcile_client_relations(self) -> bool:
+        """Bring all the client relations to the desired state.
+
+        The users and databases are fetched once for all the relations, so only the missing
+        ones are created and only the changed fields are written to the databags.
 
-        for relation in [
-            *self.model.relations.get("db", []),
-            *self.model.relations.get("db-admin", []),
+        Returns:
+            whether the relations were reconciled.
+        """
+        try:
+            users = self.postgresql.list_users()
+            databases = self.postgresql.list_databases()
+        except (PostgreSQLListDatabasesError, PostgreSQLListUsersError):
+            logger.warning("Failed to reconcile the client relations")
+            return False
+
+        for relation_handler in [
+            self.postgresql_client_relation,
+            self.legacy_db_relation,
+            self.legacy_db_admin_relation,
         ]:
-            if not self.legacy_db_relation.set_up_relation(relation):
-                logger.debug(
-                    "Early exit on_config_changed: legacy relation requested extensions that are still disabled"
-                )
-                return
+            relation_handler.reconcile_relations(users, databases)
+        return True
 
     def enable_disable_extensions(self, database: str = None) -> None:
         """Enable/disable PostgreSQL extensions set through config options.
@@ -551,20 +702,16 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
             database: optional database where to enable/disable the extension.
         """
         original_status = self.unit.status
-        for plugin in self.config.plugin_keys():
-            enable = self.config[plugin]
-            # Enable or disable the plugin/extension.
-            extension = "_".join(plugin.split("_")[1:-1])
-            self.unit.status = WaitingStatus(
-                f"{'Enabling' if enable else 'Disabling'} {extension}"
-            )
-            try:
-                self.postgresql.enable_disable_extension(extension, enable, database)
-            except PostgreSQLEnableDisableExtensionError as e:
-                logger.exception(
-                    f"failed to {'enable' if enable else 'disable'} {extension} plugin: %s", str(e)
-                )
-            self.unit.status = original_status
+        extensions = {
+            "_".join(plugin.split("_")[1:-1]): self.config[plugin]
+            for plugin in self.config.plugin_keys()
+        }
+        self.unit.status = WaitingStatus("Updating extensions")
+        try:
+            self.postgresql.enable_disable_extensions(extensions, database)
+        except PostgreSQLEnableDisableExtensionError as e:
+            logger.exception("failed to enable/disable extensions: %s", str(e))
+        self.unit.status = original_status
 
     def _add_members(self, event) -> None:
         """Add new cluster members.
@@ -741,6 +888,9 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         # Update the archive command and replication configurations.
         self.update_config()
 
+        # Label the pod (which may have been recreated) to receive the read-only traffic.
+        self._update_read_eligible_labels()
+
         # Enable/disable PostgreSQL extensions if they were set before the cluster
         # was fully initialised.
         self.enable_disable_extensions()
@@ -824,7 +974,7 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
             ApiError when there is any problem communicating
                 to K8s API
         """
-        client = Client()
+        client = self._k8s_client
         patch = {
             "metadata": {"labels": {"application": "patroni", "cluster-name": self.cluster_name}}
         }
@@ -837,7 +987,7 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
 
     def _create_services(self) -> None:
         """Create kubernetes services for primary and replicas endpoints."""
-        client = Client()
+        client = self._k8s_client
 
         pod0 = client.get(
             res=Pod,
@@ -846,9 +996,21 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         )
 
         services = {
-            "primary": "master",
-            "replicas": "replica",
+            "primary": {"role": "master"},
+            "replicas": {"role": "replica"},
         }
+        ports = [
+            ServicePort(name="api", port=8008, targetPort=8008),
+            ServicePort(name="database", port=5432, targetPort=5432),
+        ]
+        if self.config.pgbouncer_enabled:
+            ports.append(
+                ServicePort(
+                    name="pgbouncer", port=int(PGBOUNCER_PORT), targetPort=int(PGBOUNCER_PORT)
+                )
+            )
+        if self.config.read_only_lag_aware_routing:
+            services["replicas"][READ_ELIGIBLE_LABEL] = "true"
         for service_name_suffix, role_selector in services.items():
             service = Service(
                 metadata=ObjectMeta(
@@ -860,22 +1022,11 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
                     },
                 ),
                 spec=ServiceSpec(
-                    ports=[
-                        ServicePort(
-                            name="api",
-                            port=8008,
-                            targetPort=8008,
-                        ),
-                        ServicePort(
-                            name="database",
-                            port=5432,
-                            targetPort=5432,
-                        ),
-                    ],
+                    ports=ports,
                     selector={
                         "app.kubernetes.io/name": self.app.name,
                         "cluster-name": f"patroni-{self.app.name}",
-                        "role": role_selector,
+                        **role_selector,
                     },
                 ),
             )
@@ -887,13 +1038,96 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
                 field_manager=self.model.app.name,
             )
 
+    def get_read_only_members(self) -> Optional[Set[str]]:
+        """Returns the names of the members that can receive read-only traffic.
+
+        Those are the running replicas, restricted to the ones whose lag is within
+        the threshold when the lag-aware routing is enabled (falling back to all
+        the running replicas if all of them are lagging).
+
+        Returns:
+            the members' pod names or None if the cluster members couldn't be retrieved.
+        """
+        try:
+            members = {member.name: member for member in self._patroni.cluster_snapshot.members}
+        except RetryError:
+            logger.warning("Failed to get the cluster members that can receive read-only traffic")
+            return None
+
+        running_replicas = {
+            name
+            for name, member in members.items()
+            if member.role in ["replica", "sync_standby"]
+            and member.state in ["running", "streaming"]
+        }
+        if not self.config.read_only_lag_aware_routing:
+            return running_replicas
+
+        eligible_replicas = {
+            name
+            for name in running_replicas
+            if members[name].lag is not None and members[name].lag <= self.config.read_only_max_lag
+        }
+        if running_replicas and not eligible_replicas:
+            logger.warning("No replica within the read-only max lag: routing to all the replicas")
+            return running_replicas
+        return eligible_replicas
+
+    def get_member_endpoint(self, member: str) -> str:
+        """Returns the endpoint of a cluster member's pod.
+
+        Args:
+            member: the Patroni member name, e.g. "postgresql-k8s-0".
+        """
+        return f'{member}.{self._build_service_name("endpoints")}'
+
+    def _update_read_eligible_labels(self) -> None:
+        """Label the pods of the members whose lag allows them to receive read-only traffic.
+
+        The primary is also labelled as eligible, as the replicas service already excludes
+        it by its role, so it keeps serving read-only traffic right after being demoted.
+        The leader labels all the pods, while the other units label their own pod (which
+        may have been recreated without the label). Only the pods whose label value
+        changes are patched.
+        """
+        if not self.config.read_only_lag_aware_routing:
+            return
+
+        eligible_members = self.get_read_only_members()
+        if eligible_members is None:
+            return
+        primary = self._patroni.cluster_snapshot.primary
+        if primary is not None:
+            eligible_members.add(primary.name)
+
+        try:
+            if self.unit.is_leader():
+                pods = self._k8s_client.list(
+                    Pod, namespace=self._namespace, labels={"cluster-name": self.cluster_name}
+                )
+            else:
+                pods = [self._pod]
+            for pod in pods:
+                label = "true" if pod.metadata.name in eligible_members else "false"
+                if (pod.metadata.labels or {}).get(READ_ELIGIBLE_LABEL) == label:
+                    continue
+                self._k8s_client.patch(
+                    Pod,
+                    name=pod.metadata.name,
+                    namespace=self._namespace,
+                    obj={"metadata": {"labels": {READ_ELIGIBLE_LABEL: label}}},
+                )
+                logger.debug(f"Pod {pod.metadata.name} {READ_ELIGIBLE_LABEL} label set to {label}")
+        except ApiError:
+            logger.exception("failed to update the read-eligible labels")
+
     def _cleanup_old_cluster_resources(self) -> None:
         """Delete kubernetes services and endpoints from previous deployment."""
         if self.is_cluster_initialised:
             logger.debug("Early exit _cleanup_old_cluster_resources: cluster already initialised")
             return
 
-        client = Client()
+        client = self._k8s_client
         for kind, suffix in itertools.product([Service, Endpoints], ["", "-config", "-sync"]):
             try:
                 client.delete(
@@ -1084,8 +1318,15 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
                 logger.debug("on_update_status early exit: Patroni has not started yet")
                 return
 
-            # Remove the restoring backup flag and the restore stanza name.
-            self.app_peer_data.update({"restoring-backup": "", "restore-stanza": ""})
+            # Remove the restoring backup flag, the restore stanza name and target.
+            self.app_peer_data.update(
+                {
+                    "restoring-backup": "",
+                    "restore-stanza": "",
+                    "restore-type": "",
+                    "restore-target": "",
+                }
+            )
             self.update_config()
             logger.info("Restore succeeded")
 
@@ -1097,6 +1338,15 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         if self._handle_processes_failures():
             return
 
+        self._refresh_storage_size()
+
+        # Keep the read-only endpoints and the pods labels in sync with the replicas' roles and lag.
+        self.postgresql_client_relation.update_read_only_endpoint()
+        self._update_read_eligible_labels()
+
+        # Keep the scheduled backups running in the unit designated to create them.
+        self.backup.update_backup_scheduler()
+
         self._set_primary_status_message()
 
     def _handle_processes_failures(self) -> bool:
@@ -1125,27 +1375,36 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         """Display 'Primary' in the unit status message if the current unit is the primary."""
         try:
             if self._patroni.get_primary(unit_name_pattern=True) == self.unit.name:
-                self.unit.status = ActiveStatus("Primary")
+                archive_lag = self.backup.get_archive_lag()
+                if archive_lag >= ARCHIVE_LAG_THRESHOLD:
+                    self.unit.status = ActiveStatus(
+                        f"Primary (WAL archiving lagging: {archive_lag} files pending)"
+                    )
+                else:
+                    self.unit.status = ActiveStatus("Primary")
             elif self._patroni.member_started:
                 self.unit.status = ActiveStatus()
         except (RetryError, ConnectionError) as e:
             logger.error(f"failed to get primary with error {e}")
 
     @property
-    def _patroni(self):
+    def _patroni(self) -> Patroni:
         """Returns an instance of the Patroni object."""
-        return Patroni(
-            self,
-            self._endpoint,
-            self._endpoints,
-            self.primary_endpoint,
-            self._namespace,
-            self._storage_path,
-            self.get_secret(APP_SCOPE, USER_PASSWORD_KEY),
-            self.get_secret(APP_SCOPE, REPLICATION_PASSWORD_KEY),
-            self.get_secret(APP_SCOPE, REWIND_PASSWORD_KEY),
-            bool(self.unit_peer_data.get("tls")),
-        )
+        if self._cached_patroni is None:
+            self._hook_counters["Patroni objects"] += 1
+            self._cached_patroni = Patroni(
+                self,
+                self._endpoint,
+                self._endpoints,
+                self.primary_endpoint,
+                self._namespace,
+                self._storage_path,
+                self.get_secret(APP_SCOPE, USER_PASSWORD_KEY),
+                self.get_secret(APP_SCOPE, REPLICATION_PASSWORD_KEY),
+                self.get_secret(APP_SCOPE, REWIND_PASSWORD_KEY),
+                bool(self.unit_peer_data.get("tls")),
+            )
+        return self._cached_patroni
 
     @property
     def is_primary(self) -> bool:
@@ -1210,6 +1469,67 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
             for endpoint in endpoints_to_remove:
                 endpoints.remove(endpoint)
         self._peers.data[self.app]["endpoints"] = json.dumps(endpoints)
+        self._reset_cached_objects()
+
+    def _generate_pgbouncer_service(self) -> Dict:
+        """Generate the PgBouncer service definition."""
+        return {
+            "override": "replace",
+            "summary": "pgbouncer connection pooler",
+            "command": f"pgbouncer {self._storage_path}/pgbouncer.ini",
+            "startup": "enabled" if self.config.pgbouncer_enabled else "disabled",
+            "after": [self._postgresql_service],
+            "user": WORKLOAD_OS_USER,
+            "group": WORKLOAD_OS_GROUP,
+        }
+
+    def _update_pgbouncer_config(self) -> None:
+        """Render the PgBouncer configuration files and reload PgBouncer when they change."""
+        container = self.unit.get_container("postgresql")
+        if not container.can_connect():
+            return
+
+        services = container.get_services(self._pgbouncer_service)
+        is_running = (
+            self._pgbouncer_service in services and services[self._pgbouncer_service].is_running()
+        )
+        if not self.config.pgbouncer_enabled:
+            if is_running:
+                container.stop(self._pgbouncer_service)
+            return
+
+        with open("templates/pgbouncer.ini.j2", "r") as file:
+            template = Template(file.read())
+        rendered = template.render(
+            database_port=DATABASE_PORT,
+            default_pool_size=self.config.pgbouncer_default_pool_size,
+            enable_tls=self.is_tls_enabled,
+            pool_mode=self.config.pgbouncer_pool_mode,
+            port=PGBOUNCER_PORT,
+            storage_path=self._storage_path,
+        )
+        # The user list is shared by the leader with the credentials of the relation users.
+        userlist = self.get_secret(APP_SCOPE, PGBOUNCER_USERLIST_KEY) or ""
+
+        config_hash = hashlib.sha256(f"{rendered}{userlist}".encode("utf-8")).hexdigest()
+        if self._stored.pgbouncer_config_hash == config_hash:
+            return
+        for filename, content in [
+            ("pgbouncer.ini", rendered),
+            ("pgbouncer-userlist.txt", userlist),
+        ]:
+            container.push(
+                f"{self._storage_path}/{filename}",
+                content,
+                make_dirs=True,
+                permissions=0o600,
+                user=WORKLOAD_OS_USER,
+                group=WORKLOAD_OS_GROUP,
+            )
+        if is_running:
+            # PgBouncer reloads its configuration and user list on SIGHUP.
+            container.send_signal("SIGHUP", self._pgbouncer_service)
+        self._stored.pgbouncer_config_hash = config_hash
 
     def _generate_metrics_service(self) -> Dict:
         """Generate the metrics service definition."""
@@ -1266,7 +1586,9 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
                     "user": WORKLOAD_OS_USER,
                     "group": WORKLOAD_OS_GROUP,
                 },
+                self.pgbackrest_scheduler_service: self.backup.generate_scheduler_service(),
                 self._metrics_service: self._generate_metrics_service(),
+                self._pgbouncer_service: self._generate_pgbouncer_service(),
             },
             "checks": {
                 self._postgresql_service: {
@@ -1379,27 +1701,41 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         else:
             limit_memory = None
         postgresql_parameters = self.postgresql.build_postgresql_parameters(
-            self.config.profile, self.get_available_memory(), limit_memory
+            self.config.profile,
+            self.get_available_memory(),
+            limit_memory,
+            available_cpu_cores=self.get_available_cpu_cores(),
+            storage_size=self.get_storage_size(),
+            workload_type=self.config.workload_type,
         )
+        postgresql_parameters.update(self._get_user_parameters())
+        self._limit_parallel_workers(postgresql_parameters)
+
+        self._update_pgbouncer_config()
 
         logger.info("Updating Patroni config file")
         # Update and reload configuration based on TLS files availability.
-        self._patroni.render_patroni_yml_file(
+        patroni_config_hash = self._patroni.render_patroni_yml_file(
             connectivity=self.unit_peer_data.get("connectivity", "on") == "on",
             is_creating_backup=is_creating_backup,
             enable_tls=self.is_tls_enabled,
             is_no_sync_member=self.upgrade.is_no_sync_member,
             backup_id=self.app_peer_data.get("restoring-backup"),
+            restore_type=self.app_peer_data.get("restore-type") or "immediate",
+            restore_target=self.app_peer_data.get("restore-target"),
             stanza=self.app_peer_data.get("stanza"),
             restore_stanza=self.app_peer_data.get("restore-stanza"),
             parameters=postgresql_parameters,
+            synchronous_mode=self.config.synchronous_mode,
+            synchronous_commit=self.config.synchronous_commit,
+            archive_async=self.config.backup_archive_async,
         )
         if not self._is_workload_running:
             # If Patroni/PostgreSQL has not started yet and TLS relations was initialised,
             # then mark TLS as enabled. This commonly happens when the charm is deployed
             # in a bundle together with the TLS certificates operator. This flag is used to
             # know when to call the Patroni API using HTTP or HTTPS.
-            self.unit_peer_data.update({"tls": "enabled" if self.is_tls_enabled else ""})
+            self._update_tls_flag()
             logger.debug("Early exit update_config: Workload not started yet")
             return True
 
@@ -1407,11 +1743,39 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
             logger.debug("Early exit update_config: Patroni not started yet")
             return False
 
+        # Patroni ignores some parameters in its configuration file, so they're set
+        # by the leader (for the whole cluster) in the dynamic configuration.
+        dcs_parameters = {
+            name: value
+            for name, value in postgresql_parameters.items()
+            if name in DCS_ONLY_PARAMETERS
+        }
+        local_parameters = {
+            name: value
+            for name, value in postgresql_parameters.items()
+            if name not in DCS_ONLY_PARAMETERS
+        }
+        if self.unit.is_leader():
+            self._update_synchronous_settings()
+            self._update_dcs_parameters(dcs_parameters)
+
         restart_postgresql = (
             self.is_tls_enabled != self.postgresql.is_tls_enabled()
         ) or self.postgresql.is_restart_pending()
-        self._patroni.reload_patroni_configuration()
-        self.unit_peer_data.update({"tls": "enabled" if self.is_tls_enabled else ""})
+        # Reload Patroni only when its configuration changed since the last reload.
+        if self._stored.patroni_config_hash != patroni_config_hash:
+            self._patroni.reload_patroni_configuration()
+            self._stored.patroni_config_hash = patroni_config_hash
+        else:
+            logger.debug("Patroni configuration unchanged, skipping reload")
+        applied_parameters = {
+            **local_parameters,
+            **self._get_cluster_dcs_parameters(dcs_parameters),
+        }
+        if self._parameters_require_restart(applied_parameters):
+            restart_postgresql = True
+        self._stored.postgresql_parameters = json.dumps(applied_parameters)
+        self._update_tls_flag()
 
         # Restart PostgreSQL if TLS configuration has changed
         # (so the both old and new connections use the configuration).
@@ -1438,10 +1802,156 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
 
         return True
 
+    def _update_synchronous_settings(self) -> None:
+        """Apply the synchronous replication settings through the Patroni dynamic configuration.
+
+        The settings are only sent to Patroni when they change.
+        """
+        settings = self._patroni.get_synchronous_settings(
+            self.config.synchronous_mode, self.config.synchronous_commit
+        )
+        settings_json = json.dumps(settings, sort_keys=True)
+        if self.app_peer_data.get("synchronous-settings") == settings_json:
+            return
+
+        try:
+            self._patroni.update_dynamic_configuration(settings)
+        except RetryError:
+            logger.warning("Failed to update the synchronous replication settings")
+            return
+        logger.info(
+            f"Synchronous replication mode set to {self.config.synchronous_mode}"
+            f" (synchronous commit: {self.config.synchronous_commit})"
+        )
+        self.app_peer_data["synchronous-settings"] = settings_json
+
+    def _update_dcs_parameters(self, parameters: Dict[str, str]) -> None:
+        """Apply the parameters that Patroni only takes from its dynamic configuration.
+
+        The parameters are only sent to Patroni when they change, and the ones that
+        aren't set anymore are removed from the dynamic configuration.
+        """
+        parameters_json = json.dumps(parameters, sort_keys=True)
+        if self.app_peer_data.get("dcs-parameters") == parameters_json:
+            return
+
+        previous_parameters = json.loads(self.app_peer_data.get("dcs-parameters", "{}"))
+        changes = {name: None for name in previous_parameters if name not in parameters}
+        changes.update(parameters)
+        if changes:
+            try:
+                self._patroni.update_dynamic_configuration({"postgresql": {"parameters": changes}})
+            except RetryError:
+                logger.warning("Failed to update the parameters in the dynamic configuration")
+                return
+            logger.info(f"Parameters set in the dynamic configuration: {sorted(changes)}")
+        self.app_peer_data["dcs-parameters"] = parameters_json
+
+    def _get_cluster_dcs_parameters(self, parameters: Dict[str, str]) -> Dict[str, str]:
+        """Return the parameters set by the leader in the Patroni dynamic configuration.
+
+        Until the leader sets them, the parameters built in this unit are assumed.
+        """
+        if "dcs-parameters" not in self.app_peer_data:
+            return parameters
+        return json.loads(self.app_peer_data["dcs-parameters"])
+
+    def _limit_parallel_workers(self, parameters: Dict[str, str]) -> None:
+        """Keep the parallel workers within the max_worker_processes of the cluster.
+
+        max_worker_processes is the same in all the members (the leader sets it from its
+        CPU budget), so a member with more CPU cores than the leader can't use more workers.
+        """
+        if self.unit.is_leader():
+            # The leader sets max_worker_processes from its own parameters.
+            return
+        max_worker_processes = self._get_cluster_dcs_parameters(parameters).get(
+            "max_worker_processes"
+        )
+        if max_worker_processes is None:
+            return
+
+        # The other parallel workers settings are already limited by max_parallel_workers.
+        max_parallel_workers = parameters.get("max_parallel_workers")
+        if max_parallel_workers is not None and int(max_parallel_workers) > int(
+            max_worker_processes
+        ):
+            logger.warning(
+                f"Limiting max_parallel_workers ({max_parallel_workers}) to the"
+                f" max_worker_processes of the cluster ({max_worker_processes})"
+            )
+            parameters["max_parallel_workers"] = max_worker_processes
+
+    def _get_user_parameters(self) -> Dict[str, str]:
+        """Return the PostgreSQL parameters set through the config that passed validation.
+
+        The parameters are validated against the database when they change, so the last
+        valid parameters are kept while the database is unreachable or the new ones are invalid.
+        """
+        parameters = self.config.parameters or {}
+        validated_parameters = json.loads(self._stored.user_parameters)
+        if parameters == validated_parameters:
+            return validated_parameters
+
+        if parameters:
+            try:
+                self.postgresql.validate_parameters(parameters)
+            except PostgreSQLInvalidParameterError as e:
+                logger.error(f"Invalid parameters in the config: {e.message}")
+                self.unit.status = BlockedStatus(INVALID_PARAMETERS_BLOCKING_MESSAGE)
+                return validated_parameters
+            except PostgreSQLGetParametersError:
+                logger.warning("Cannot validate the parameters in the config yet")
+                return validated_parameters
+
+        self._stored.user_parameters = json.dumps(parameters)
+        if self.unit.status.message == INVALID_PARAMETERS_BLOCKING_MESSAGE:
+            self.unit.status = ActiveStatus()
+        return parameters
+
+    def _parameters_require_restart(self, parameters: Dict[str, str]) -> bool:
+        """Return whether the changes to the PostgreSQL parameters need a restart to apply."""
+        if self._stored.postgresql_parameters is None:
+            # Nothing to compare with, so rely on PostgreSQL reporting a pending restart.
+            return False
+
+        previous_parameters = json.loads(self._stored.postgresql_parameters)
+        changed_parameters = [
+            name
+            for name in {*previous_parameters, *parameters}
+            if previous_parameters.get(name) != parameters.get(name)
+        ]
+        if not changed_parameters:
+            return False
+
+        try:
+            contexts = self.postgresql.get_parameters_context(changed_parameters)
+        except PostgreSQLGetParametersError:
+            return False
+        restart_parameters = sorted(
+            name for name, context in contexts.items() if context == "postmaster"
+        )
+        if restart_parameters:
+            logger.info(f"Parameters changes that need a restart: {restart_parameters}")
+            return True
+        logger.info(f"Parameters changes applied through a reload: {sorted(changed_parameters)}")
+        return False
+
+    def _update_tls_flag(self) -> None:
+        """Store whether TLS is enabled in the unit data."""
+        tls = "enabled" if self.is_tls_enabled else ""
+        if self.unit_peer_data.get("tls", "") != tls:
+            self.unit_peer_data.update({"tls": tls})
+            # The Patroni object uses this flag to choose between HTTP and HTTPS.
+            self._cached_patroni = None
+
     def _update_pebble_layers(self) -> None:
         """Update the pebble layers to keep the health check URL up-to-date."""
         container = self.unit.get_container("postgresql")
 
+        # Render the PgBouncer configuration before the service is started.
+        self._update_pgbouncer_config()
+
         # Get the current layer.
         current_layer = container.get_plan()
 
@@ -1471,13 +1981,26 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         """
         return unit_name.replace("/", "-")
 
+    @property
+    def _k8s_client(self) -> Client:
+        """Returns the Kubernetes client shared during the hook execution."""
+        if self._cached_k8s_client is None:
+            self._cached_k8s_client = Client()
+            tracer.trace_methods(self._cached_k8s_client, "kubernetes", K8S_CLIENT_METHODS)
+        return self._cached_k8s_client
+
+    @property
+    def _pod(self) -> Pod:
+        """Returns the Kubernetes pod of this unit, fetched once during the hook execution."""
+        if self._cached_pod is None:
+            self._cached_pod = self._k8s_client.get(
+                Pod, name=self._unit_name_to_pod_name(self.unit.name), namespace=self._namespace
+            )
+        return self._cached_pod
+
     def _get_node_name_for_pod(self) -> str:
         """Return the node name for a given pod."""
-        client = Client()
-        pod = client.get(
-            Pod, name=self._unit_name_to_pod_name(self.unit.name), namespace=self._namespace
-        )
-        return pod.spec.nodeName
+        return self._pod.spec.nodeName
 
     def get_resources_limits(self, container_name: str) -> Dict:
         """Return resources limits for a given container.
@@ -1485,40 +2008,138 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         Args:
             container_name: name of the container to get resources limits for
         """
-        client = Client()
-        pod = client.get(
-            Pod, self._unit_name_to_pod_name(self.unit.name), namespace=self._namespace
-        )
-
-        for container in pod.spec.containers:
+        for container in self._pod.spec.containers:
             if container.name == container_name:
                 return container.resources.limits or {}
         return {}
 
-    def get_node_allocable_memory(self) -> int:
-        """Return the allocable memory in bytes for a given node.
+    def get_resources_requests(self, container_name: str) -> Dict:
+        """Return resources requests for a given container.
 
         Args:
-            node_name: name of the node to get the allocable memory for
+            container_name: name of the container to get resources requests for
         """
-        client = Client()
-        node = client.get(Node, name=self._get_node_name_for_pod(), namespace=self._namespace)
-        return any_memory_to_bytes(node.status.allocatable["memory"])
+        for container in self._pod.spec.containers:
+            if container.name == container_name:
+                return container.resources.requests or {}
+        return {}
 
-    def get_available_memory(self) -> int:
-        """Get available memory for the container in bytes."""
-        allocable_memory = self.get_node_allocable_memory()
+    def _get_resources_budget(self) -> Dict:
+        """Return the memory (in bytes) and CPU cores available for the workload container.
+
+        The values are stored in the local unit state together with the pod UID, so the node
+        is only queried again when the pod is recreated (e.g. after a resources change).
+        """
+        pod_uid = self._pod.metadata.uid
+        budget = dict(self._stored.resources_budget)
+        if pod_uid is not None and budget.get("pod-uid") == pod_uid:
+            return budget
+
+        node = self._k8s_client.get(
+            Node, name=self._get_node_name_for_pod(), namespace=self._namespace
+        )
+        memory = any_memory_to_bytes(node.status.allocatable["memory"])
+        cpu = any_cpu_to_cores(node.status.allocatable["cpu"])
         container_limits = self.get_resources_limits(container_name="postgresql")
         if "memory" in container_limits:
-            memory_str = container_limits["memory"]
-            constrained_memory = any_memory_to_bytes(memory_str)
-            if constrained_memory < allocable_memory:
-                logger.debug(f"Memory constrained to {memory_str} from resource limit")
-                return constrained_memory
+            memory = min(memory, any_memory_to_bytes(container_limits["memory"]))
+        if "cpu" in container_limits:
+            cpu = min(cpu, any_cpu_to_cores(container_limits["cpu"]))
+        else:
+            # Without a limit, the container is only guaranteed the requested CPU.
+            container_requests = self.get_resources_requests(container_name="postgresql")
+            if "cpu" in container_requests:
+                cpu = min(cpu, any_cpu_to_cores(container_requests["cpu"]))
+
+        budget = {
+            "pod-uid": pod_uid,
+            "memory": memory,
+            "cpu": cpu,
+            "storage": self._get_storage_size(),
+        }
+        self._stored.resources_budget = budget
+        return budget
+
+    def _refresh_storage_size(self, force: bool = False) -> None:
+        """Read the size of the data volume again and re-tune the parameters when it changes.
+
+        The volume claim can be expanded without recreating the pod, so the size cached
+        together with the pod UID in the resources budget needs to be checked periodically
+        (at most once every STORAGE_SIZE_CHECK_INTERVAL seconds, unless forced).
+
+        Args:
+            force: whether to check the size even if it was checked recently.
+        """
+        now = time.time()
+        if not force and now - self._stored.storage_size_checked_at < STORAGE_SIZE_CHECK_INTERVAL:
+            return
+
+        try:
+            budget = self._get_resources_budget()
+            storage_size = self._get_storage_size()
+        except ApiError as e:
+            logger.warning(f"Failed to get the data volume size: {e}")
+            return
+
+        self._stored.storage_size_checked_at = now
+        if storage_size == budget.get("storage"):
+            return
+
+        logger.info(f"Data volume size changed from {budget.get('storage')} to {storage_size}")
+        self._stored.resources_budget = {**budget, "storage": storage_size}
+        self.update_config()
+
+    def _get_storage_size(self) -> Optional[int]:
+        """Return the size in bytes of the volume claimed for the data storage, if bound."""
+        volume_name = None
+        for container in self._pod.spec.containers:
+            if container.name == "postgresql":
+                for volume_mount in container.volumeMounts or []:
+                    if volume_mount.mountPath == self._storage_path:
+                        volume_name = volume_mount.name
+        for volume in self._pod.spec.volumes or []:
+            if volume.name == volume_name and volume.persistentVolumeClaim:
+                claim = self._k8s_client.get(
+                    PersistentVolumeClaim,
+                    name=volume.persistentVolumeClaim.claimName,
+                    namespace=self._namespace,
+                )
+                if claim.status.capacity and "storage" in claim.status.capacity:
+                    return any_memory_to_bytes(claim.status.capacity["storage"])
+        return None
+
+    def get_available_memory(self) -> int:
+        """Get available memory for the container in bytes."""
+        return self._get_resources_budget()["memory"]
+
+    def get_available_cpu_cores(self) -> float:
+        """Get the number of CPU cores available for the container."""
+        return self._get_resources_budget()["cpu"]
+
+    def get_storage_size(self) -> Optional[int]:
+        """Get the size of the data storage in bytes."""
+        return self._get_resources_budget().get("storage")
+
+
+def _emit_hook_profile() -> None:
+    """Log the hook execution profile and save it in the unit state directory.
 
-        logger.debug("Memory constrained by node allocable memory")
-        return allocable_memory
+    It's called once the hook finishes, including when it fails (and the framework doesn't
+    emit the commit event).
+    """
+    hook = os.environ.get("JUJU_DISPATCH_PATH", "unknown")
+    logger.info(f"Hook {hook} profile: {tracer.summary(tracer.counters)}")
+    charm_dir = os.environ.get("JUJU_CHARM_DIR")
+    if not charm_dir:
+        return
+    state_dir = os.path.join(os.path.dirname(os.path.abspath(charm_dir)), "state")
+    tracer.save_profile(
+        os.path.join(state_dir, HOOK_PROFILES_FILE), hook, counters=tracer.counters
+    )
 
 
 if __name__ == "__main__":
-    main(PostgresqlOperatorCharm, use_juju_for_storage=True)
+    try:
+        main(PostgresqlOperatorCharm, use_juju_for_storage=True)
+    finally:
+        _emit_hook_profile()
@@ -3,18 +3,58 @@
 # See LICENSE file for licensing details.
 
 """Structured configuration for the PostgreSQL charm."""
+import json
 import logging
-from typing import Optional
+import re
+from typing import Dict, Optional
 
 from charms.data_platform_libs.v0.data_models import BaseConfigModel
-from pydantic import validator
+from pydantic import root_validator, validator
+
+from backup_scheduler import CronSchedule
 
 logger = logging.getLogger(__name__)
 
+# PostgreSQL parameters set by the charm, which can't be changed through the config.
+CHARM_MANAGED_PARAMETERS = {
+    "archive_command",
+    "archive_mode",
+    "data_directory",
+    "hba_file",
+    "ident_file",
+    "listen_addresses",
+    "port",
+    "ssl",
+    "ssl_ca_file",
+    "ssl_cert_file",
+    "ssl_key_file",
+    "synchronous_commit",
+    "synchronous_standby_names",
+    "wal_level",
+}
+# Compression levels accepted by pgBackRest for each compression type.
+BACKUP_COMPRESS_LEVEL_RANGES = {"bz2": (1, 9), "gz": (0, 9), "lz4": (-5, 12), "zst": (-7, 22)}
+
 
 class CharmConfig(BaseConfigModel):
     """Manager for the structured configuration."""
 
+    backup_archive_async: bool
+    backup_archive_push_queue_max: Optional[str]
+    backup_buffer_size: Optional[str]
+    backup_bundle: bool
+    backup_compress_level: Optional[int]
+    backup_compress_type: str
+    backup_process_max: int
+    backup_retention_days: int
+    backup_retention_full: int
+    backup_schedule_differential: str
+    backup_schedule_full: str
+    backup_schedule_incremental: str
+    parameters: Optional[Dict[str, str]]
+    pgbouncer_default_pool_size: int
+    pgbouncer_enabled: bool
+    pgbouncer_pool_mode: str
     profile: str
     profile_limit_memory: Optional[int]
     plugin_citext_enable: bool
@@ -23,6 +63,12 @@ class CharmConfig(BaseConfigModel):
     plugin_pg_trgm_enable: bool
     plugin_plpython3u_enable: bool
     plugin_unaccent_enable: bool
+    read_only_endpoints_mode: str
+    read_only_lag_aware_routing: bool
+    read_only_max_lag: int
+    synchronous_commit: str
+    synchronous_mode: str
+    workload_type: str
 
     @classmethod
     def keys(cls) -> list[str]:
@@ -34,6 +80,126 @@ class CharmConfig(BaseConfigModel):
         """Return plugin config names in a iterable."""
         return filter(lambda x: x.startswith("plugin_"), cls.keys())
 
+    @validator("backup_archive_push_queue_max", "backup_buffer_size")
+    @classmethod
+    def backup_size_values(cls, value: str) -> Optional[str]:
+        """Check backup size config options are sizes, e.g. `1MiB`."""
+        if not re.fullmatch(r"[0-9]+([KMG]i?B)?", value, re.IGNORECASE):
+            raise ValueError("Value must be a size, e.g. '1MiB'")
+
+        return value
+
+    @root_validator(skip_on_failure=True)
+    @classmethod
+    def backup_compress_level_values(cls, values: Dict) -> Dict:
+        """Check backup compress level config option is allowed for the backup compress type."""
+        value = values.get("backup_compress_level")
+        compress_type = values.get("backup_compress_type")
+        if value is None or compress_type not in BACKUP_COMPRESS_LEVEL_RANGES:
+            return values
+
+        minimum, maximum = BACKUP_COMPRESS_LEVEL_RANGES[compress_type]
+        if not minimum <= value <= maximum:
+            raise ValueError(
+                f"backup-compress-level must be between {minimum} and {maximum}"
+                f" for the '{compress_type}' compression type"
+            )
+
+        return values
+
+    @validator("backup_compress_type")
+    @classmethod
+    def backup_compress_type_values(cls, value: str) -> Optional[str]:
+        """Check backup compress type config option is one of `none`, `bz2`, `gz`, `lz4` or `zst`."""
+        if value not in ["none", "bz2", "gz", "lz4", "zst"]:
+            raise ValueError("Value not one of 'none', 'bz2', 'gz', 'lz4' or 'zst'")
+
+        return value
+
+    @validator("backup_process_max")
+    @classmethod
+    def backup_process_max_values(cls, value: int) -> Optional[int]:
+        """Check backup process max config option is between 0 and 999."""
+        if not 0 <= value <= 999:
+            raise ValueError("Value must be between 0 and 999")
+
+        return value
+
+    @validator("backup_retention_days")
+    @classmethod
+    def backup_retention_days_values(cls, value: int) -> Optional[int]:
+        """Check backup retention days config option is not a negative number."""
+        if value < 0:
+            raise ValueError("Value must not be negative")
+
+        return value
+
+    @validator("backup_retention_full")
+    @classmethod
+    def backup_retention_full_values(cls, value: int) -> Optional[int]:
+        """Check backup retention full config option is between 0 and 9999999."""
+        if not 0 <= value <= 9999999:
+            raise ValueError("Value must be between 0 and 9999999")
+
+        return value
+
+    @validator(
+        "backup_schedule_differential", "backup_schedule_full", "backup_schedule_incremental"
+    )
+    @classmethod
+    def backup_schedule_values(cls, value: str) -> Optional[str]:
+        """Check backup schedule config options are valid cron-like schedules."""
+        if value:
+            CronSchedule(value)
+
+        return value
+
+    @validator("parameters", pre=True)
+    @classmethod
+    def parameters_values(cls, value) -> Optional[Dict[str, str]]:
+        """Check parameters config option is a map of PostgreSQL parameters and values."""
+        if not value:
+            return None
+        try:
+            parameters = json.loads(value) if isinstance(value, str) else value
+        except json.JSONDecodeError:
+            raise ValueError("Value is not valid JSON")
+        if not isinstance(parameters, dict):
+            raise ValueError("Value is not a JSON object")
+
+        validated_parameters = {}
+        for name, parameter_value in parameters.items():
+            name = name.lower()
+            if not re.fullmatch(r"[a-z_][a-z0-9_]*(\.[a-z_][a-z0-9_]*)?", name):
+                raise ValueError(f"Invalid parameter name '{name}'")
+            if name in CHARM_MANAGED_PARAMETERS:
+                raise ValueError(f"Parameter '{name}' is managed by the charm")
+            if isinstance(parameter_value, bool):
+                parameter_value = "on" if parameter_value else "off"
+            elif not isinstance(parameter_value, (str, int, float)):
+                raise ValueError(f"Invalid value for parameter '{name}'")
+            validated_parameters[name] = str(parameter_value)
+
+        return validated_parameters
+
+    @validator("pgbouncer_default_pool_size")
+    @classmethod
+    def pgbouncer_default_pool_size_values(cls, value: int) -> Optional[int]:
+        """Check PgBouncer default pool size config option is a positive number."""
+        if value < 1:
+            raise ValueError("Value must be greater than zero")
+
+        return value
+
+    @validator("pgbouncer_pool_mode")
+    @classmethod
+    def pgbouncer_pool_mode_values(cls, value: str) -> Optional[str]:
+        """Check PgBouncer pool mode config option is one of `session`, `transaction` or `statement`."""
+        if value not in ["session", "transaction", "statement"]:
+            raise ValueError("Value not one of 'session', 'transaction' or 'statement'")
+
+        return value
+
     @validator("profile")
     @classmethod
     def profile_values(cls, value: str) -> Optional[str]:
@@ -53,3 +219,48 @@ class CharmConfig(BaseConfigModel):
             raise ValueError("`profile-limit-memory` limited to 7 digits (9999999MB)")
 
         return value
+
+    @validator("read_only_endpoints_mode")
+    @classmethod
+    def read_only_endpoints_mode_values(cls, value: str) -> Optional[str]:
+        """Check read-only endpoints mode config option is one of `service` or `host-list`."""
+        if value not in ["service", "host-list"]:
+            raise ValueError("Value not one of 'service' or 'host-list'")
+
+        return value
+
+    @validator("read_only_max_lag")
+    @classmethod
+    def read_only_max_lag_values(cls, value: int) -> Optional[int]:
+        """Check read-only max lag config option is not a negative number."""
+        if value < 0:
+            raise ValueError("Value must not be negative")
+
+        return value
+
+    @validator("synchronous_commit")
+    @classmethod
+    def synchronous_commit_values(cls, value: str) -> Optional[str]:
+        """Check synchronous commit config option is one of `on`, `remote_write` or `remote_apply`."""
+        if value not in ["on", "remote_write", "remote_apply"]:
+            raise ValueError("Value not one of 'on', 'remote_write' or 'remote_apply'")
+
+        return value
+
+    @validator("synchronous_mode")
+    @classmethod
+    def synchronous_mode_values(cls, value: str) -> Optional[str]:
+        """Check synchronous mode config option is one of `async` or `sync`."""
+        if value not in ["async", "sync"]:
+            raise ValueError("Value not one of 'async' or 'sync'")
+
+        return value
+
+    @validator("workload_type")
+    @classmethod
+    def workload_type_values(cls, value: str) -> Optional[str]:
+        """Check workload type config option is one of `oltp`, `olap` or `mixed`."""
+        if value not in ["oltp", "olap", "mixed"]:
+            raise ValueError("Value not one of 'oltp', 'olap' or 'mixed'")
+
+        return value
@@ -4,6 +4,8 @@
 """File containing constants to be used in the charm."""
 
 DATABASE_PORT = "5432"
+PGBOUNCER_PORT = "6432"
+PGBOUNCER_USERLIST_KEY = "pgbouncer-userlist"
 PEER = "database-peers"
 BACKUP_USER = "backup"
 REPLICATION_USER = "replication"
@@ -4,14 +4,19 @@
 
 """Helper class used to manage interactions with Patroni API and configuration files."""
 
+import hashlib
 import logging
 import os
 import pwd
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
 import requests
 import yaml
 from jinja2 import Template
+from requests.adapters import HTTPAdapter
 from tenacity import (
     AttemptManager,
     RetryError,
@@ -24,9 +29,51 @@ from tenacity import (
 )
 
 from constants import REWIND_USER, TLS_CA_FILE
+from tracing import tracer
 
 logger = logging.getLogger(__name__)
 
+# Timeouts (in seconds) used when connecting to and reading from the Patroni REST API.
+API_CONNECT_TIMEOUT = 3
+API_READ_TIMEOUT = 10
+API_REQUEST_TIMEOUT = (API_CONNECT_TIMEOUT, API_READ_TIMEOUT)
+# Minimum number of per-host connection pools kept by the REST API session.
+API_POOL_CONNECTIONS = 10
+
+# Patroni synchronous_mode setting for each synchronous replication mode of the charm.
+SYNCHRONOUS_MODES = {"async": False, "sync": True}
+
+# PostgreSQL parameters that Patroni only takes from the dynamic configuration (stored in the
+# DCS), as they must be the same in all the members, ignoring them in the local configuration.
+DCS_ONLY_PARAMETERS = {
+    "hot_standby",
+    "max_connections",
+    "max_locks_per_transaction",
+    "max_prepared_transactions",
+    "max_replication_slots",
+    "max_wal_senders",
+    "max_worker_processes",
+    "track_commit_timestamp",
+    "wal_keep_segments",
+    "wal_keep_size",
+    "wal_level",
+    "wal_log_hints",
+}
+
+# Records the retries of the requests to the Patroni REST API.
+_record_retry = tracer.retry_callback("patroni")
+
+MEMBER_HEALTHY = "healthy"
+MEMBER_LAGGING = "lagging"
+MEMBER_UNREACHABLE = "unreachable"
+
+
+@lru_cache(maxsize=None)
+def _load_template(path: str) -> Template:
+    """Read and compile a template file only once during the hook execution."""
+    with open(path, "r") as file:
+        return Template(file.read())
+
 
 class NotReadyError(Exception):
     """Raised when not all cluster members healthy or finished initial sync."""
@@ -40,9 +87,96 @@ class SwitchoverFailedError(Exception):
     """Raised when a switchover failed for some reason."""
 
 
+@dataclass
+class MemberHealth:
+    """Replication health of a cluster member."""
+
+    status: str
+    lag: Optional[int] = None
+
+    def __str__(self) -> str:
+        """Human readable representation of the health status."""
+        if self.lag is None:
+            return self.status
+        return f"{self.status} (lag: {self.lag} bytes)"
+
+
+def format_members_health(members: Dict[str, MemberHealth]) -> str:
+    """Returns a one-line description of the replication health of some members."""
+    return ", ".join(f"{member} {health}" for member, health in members.items())
+
+
+@dataclass
+class ClusterMember:
+    """Cluster member as reported by the Patroni REST API."""
+
+    name: str
+    role: str
+    state: str
+    lag: Optional[int] = None
+    timeline: Optional[int] = None
+    tags: Dict = field(default_factory=dict)
+
+    @classmethod
+    def from_json(cls, member: Dict) -> "ClusterMember":
+        """Build a member from its entry in the cluster endpoint response."""
+        lag = member.get("lag")
+        return cls(
+            name=member["name"],
+            role=member.get("role", ""),
+            state=member.get("state", ""),
+            # The lag is reported as "unknown" when it can't be computed.
+            lag=lag if isinstance(lag, int) else None,
+            timeline=member.get("timeline"),
+            tags=member.get("tags", {}),
+        )
+
+    @property
+    def unit_name(self) -> str:
+        """Member name in the unit name pattern."""
+        # Change the last dash to / in order to match unit name pattern.
+        return "/".join(self.name.rsplit("-", 1))
+
+
+@dataclass
+class ClusterSnapshot:
+    """Cluster topology retrieved from the Patroni REST API at a given moment."""
+
+    members: List[ClusterMember]
+
+    @classmethod
+    def from_json(cls, cluster: Dict) -> "ClusterSnapshot":
+        """Build a snapshot from the cluster endpoint response."""
+        return cls(members=[ClusterMember.from_json(member) for member in cluster["members"]])
+
+    @property
+    def primary(self) -> Optional[ClusterMember]:
+        """The cluster primary (leader) member."""
+        return next((member for member in self.members if member.role == "leader"), None)
+
+    @property
+    def sync_standbys(self) -> List[ClusterMember]:
+        """The cluster synchronous standby members."""
+        return [member for member in self.members if member.role == "sync_standby"]
+
+    def get_member(self, name: str) -> Optional[ClusterMember]:
+        """Return the member with the given (pod) name."""
+        return next((member for member in self.members if member.name == name), None)
+
+
 class Patroni:
     """This class handles the communication with Patroni API and configuration files."""
 
+    # HTTP session shared by all the instances of this class during the hook execution,
+    # so the connections (and the TLS sessions) to the cluster members are kept alive
+    # and reused between the different requests to the REST API.
+    _session: Optional[requests.Session] = None
+    # Cluster topology shared by all the instances of this class during the hook execution,
+    # so every decision taken in a hook is based on the same view of the cluster.
+    _cluster_snapshot: Optional[ClusterSnapshot] = None
+    # PostgreSQL version from the Rock image, which doesn't change during the hook execution.
+    _rock_postgresql_version: Optional[str] = None
+
     def __init__(
         self,
         charm,
@@ -72,6 +206,22 @@ class Patroni:
         # TLS is enabled, otherwise True is set because it's the default value.
         self._verify = f"{self._storage_path}/{TLS_CA_FILE}" if tls_enabled else True
 
+    @property
+    def _http(self) -> requests.Session:
+        """HTTP session used to send requests to the Patroni REST API."""
+        if Patroni._session is None:
+            # Keep one connection pool for each cluster member (and the primary service),
+            # which are used when falling back to alternative members.
+            adapter = HTTPAdapter(
+                pool_connections=max(API_POOL_CONNECTIONS, len(self._endpoints) + 1)
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            tracer.trace_methods(session, "patroni", ["request"])
+            Patroni._session = session
+        return Patroni._session
+
     @property
     def _patroni_url(self) -> str:
         """Patroni REST API URL."""
@@ -80,12 +230,14 @@ class Patroni:
     @property
     def rock_postgresql_version(self) -> Optional[str]:
         """Version of Postgresql installed in the Rock image."""
-        container = self._charm.unit.get_container("postgresql")
-        if not container.can_connect():
-            logger.debug("Cannot get Postgresql version from Rock. Container inaccessible")
-            return
-        snap_meta = container.pull("/meta.charmed-postgresql/snap.yaml")
-        return yaml.safe_load(snap_meta)["version"]
+        if Patroni._rock_postgresql_version is None:
+            container = self._charm.unit.get_container("postgresql")
+            if not container.can_connect():
+                logger.debug("Cannot get Postgresql version from Rock. Container inaccessible")
+                return
+            snap_meta = container.pull("/meta.charmed-postgresql/snap.yaml")
+            Patroni._rock_postgresql_version = yaml.safe_load(snap_meta)["version"]
+        return Patroni._rock_postgresql_version
 
     def _get_alternative_patroni_url(self, attempt: AttemptManager) -> str:
         """Get an alternative REST API URL from another member each time.
@@ -101,6 +253,35 @@ class Patroni:
             url = self._patroni_url
         return url
 
+    @property
+    def cluster_snapshot(self) -> ClusterSnapshot:
+        """Snapshot of the cluster topology shared by all the queries in the current hook.
+
+        The snapshot is retrieved from the cluster endpoint (trying the other members
+        if the current one doesn't answer) only once, until it's invalidated.
+
+        Raises:
+            RetryError if no cluster member answered the request.
+        """
+        if Patroni._cluster_snapshot is None:
+            # Request info from cluster endpoint (which returns all members of the cluster).
+            for attempt in Retrying(
+                stop=stop_after_attempt(len(self._endpoints) + 1), before_sleep=_record_retry
+            ):
+                with attempt:
+                    url = self._get_alternative_patroni_url(attempt)
+                    r = self._http.get(
+                        f"{url}/cluster", verify=self._verify, timeout=API_REQUEST_TIMEOUT
+                    )
+                    snapshot = ClusterSnapshot.from_json(r.json())
+            Patroni._cluster_snapshot = snapshot
+        return Patroni._cluster_snapshot
+
+    @staticmethod
+    def invalidate_cluster_snapshot() -> None:
+        """Discard the cluster snapshot, so the next query retrieves it again."""
+        Patroni._cluster_snapshot = None
+
     def get_primary(self, unit_name_pattern=False) -> str:
         """Get primary instance.
 
@@ -110,99 +291,145 @@ class Patroni:
         Returns:
             primary pod or unit name.
         """
-        primary = None
-        # Request info from cluster endpoint (which returns all members of the cluster).
-        for attempt in Retrying(stop=stop_after_attempt(len(self._endpoints) + 1)):
-            with attempt:
-                url = self._get_alternative_patroni_url(attempt)
-                r = requests.get(f"{url}/cluster", verify=self._verify)
-                for member in r.json()["members"]:
-                    if member["role"] == "leader":
-                        primary = member["name"]
-                        if unit_name_pattern:
-                            # Change the last dash to / in order to match unit name pattern.
-                            primary = "/".join(primary.rsplit("-", 1))
-                        break
-        return primary
+        primary = self.cluster_snapshot.primary
+        if primary is None:
+            return None
+        return primary.unit_name if unit_name_pattern else primary.name
 
     def get_sync_standby_names(self) -> List[str]:
         """Get the list of sync standby unit names."""
-        sync_standbys = []
-        # Request info from cluster endpoint (which returns all members of the cluster).
-        for attempt in Retrying(stop=stop_after_attempt(len(self._endpoints) + 1)):
-            with attempt:
-                url = self._get_alternative_patroni_url(attempt)
-                r = requests.get(f"{url}/cluster", verify=self._verify)
-                for member in r.json()["members"]:
-                    if member["role"] == "sync_standby":
-                        sync_standbys.append("/".join(member["name"].rsplit("-", 1)))
-        return sync_standbys
+        return [member.unit_name for member in self.cluster_snapshot.sync_standbys]
 
     @property
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
     def cluster_members(self) -> set:
         """Get the current cluster members."""
-        # Request info from cluster endpoint (which returns all members of the cluster).
-        r = requests.get(f"{self._patroni_url}/cluster", verify=self._verify)
-        return {member["name"] for member in r.json()["members"]}
+        return {member.name for member in self.cluster_snapshot.members}
 
     def are_all_members_ready(self) -> bool:
         """Check if all members are correctly running Patroni and PostgreSQL.
 
+        The member states come from the cluster snapshot of the hook, so they aren't
+        polled again until the snapshot is invalidated.
+
         Returns:
-            True if all members are ready False otherwise. Retries over a period of 10 seconds
-            3 times to allow server time to start up.
+            True if all members are ready False otherwise. Only the retrieval of the snapshot
+            is retried (over a period of 10 seconds) when no member answers the request.
         """
-        # Request info from cluster endpoint
-        # (which returns all members of the cluster and their states).
         try:
-            for attempt in Retrying(stop=stop_after_delay(10), wait=wait_fixed(3)):
+            for attempt in Retrying(
+                stop=stop_after_delay(10), wait=wait_fixed(3), before_sleep=_record_retry
+            ):
                 with attempt:
-                    r = requests.get(f"{self._patroni_url}/cluster", verify=self._verify)
+                    snapshot = self.cluster_snapshot
         except RetryError:
             return False
 
-        return all(member["state"] == "running" for member in r.json()["members"])
+        return all(member.state == "running" for member in snapshot.members)
 
     @property
     def is_creating_backup(self) -> bool:
-        """Returns whether a backup is being created."""
-        # Request info from cluster endpoint (which returns the list of tags from each
-        # cluster member; the "is_creating_backup" tag means that the member is creating
-        # a backup).
+        """Returns whether a backup is being created.
+
+        The member tags come from the cluster snapshot of the hook. Only the retrieval of the
+        snapshot is retried (over a period of 10 seconds) when no member answers the request.
+        """
+        # The "is_creating_backup" tag means that the member is creating a backup.
         try:
-            for attempt in Retrying(stop=stop_after_delay(10), wait=wait_fixed(3)):
+            for attempt in Retrying(
+                stop=stop_after_delay(10), wait=wait_fixed(3), before_sleep=_record_retry
+            ):
                 with attempt:
-                    r = requests.get(f"{self._patroni_url}/cluster", verify=self._verify)
+                    snapshot = self.cluster_snapshot
         except RetryError:
             return False
 
-        return any(
-            "tags" in member and member["tags"].get("is_creating_backup")
-            for member in r.json()["members"]
-        )
+        return any(member.tags.get("is_creating_backup") for member in snapshot.members)
+
+    def get_replication_health(self) -> Dict[str, MemberHealth]:
+        """Probe the replication health of all the cluster members in parallel.
+
+        The primary is checked through the leader endpoint and the replicas through the
+        replica endpoint (which fails when their lag is bigger than 16kB).
+
+        Returns:
+            a dict mapping each member name to its replication health.
+
+        Raises:
+            RetryError if the cluster topology couldn't be retrieved.
+        """
+        snapshot = self.cluster_snapshot
+        primary = snapshot.primary
+
+        def probe(member_endpoint: str) -> Tuple[str, MemberHealth]:
+            member_name = member_endpoint.split(".")[0]
+            member = snapshot.get_member(member_name)
+            lag = member.lag if member is not None else None
+            endpoint = (
+                "leader"
+                if primary is not None and member_name == primary.name
+                else "replica?lag=16kB"
+            )
+            url = self._patroni_url.replace(self._endpoint, member_endpoint)
+            try:
+                member_status = self._http.get(
+                    f"{url}/{endpoint}", verify=self._verify, timeout=API_REQUEST_TIMEOUT
+                )
+            except requests.RequestException:
+                return member_name, MemberHealth(MEMBER_UNREACHABLE, lag)
+            if member_status.status_code != 200:
+                return member_name, MemberHealth(MEMBER_LAGGING, lag)
+            return member_name, MemberHealth(MEMBER_HEALTHY, lag)
+
+        with ThreadPoolExecutor(max_workers=max(len(self._endpoints), 1)) as executor:
+            return dict(executor.map(probe, self._endpoints))
+
+    def get_unhealthy_members(self) -> Dict[str, MemberHealth]:
+        """Return the members whose replication isn't healthy.
+
+        The replication health is probed again (over a period of 60 seconds) until
+        all the members are healthy.
+
+        Returns:
+            a dict mapping each unhealthy member name to its replication health
+            (empty when the replication is healthy).
+
+        Raises:
+            RetryError if the cluster topology couldn't be retrieved.
+        """
+        unhealthy_members = {}
+        try:
+            for attempt in Retrying(
+                stop=stop_after_delay(60), wait=wait_fixed(3), before_sleep=_record_retry
+            ):
+                with attempt:
+                    # Retrieve the cluster topology again on the next attempts, as the
+                    # primary may have changed since the previous one.
+                    if attempt.retry_state.attempt_number > 1:
+                        self.invalidate_cluster_snapshot()
+                    unhealthy_members = {
+                        member: health
+                        for member, health in self.get_replication_health().items()
+                        if health.status != MEMBER_HEALTHY
+                    }
+                    if unhealthy_members:
+                        raise NotReadyError
+        except RetryError:
+            if not unhealthy_members:
+                raise
+        return unhealthy_members
 
     @property
     def is_replication_healthy(self) -> bool:
         """Return whether the replication is healthy."""
         try:
-            for attempt in Retrying(stop=stop_after_delay(60), wait=wait_fixed(3)):
-                with attempt:
-                    primary = self.get_primary()
-                    unit_id = primary.split("-")[-1]
-                    primary_endpoint = (
-                        f"{self._charm.app.name}-{unit_id}.{self._charm.app.name}-endpoints"
-                    )
-                    for member_endpoint in self._endpoints:
-                        endpoint = (
-                            "leader" if member_endpoint == primary_endpoint else "replica?lag=16kB"
-                        )
-                        url = self._patroni_url.replace(self._endpoint, member_endpoint)
-                        member_status = requests.get(f"{url}/{endpoint}", verify=self._verify)
-                        if member_status.status_code != 200:
-                            raise Exception
+            unhealthy_members = self.get_unhealthy_members()
         except RetryError:
-            logger.exception("replication is not healthy")
+            logger.error("replication is not healthy: failed to retrieve the cluster topology")
+            return False
+        if unhealthy_members:
+            logger.error(
+                "replication is not healthy: %s", format_members_health(unhealthy_members)
+            )
             return False
 
         logger.debug("replication is healthy")
@@ -216,11 +443,14 @@ class Patroni:
             Return whether the primary endpoint is redirecting connections to the primary pod.
         """
         try:
-            for attempt in Retrying(stop=stop_after_delay(10), wait=wait_fixed(3)):
+            for attempt in Retrying(
+                stop=stop_after_delay(10), wait=wait_fixed(3), before_sleep=_record_retry
+            ):
                 with attempt:
-                    r = requests.get(
+                    r = self._http.get(
                         f"{'https' if self._tls_enabled else 'http'}://{self._primary_endpoint}:8008/health",
                         verify=self._verify,
+                        timeout=API_REQUEST_TIMEOUT,
                     )
                     if r.json()["state"] != "running":
                         raise EndpointNotReadyError
@@ -233,21 +463,18 @@ class Patroni:
     def member_replication_lag(self) -> str:
         """Member replication lag."""
         try:
-            for attempt in Retrying(stop=stop_after_delay(60), wait=wait_fixed(3)):
+            for attempt in Retrying(
+                stop=stop_after_delay(60), wait=wait_fixed(3), before_sleep=_record_retry
+            ):
                 with attempt:
-                    cluster_status = requests.get(
-                        f"{self._patroni_url}/cluster",
-                        verify=self._verify,
-                        timeout=5,
-                    )
+                    snapshot = self.cluster_snapshot
         except RetryError:
             return "unknown"
 
-        for member in cluster_status.json()["members"]:
-            if member["name"] == self._charm.unit.name.replace("/", "-"):
-                return member.get("lag", "unknown")
-
-        return "unknown"
+        member = snapshot.get_member(self._charm.unit.name.replace("/", "-"))
+        if member is None or member.lag is None:
+            return "unknown"
+        return str(member.lag)
 
     @property
     def member_started(self) -> bool:
@@ -258,9 +485,15 @@ class Patroni:
             allow server time to start up.
         """
         try:
-            for attempt in Retrying(stop=stop_after_delay(60), wait=wait_fixed(3)):
+            for attempt in Retrying(
+                stop=stop_after_delay(60), wait=wait_fixed(3), before_sleep=_record_retry
+            ):
                 with attempt:
-                    r = requests.get(f"{self._patroni_url}/health", verify=self._verify)
+                    r = self._http.get(
+                        f"{self._patroni_url}/health",
+                        verify=self._verify,
+                        timeout=API_REQUEST_TIMEOUT,
+                    )
         except RetryError:
             return False
 
@@ -279,10 +512,17 @@ class Patroni:
         # Check whether the PostgreSQL process has a state equal to T (frozen).
         return any(process for process in postgresql_processes if process.split()[7] != "T")
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=2, max=10),
+        before_sleep=_record_retry,
+    )
     def reinitialize_postgresql(self) -> None:
         """Reinitialize PostgreSQL."""
-        requests.post(f"{self._patroni_url}/reinitialize", verify=self._verify)
+        self.invalidate_cluster_snapshot()
+        self._http.post(
+            f"{self._patroni_url}/reinitialize", verify=self._verify, timeout=API_REQUEST_TIMEOUT
+        )
 
     def _render_file(self, path: str, content: str, mode: int) -> None:
         """Write a content rendered from a template to a file.
@@ -306,6 +546,19 @@ class Patroni:
             # Ignore non existing user error when it wasn't created yet.
             pass
 
+    @staticmethod
+    def _get_content_hash(content: str) -> str:
+        """Return the hash of a configuration content."""
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _get_file_hash(self, path: str) -> Optional[str]:
+        """Return the hash of the current content of a file (if it exists)."""
+        try:
+            with open(path, "r") as file:
+                return self._get_content_hash(file.read())
+        except OSError:
+            return None
+
     def render_patroni_yml_file(
         self,
         connectivity: bool = False,
@@ -315,10 +568,17 @@ class Patroni:
         stanza: str = None,
         restore_stanza: Optional[str] = None,
         backup_id: Optional[str] = None,
+        restore_type: str = "immediate",
+        restore_target: Optional[str] = None,
         parameters: Optional[dict[str, str]] = None,
-    ) -> None:
+        synchronous_mode: str = "sync",
+        synchronous_commit: str = "on",
+        archive_async: bool = False,
+    ) -> str:
         """Render the Patroni configuration file.
 
+        The file is only written when its content changes.
+
         Args:
             connectivity: whether to allow external connections to the database.
             enable_tls: whether to enable TLS.
@@ -328,11 +588,21 @@ class Patroni:
             stanza: name of the stanza created by pgBackRest.
             restore_stanza: name of the stanza used when restoring a backup.
             backup_id: id of the backup that is being restored.
-            parameters: PostgreSQL parameters to be added to the postgresql.conf file.
+            restore_type: pgBackRest recovery type of the restore (immediate, time, lsn or xid).
+            restore_target: point-in-time recovery target of the restore.
+            parameters: PostgreSQL parameters to be added to the postgresql.conf file (the ones
+                Patroni only takes from the dynamic configuration are only used to bootstrap
+                the cluster and must be changed with `update_dynamic_configuration`).
+            synchronous_mode: synchronous replication mode used when bootstrapping the cluster.
+            synchronous_commit: synchronous commit level used when bootstrapping the cluster.
+            archive_async: whether the replicas should also fetch the WAL files from the
+                pgBackRest repository (asynchronously, as configured in pgBackRest).
+
+        Returns:
+            the hash of the rendered configuration.
         """
-        # Open the template patroni.yml file.
-        with open("templates/patroni.yml.j2", "r") as file:
-            template = Template(file.read())
+        # Get the compiled template patroni.yml file.
+        template = _load_template("templates/patroni.yml.j2")
         # Render the template file with the correct values.
         rendered = template.render(
             connectivity=connectivity,
@@ -350,23 +620,102 @@ class Patroni:
             enable_pgbackrest=stanza is not None,
             restoring_backup=backup_id is not None,
             backup_id=backup_id,
+            restore_type=restore_type,
+            restore_target=restore_target,
             stanza=stanza,
             restore_stanza=restore_stanza,
-            minority_count=self._members_count // 2,
+            minority_count=self._synchronous_node_count,
             version=self.rock_postgresql_version.split(".")[0],
             pg_parameters=parameters,
+            local_pg_parameters={
+                name: value
+                for name, value in (parameters or {}).items()
+                if name not in DCS_ONLY_PARAMETERS
+            },
+            synchronous_mode=SYNCHRONOUS_MODES[synchronous_mode],
+            synchronous_commit=synchronous_commit,
+            archive_async=archive_async,
         )
-        self._render_file(f"{self._storage_path}/patroni.yml", rendered, 0o644)
+        path = f"{self._storage_path}/patroni.yml"
+        config_hash = self._get_content_hash(rendered)
+        if self._get_file_hash(path) == config_hash:
+            logger.debug("Patroni configuration file unchanged")
+        else:
+            self._render_file(path, rendered, 0o644)
+        return config_hash
+
+    @property
+    def _synchronous_node_count(self) -> int:
+        """Number of synchronous standbys (a minority of the cluster members)."""
+        return max(1, self._members_count // 2)
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+    def get_synchronous_settings(self, synchronous_mode: str, synchronous_commit: str) -> Dict:
+        """Returns the dynamic configuration of the synchronous replication.
+
+        Args:
+            synchronous_mode: synchronous replication mode (async or sync).
+            synchronous_commit: synchronous commit level (on, remote_write or remote_apply).
+        """
+        return {
+            "synchronous_mode": SYNCHRONOUS_MODES[synchronous_mode],
+            "synchronous_node_count": self._synchronous_node_count,
+            "postgresql": {
+                "parameters": {
+                    "synchronous_commit": synchronous_commit,
+                    # Patroni manages the synchronous standbys when the synchronous mode is on.
+                    "synchronous_standby_names": "*" if synchronous_mode != "async" else "",
+                }
+            },
+        }
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=2, max=10),
+        before_sleep=_record_retry,
+    )
+    def update_dynamic_configuration(self, configuration: Dict) -> None:
+        """Update the cluster-wide configuration stored by Patroni in the DCS.
+
+        Args:
+            configuration: the settings to be changed.
+        """
+        r = self._http.patch(
+            f"{self._patroni_url}/config",
+            json=configuration,
+            verify=self._verify,
+            timeout=API_REQUEST_TIMEOUT,
+        )
+        r.raise_for_status()
+        # The members' roles may change with the new synchronous settings.
+        self.invalidate_cluster_snapshot()
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=2, max=10),
+        before_sleep=_record_retry,
+    )
     def reload_patroni_configuration(self) -> None:
         """Reloads the configuration after it was updated in the file."""
-        requests.post(f"{self._patroni_url}/reload", verify=self._verify)
+        # The reload may change the member tags.
+        self.invalidate_cluster_snapshot()
+        self._http.post(
+            f"{self._patroni_url}/reload", verify=self._verify, timeout=API_REQUEST_TIMEOUT
+        )
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=2, max=10),
+        before_sleep=_record_retry,
+    )
     def restart_postgresql(self) -> None:
         """Restart PostgreSQL."""
-        requests.post(f"{self._patroni_url}/restart", verify=self._verify)
+        self.invalidate_cluster_snapshot()
+        # Patroni only answers after PostgreSQL is restarted, so don't limit the read time.
+        self._http.post(
+            f"{self._patroni_url}/restart",
+            verify=self._verify,
+            timeout=(API_CONNECT_TIMEOUT, None),
+        )
 
     def switchover(self, candidate: str = None) -> None:
         """Trigger a switchover."""
@@ -374,21 +723,31 @@ class Patroni:
         if candidate is not None:
             candidate = candidate.replace("/", "-")
 
-        for attempt in Retrying(stop=stop_after_delay(60), wait=wait_fixed(3)):
+        for attempt in Retrying(
+            stop=stop_after_delay(60), wait=wait_fixed(3), before_sleep=_record_retry
+        ):
             with attempt:
                 primary = self.get_primary()
-                r = requests.post(
+                # Patroni only answers after the switchover is done, so don't limit the read time.
+                r = self._http.post(
                     f"{self._patroni_url}/switchover",
                     json={"leader": primary, "candidate": candidate},
                     verify=self._verify,
+                    timeout=(API_CONNECT_TIMEOUT, None),
                 )
 
+        # The roles of the members are going to change.
+        self.invalidate_cluster_snapshot()
+
         # Check whether the switchover was unsuccessful.
         if r.status_code != 200:
             raise SwitchoverFailedError(f"received {r.status_code}")
 
-        for attempt in Retrying(stop=stop_after_delay(60), wait=wait_fixed(3), reraise=True):
+        for attempt in Retrying(
+            stop=stop_after_delay(60), wait=wait_fixed(3), reraise=True, before_sleep=_record_retry
+        ):
             with attempt:
+                self.invalidate_cluster_snapshot()
                 new_primary = self.get_primary()
                 if (candidate is not None and new_primary != candidate) or new_primary == primary:
                     raise SwitchoverFailedError("primary was not switched correctly")
@@ -4,6 +4,8 @@
 """Postgres db and db-admin relation hooks & helpers."""
 
 
+import hashlib
+import json
 import logging
 from typing import Iterable, List, Set, Tuple
 
@@ -139,21 +141,43 @@ class DbProvides(Object):
             unit_relation_databag = relation.data[self.charm.unit]
             application_relation_databag = relation.data[self.charm.app]
 
-            # Creates the user and the database for this specific relation if it was not already
-            # created in a previous relation changed event.
             user = f"relation_id_{relation.id}"
-            password = unit_relation_databag.get("password", new_password())
-            self.charm.postgresql.create_user(user, password, self.admin)
+            password = unit_relation_databag.get("password")
             plugins = [
                 "_".join(plugin.split("_")[1:-1])
                 for plugin in self.charm.config.plugin_keys()
                 if self.charm.config[plugin]
             ]
-
-            self.charm.postgresql.create_database(database, user, plugins=plugins)
-
-            # Enable/disable extensions in the new database.
-            self.charm.enable_disable_extensions(database)
+            allowed_subnets = self._get_allowed_subnets(relation)
+            allowed_units = self._get_allowed_units(relation)
+            fingerprint = self._get_fingerprint(
+                database, user, required_extensions, plugins, allowed_subnets, allowed_units
+            )
+            fingerprint_key = self._fingerprint_key(relation)
+            version = unit_relation_databag.get("version")
+
+            # Skip the database changes if they were already done for the same
+            # relation state (only the databags need to be refreshed).
+            if (
+                password is None
+                or version is None
+                or self.charm.app_peer_data.get(fingerprint_key) != fingerprint
+            ):
+                # Creates the user and the database for this specific relation if it was not
+                # already created in a previous relation changed event.
+                password = password or new_password()
+                self.charm.postgresql.create_user(user, password, self.admin)
+                self.charm.postgresql.create_database(database, user, plugins=plugins)
+
+                # Enable/disable extensions in the new database.
+                self.charm.enable_disable_extensions(database)
+
+                version = self.charm.postgresql.get_postgresql_version()
+            else:
+                logger.debug(
+                    f"{self.relation_name} relation {relation.id} is already set up;"
+                    " only refreshing the databags"
+                )
 
             # Build the primary's connection string.
             primary = str(
@@ -181,25 +205,30 @@ class DbProvides(Object):
 
             # Set the data in both application and unit data bag.
             # It's needed to run this logic on every relation changed event
-            # setting the data again in the databag, otherwise the application charm that
+            # checking the data in the databag, otherwise the application charm that
             # is connecting to this database will receive a "database gone" event from the
             # old PostgreSQL library (ops-lib-pgsql) and the connection between the
-            # application and this charm will not work.
+            # application and this charm will not work. Only the changed fields are written.
             for databag in [application_relation_databag, unit_relation_databag]:
                 updates = {
-                    "allowed-subnets": self._get_allowed_subnets(relation),
-                    "allowed-units": self._get_allowed_units(relation),
+                    "allowed-subnets": allowed_subnets,
+                    "allowed-units": allowed_units,
                     "host": self.charm.endpoint,
                     "master": primary,
                     "port": DATABASE_PORT,
                     "standbys": standbys,
-                    "version": self.charm.postgresql.get_postgresql_version(),
+                    "version": version,
                     "user": user,
                     "password": password,
                     "database": database,
                     "extensions": ",".join(required_extensions),
                 }
-                databag.update(updates)
+                changes = {
+                    key: value for key, value in updates.items() if databag.get(key, "") != value
+                }
+                if changes:
+                    databag.update(changes)
+            self.charm.app_peer_data[fingerprint_key] = fingerprint
         except (
             PostgreSQLCreateDatabaseError,
             PostgreSQLCreateUserError,
@@ -214,6 +243,51 @@ class DbProvides(Object):
 
         return True
 
+    def _fingerprint_key(self, relation: Relation) -> str:
+        """Returns the peer data key storing the fingerprint of the relation setup."""
+        return f"{self.relation_name}-{relation.id}-fingerprint"
+
+    def _get_fingerprint(
+        self,
+        database: str,
+        user: str,
+        extensions: List[str],
+        plugins: List[str],
+        allowed_subnets: str,
+        allowed_units: str,
+    ) -> str:
+        """Returns a hash of the relation state that requires changes in the database."""
+        state = {
+            "admin": self.admin,
+            "allowed-subnets": allowed_subnets,
+            "allowed-units": allowed_units,
+            "database": database,
+            "extensions": extensions,
+            "plugins": sorted(plugins),
+            "user": user,
+        }
+        return hashlib.sha256(json.dumps(state, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def reconcile_relations(self, users: Set[str], databases: Set[str]) -> None:
+        """Bring the users, databases and databags of all the relations to the desired state.
+
+        Args:
+            users: the users that currently exist in PostgreSQL.
+            databases: the databases that currently exist in PostgreSQL.
+        """
+        if not self.charm.unit.is_leader():
+            return
+
+        for relation in self.model.relations.get(self.relation_name, []):
+            user = f"relation_id_{relation.id}"
+            database = relation.data[self.charm.unit].get("database")
+
+            # Force the setup of the relation if its user or database is missing.
+            if database is not None and (user not in users or database not in databases):
+                self.charm.app_peer_data.pop(self._fingerprint_key(relation), None)
+
+            self.set_up_relation(relation)
+
     def _check_for_blocking_relations(self, relation_id: int) -> bool:
         """Checks if there are relations with extensions.
 
@@ -279,6 +353,8 @@ class DbProvides(Object):
         if not self.charm.unit.is_leader():
             return
 
+        self.charm.app_peer_data.pop(self._fingerprint_key(event.relation), None)
+
         # Delete the user.
         user = f"relation_id_{event.relation.id}"
         try:
@@ -5,6 +5,7 @@
 
 
 import logging
+from typing import Dict, List, Optional, Set
 
 from charms.data_platform_libs.v0.data_interfaces import (
     DatabaseProvides,
@@ -21,7 +22,7 @@ from ops.charm import CharmBase, RelationBrokenEvent
 from ops.framework import Object
 from ops.model import ActiveStatus, BlockedStatus, Relation
 
-from constants import DATABASE_PORT
+from constants import APP_SCOPE, DATABASE_PORT, PGBOUNCER_PORT, PGBOUNCER_USERLIST_KEY
 from utils import new_password
 
 logger = logging.getLogger(__name__)
@@ -85,21 +86,19 @@ class PostgreSQLProvider(Object):
             user = f"relation_id_{event.relation.id}"
             password = new_password()
             self.charm.postgresql.create_user(user, password, extra_user_roles=extra_user_roles)
-            plugins = [
-                "_".join(plugin.split("_")[1:-1])
-                for plugin in self.charm.config.plugin_keys()
-                if self.charm.config[plugin]
-            ]
-
-            self.charm.postgresql.create_database(database, user, plugins=plugins)
+            self.charm.postgresql.create_database(database, user, plugins=self._get_plugins())
 
             # Share the credentials with the application.
             self.database_provides.set_credentials(event.relation.id, user, password)
 
-            # Set the read/write endpoint.
-            self.database_provides.set_endpoints(
-                event.relation.id,
-                f"{self.charm.primary_endpoint}:{DATABASE_PORT}",
+            # Share the credentials with PgBouncer.
+            self.update_pgbouncer_userlist()
+
+            # Set the read/write endpoint (and the PgBouncer one, when it's enabled).
+            endpoints = f"{self.charm.primary_endpoint}:{DATABASE_PORT}"
+            self.database_provides.set_endpoints(event.relation.id, endpoints)
+            self._update_relations_data(
+                {event.relation.id: {"pooler-endpoints": self._get_pooler_endpoints(endpoints)}}
             )
 
             # Update the read-only endpoint.
@@ -155,27 +154,197 @@ class PostgreSQLProvider(Object):
                 f"Failed to delete user during {self.relation_name} relation broken event"
             )
 
+        self.update_pgbouncer_userlist(removed_relation_id=event.relation.id)
+
+    def _get_pooler_endpoints(self, endpoints: str) -> str:
+        """Return the PgBouncer endpoints of the same hosts (empty if PgBouncer is disabled).
+
+        They're shared in separate fields, so the clients don't take the pooled and
+        the direct connections as alternative hosts of the same server.
+        """
+        if not self.charm.config.pgbouncer_enabled or not endpoints:
+            return ""
+        return ",".join(
+            f"{endpoint.rsplit(':', 1)[0]}:{PGBOUNCER_PORT}" for endpoint in endpoints.split(",")
+        )
+
+    def _get_plugins(self) -> List[str]:
+        """Returns the names of the plugins enabled through config options."""
+        return [
+            "_".join(plugin.split("_")[1:-1])
+            for plugin in self.charm.config.plugin_keys()
+            if self.charm.config[plugin]
+        ]
+
+    def _get_read_only_endpoints(self) -> str:
+        """Returns the read-only endpoints (empty if there are no replicas).
+
+        In the host-list mode, the endpoints of the replicas that can receive read-only
+        traffic are returned, falling back to the replicas service when there is none.
+        """
+        if len(self.charm._peers.units) == 0:
+            return ""
+
+        if self.charm.config.read_only_endpoints_mode == "host-list":
+            members = self.charm.get_read_only_members()
+            if members:
+                return ",".join(
+                    f"{self.charm.get_member_endpoint(member)}:{DATABASE_PORT}"
+                    for member in sorted(members, key=lambda member: int(member.split("-")[-1]))
+                )
+            logger.debug("No replica available for the read-only endpoints host list")
+
+        return f"{self.charm.replicas_endpoint}:{DATABASE_PORT}"
+
+    def _update_relations_data(self, data: Dict[int, Dict[str, str]]) -> None:
+        """Write only the fields whose values differ from the ones in the databags.
+
+        Args:
+            data: the desired fields for each relation, indexed by the relation id.
+        """
+        if not data:
+            return
+
+        fields = list({field for relation_data in data.values() for field in relation_data})
+        current_data = self.database_provides.fetch_my_relation_data(list(data), fields)
+        for relation_id, relation_data in data.items():
+            current_relation_data = current_data.get(relation_id, {})
+            changes = {
+                field: value
+                for field, value in relation_data.items()
+                if (current_relation_data.get(field) or "") != value
+            }
+            if changes:
+                self.database_provides.update_relation_data(relation_id, changes)
+
+    def reconcile_relations(self, users: Set[str], databases: Set[str]) -> None:
+        """Bring the users, databases and databags of all the relations to the desired state.
+
+        Only the missing users and databases are (re)created and only the changed
+        fields are written to the databags.
+
+        Args:
+            users: the users that currently exist in PostgreSQL.
+            databases: the databases that currently exist in PostgreSQL.
+        """
+        if not self.charm.unit.is_leader():
+            return
+
+        relations = self.model.relations[self.relation_name]
+        if not relations:
+            return
+
+        relations_data = self.database_provides.fetch_my_relation_data(
+            [relation.id for relation in relations], ["username", "password", "database"]
+        )
+        endpoints = f"{self.charm.primary_endpoint}:{DATABASE_PORT}"
+        read_only_endpoints = self._get_read_only_endpoints()
+        desired_data = {}
+        for relation in relations:
+            relation_data = relations_data.get(relation.id, {})
+            user = relation_data.get("username")
+            database = relation_data.get("database")
+            # Relations without credentials are handled by the database requested event.
+            if not user or not database:
+                continue
+
+            if user not in users or database not in databases:
+                logger.info(f"Recreating the user and database of relation {relation.id}")
+                try:
+                    if user not in users:
+                        self.charm.postgresql.create_user(
+                            user,
+                            relation_data.get("password"),
+                            extra_user_roles=self.database_provides.fetch_relation_field(
+                                relation.id, "extra-user-roles"
+                            ),
+                        )
+                    self.charm.postgresql.create_database(
+                        database, user, plugins=self._get_plugins()
+                    )
+                except (PostgreSQLCreateDatabaseError, PostgreSQLCreateUserError) as e:
+                    logger.exception(e)
+                    self.charm.unit.status = BlockedStatus(
+                        f"Failed to initialize {self.relation_name} relation"
+                    )
+                    continue
+
+            desired_data[relation.id] = {
+                "endpoints": endpoints,
+                "read-only-endpoints": read_only_endpoints,
+                "pooler-endpoints": self._get_pooler_endpoints(endpoints),
+                "read-only-pooler-endpoints": self._get_pooler_endpoints(read_only_endpoints),
+            }
+
+        self._update_relations_data(desired_data)
+
+    def update_endpoints(self) -> None:
+        """Set the read/write and read-only endpoints in the relations with a user."""
+        if not self.charm.unit.is_leader():
+            return
+
+        relations = self.model.relations[self.relation_name]
+        relations_data = self.database_provides.fetch_my_relation_data(
+            [relation.id for relation in relations], ["username"]
+        )
+        endpoints = f"{self.charm.primary_endpoint}:{DATABASE_PORT}"
+        self._update_relations_data(
+            {
+                relation_id: {
+                    "endpoints": endpoints,
+                    "pooler-endpoints": self._get_pooler_endpoints(endpoints),
+                }
+                for relation_id, relation_data in relations_data.items()
+                if relation_data.get("username")
+            }
+        )
+        self.update_read_only_endpoint()
+
+    def update_pgbouncer_userlist(self, removed_relation_id: Optional[int] = None) -> None:
+        """Share the credentials of the relation users with PgBouncer in all the units.
+
+        Args:
+            removed_relation_id: relation whose user is being removed.
+        """
+        if not self.charm.unit.is_leader():
+            return
+
+        users = {}
+        for relation in self.model.relations[self.relation_name]:
+            if relation.id == removed_relation_id:
+                continue
+            credentials = self.database_provides.fetch_my_relation_data(
+                [relation.id], ["username", "password"]
+            ).get(relation.id, {})
+            if "username" in credentials and "password" in credentials:
+                users[credentials["username"]] = credentials["password"]
+
+        userlist = "".join(f'"{user}" "{password}"\n' for user, password in sorted(users.items()))
+        if self.charm.get_secret(APP_SCOPE, PGBOUNCER_USERLIST_KEY) != (userlist or None):
+            self.charm.set_secret(APP_SCOPE, PGBOUNCER_USERLIST_KEY, userlist)
+
     def update_read_only_endpoint(self, event: DatabaseRequestedEvent = None) -> None:
         """Set the read-only endpoint only if there are replicas."""
         if not self.charm.unit.is_leader():
             return
 
         # If there are no replicas, remove the read-only endpoint.
-        endpoints = (
-            f"{self.charm.replicas_endpoint}:{DATABASE_PORT}"
-            if len(self.charm._peers.units) > 0
-            else ""
-        )
+        endpoints = self._get_read_only_endpoints()
 
         # Get the current relation or all the relations
         # if this is triggered by another type of event.
         relations = [event.relation] if event else self.model.relations[self.relation_name]
 
-        for relation in relations:
-            self.database_provides.set_read_only_endpoints(
-                relation.id,
-                endpoints,
-            )
+        pooler_endpoints = self._get_pooler_endpoints(endpoints)
+        self._update_relations_data(
+            {
+                relation.id: {
+                    "read-only-endpoints": endpoints,
+                    "read-only-pooler-endpoints": pooler_endpoints,
+                }
+                for relation in relations
+            }
+        )
 
     def _update_unit_status(self, relation: Relation) -> None:
         """# Clean up Blocked status if it's due to extensions request."""
@@ -0,0 +1,190 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Tracing of the calls to external services made during a hook execution."""
+
+import inspect
+import json
+import logging
+import os
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from tenacity import RetryCallState
+
+logger = logging.getLogger(__name__)
+
+# Number of hook profiles kept in the profiles file.
+MAX_HOOK_PROFILES = 20
+
+
+@dataclass
+class CallStats:
+    """Statistics of the calls to an external service."""
+
+    calls: int = 0
+    errors: int = 0
+    retries: int = 0
+    duration: float = 0.0
+
+
+class HookTracer:
+    """Records the calls to external services (and their retries) made during a hook."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """Discard the recorded calls and counters and restart the hook duration count."""
+        self._start = time.monotonic()
+        self.stats: Dict[str, CallStats] = defaultdict(CallStats)
+        # Other counters (e.g. of objects built or secrets read) included in the profile.
+        self.counters: Dict[str, int] = Counter()
+
+    @property
+    def duration(self) -> float:
+        """Time elapsed since the start of the hook (in seconds)."""
+        return time.monotonic() - self._start
+
+    @contextmanager
+    def span(self, service: str) -> Iterator[None]:
+        """Record a call to a service, including its duration and whether it failed."""
+        stats = self.stats[service]
+        start = time.monotonic()
+        try:
+            yield
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.calls += 1
+            stats.duration += time.monotonic() - start
+
+    def retry_callback(self, service: str) -> Callable[[RetryCallState], None]:
+        """Returns a tenacity callback (for `before_sleep`) that records the retries."""
+
+        def record_retry(_: RetryCallState) -> None:
+            self.stats[service].retries += 1
+
+        return record_retry
+
+    def traced(self, service: str, function: Callable) -> Callable:
+        """Wrap a function, so its calls (and the iteration of its results) are recorded."""
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.span(service):
+                result = function(*args, **kwargs)
+            if inspect.isgenerator(result):
+                return self._traced_iterator(service, result)
+            return result
+
+        return wrapper
+
+    def _traced_iterator(self, service: str, iterator: Iterator) -> Iterator:
+        """Record the time spent retrieving the items of an iterator (e.g. paginated lists)."""
+        stats = self.stats[service]
+        start = time.monotonic()
+        try:
+            yield from iterator
+        finally:
+            stats.duration += time.monotonic() - start
+
+    def trace_methods(self, obj: Any, service: str, methods: Iterable[str]) -> None:
+        """Record the calls to some methods of an object.
+
+        Only the object's own methods are wrapped (e.g. not mocks replacing them).
+
+        Args:
+            obj: the object whose methods are going to be wrapped.
+            service: the name under which the calls are recorded.
+            methods: the names of the methods.
+        """
+        for name in methods:
+            method = getattr(obj, name, None)
+            if not inspect.ismethod(method) or method.__self__ is not obj:
+                continue
+            setattr(obj, name, self.traced(service, method))
+
+    def trace_boto3_session(self, session: Any, service: str = "s3") -> None:
+        """Record the calls made by the clients and resources of a boto3 session."""
+
+        def before_call(context: Dict, **_) -> None:
+            context["trace-start"] = time.monotonic()
+
+        def after_call(context: Dict, http_response: Any = None, **_) -> None:
+            stats = self.stats[service]
+            stats.calls += 1
+            stats.duration += time.monotonic() - context.get("trace-start", time.monotonic())
+            if http_response is None or http_response.status_code >= 300:
+                stats.errors += 1
+
+        session.events.register(f"before-call.{service}", before_call)
+        session.events.register(f"after-call.{service}", after_call)
+        session.events.register(f"after-call-error.{service}", after_call)
+
+    def summary(self, counters: Optional[Dict[str, int]] = None) -> str:
+        """Returns a one-line summary of the calls made during the hook."""
+        calls = []
+        for service, stats in sorted(self.stats.items()):
+            details = ", ".join(
+                f"{count} {name}"
+                for name, count in [("errors", stats.errors), ("retries", stats.retries)]
+                if count
+            )
+            calls.append(
+                f"{service}={stats.calls} calls{f' ({details})' if details else ''}"
+                f" in {stats.duration:.2f}s"
+            )
+        if counters:
+            calls.extend(f"{name}={count}" for name, count in sorted(counters.items()))
+        return f"{self.duration:.2f}s; {'; '.join(calls) or 'no external calls'}"
+
+    def save_profile(
+        self,
+        path: str,
+        hook: str,
+        counters: Optional[Dict[str, int]] = None,
+        max_profiles: int = MAX_HOOK_PROFILES,
+    ) -> None:
+        """Append the profile of the hook to a file, which keeps only the last profiles.
+
+        Args:
+            path: path of the profiles file.
+            hook: name of the hook.
+            counters: other counters to be included in the profile.
+            max_profiles: number of hook profiles kept in the file.
+        """
+        profiles = []
+        try:
+            with open(path) as file:
+                profiles = json.load(file)
+        except (OSError, ValueError):
+            pass
+
+        profiles.append(
+            {
+                "hook": hook,
+                "timestamp": time.time(),
+                "duration": round(self.duration, 3),
+                "calls": {
+                    service: {**asdict(stats), "duration": round(stats.duration, 3)}
+                    for service, stats in sorted(self.stats.items())
+                },
+                "counters": dict(counters or {}),
+            }
+        )
+        try:
+            with open(f"{path}.tmp", "w") as file:
+                json.dump(profiles[-max_profiles:], file)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.debug(f"Failed to save the hook profile: {e}")
+
+
+# Tracer shared by all the objects used during the hook execution.
+tracer = HookTracer()
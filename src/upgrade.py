@@ -4,6 +4,7 @@
 """Upgrades implementation."""
 import json
 import logging
+from typing import Optional
 
 from charms.data_platform_libs.v0.upgrade import (
     ClusterNotReadyError,
@@ -11,6 +12,7 @@ from charms.data_platform_libs.v0.upgrade import (
     DependencyModel,
     KubernetesClientError,
 )
+from charms.postgresql_k8s.v0.postgresql import PostgreSQLCheckBackupInProgressError
 from lightkube.core.client import Client
 from lightkube.core.exceptions import ApiError
 from lightkube.resources.apps_v1 import StatefulSet
@@ -21,7 +23,7 @@ from tenacity import RetryError, Retrying, stop_after_attempt, wait_fixed
 from typing_extensions import override
 
 from constants import APP_SCOPE, MONITORING_PASSWORD_KEY, MONITORING_USER
-from patroni import SwitchoverFailedError
+from patroni import SwitchoverFailedError, format_members_health
 from utils import new_password
 
 logger = logging.getLogger(__name__)
@@ -102,29 +104,47 @@ class PostgreSQLUpgrade(DataUpgrade):
                 return
             self._set_up_new_credentials_for_legacy()
 
+        failure_reason = None
         try:
             for attempt in Retrying(stop=stop_after_attempt(6), wait=wait_fixed(10)):
                 with attempt:
-                    if (
-                        self.charm.unit.name.replace("/", "-")
-                        in self.charm._patroni.cluster_members
-                        and self.charm._patroni.is_replication_healthy
-                    ):
+                    # Wait for the unit to show up in a fresh view of the cluster.
+                    self.charm._patroni.invalidate_cluster_snapshot()
+                    failure_reason = self._get_unhealthy_reason()
+                    if failure_reason is None:
                         logger.debug("Upgraded unit is healthy. Set upgrade state to `completed`")
                         self.set_unit_completed()
                     else:
                         logger.debug(
-                            "Instance not yet back in the cluster or not healthy."
+                            f"Upgraded unit not healthy yet ({failure_reason})."
                             f" Retry {attempt.retry_state.attempt_number}/6"
                         )
                         raise Exception
         except RetryError:
-            logger.error("Upgraded unit is not part of the cluster or not healthy")
+            logger.error(
+                f"Upgraded unit is not part of the cluster or not healthy: {failure_reason}"
+            )
             self.set_unit_failed()
             self.charm.unit.status = BlockedStatus(
-                "upgrade failed. Check logs for rollback instruction"
+                f"upgrade failed: {failure_reason}. Check logs for rollback instruction"
             )
 
+    def _get_unhealthy_reason(self) -> Optional[str]:
+        """Returns why the upgraded unit isn't healthy yet (None when it's healthy).
+
+        The reason names the members that block the upgrade (this unit, when it's not
+        back in the cluster yet, or the members whose replication isn't healthy).
+        """
+        try:
+            if self.charm.unit.name.replace("/", "-") not in self.charm._patroni.cluster_members:
+                return f"{self.charm.unit.name} not in the cluster"
+            unhealthy_members = self.charm._patroni.get_unhealthy_members()
+        except RetryError:
+            return "cluster topology unavailable"
+        if unhealthy_members:
+            return f"replication unhealthy in {format_members_health(unhealthy_members)}"
+        return None
+
     def _on_upgrade_changed(self, _) -> None:
         """Update the Patroni nosync tag in the unit if needed."""
         if not self.peer_relation or not self.charm._patroni.member_started:
@@ -168,7 +188,19 @@ class PostgreSQLUpgrade(DataUpgrade):
                 "wait for all units to become active/idle",
             )
 
-        if self.charm._patroni.is_creating_backup:
+        # The scheduled backups don't set the Patroni tag, so also check the database sessions.
+        try:
+            is_creating_backup = (
+                self.charm._patroni.is_creating_backup
+                or self.charm.postgresql.is_backup_in_progress()
+            )
+        except PostgreSQLCheckBackupInProgressError:
+            raise ClusterNotReadyError(
+                default_message,
+                "failed to check whether a backup is being created",
+                "check the connectivity to the primary and retry",
+            )
+        if is_creating_backup:
             raise ClusterNotReadyError(
                 default_message,
                 "a backup is being created",
@@ -184,12 +216,15 @@ class PostgreSQLUpgrade(DataUpgrade):
             self._set_first_rolling_update_partition()
             return
 
+        # In the asynchronous mode there are no sync-standbys and any replica can
+        # become the primary.
+        asynchronous_mode = self.charm.config.synchronous_mode == "async"
         sync_standby_names = self.charm._patroni.get_sync_standby_names()
-        if len(sync_standby_names) == 0:
+        if len(sync_standby_names) == 0 and not asynchronous_mode:
             raise ClusterNotReadyError("invalid number of sync nodes", "no action!")
 
         # If the first unit is a sync-standby we can switchover to it.
-        if unit_zero_name in sync_standby_names:
+        if unit_zero_name in sync_standby_names or asynchronous_mode:
             try:
                 self.peer_relation.data[self.charm.app].update({"sync-standbys": ""})
                 self.charm._patroni.switchover(unit_zero_name)
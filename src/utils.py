@@ -58,3 +58,18 @@ def any_memory_to_bytes(mem_str) -> int:
 
         num = int(memory)
         return int(num * units[unit])
+
+
+def any_cpu_to_cores(cpu_str) -> float:
+    """Convert a CPU quantity string to cores.
+
+    Args:
+        cpu_str: a string representing a CPU value, e.g. "2" or "500m"
+    """
+    cpu_str = str(cpu_str)
+    try:
+        if cpu_str.endswith("m"):
+            return int(cpu_str[:-1]) / 1000
+        return float(cpu_str)
+    except ValueError:
+        raise ValueError(f"Invalid CPU definition in '{cpu_str}'")
@@ -0,0 +1,116 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Benchmark of the client relations reconciliation as the number of relations grows.
+
+Run it with `tox -e benchmark`. It prints, for each number of relations, the time of a
+config-changed hook that doesn't change the options affecting the relations and the time
+of a full reconciliation pass, together with the PostgreSQL queries and databag writes
+they made.
+"""
+
+import time
+import unittest
+from statistics import median
+from unittest.mock import Mock, patch
+
+from ops.testing import Harness
+
+from charm import PostgresqlOperatorCharm
+from constants import PEER
+
+RELATIONS_COUNTS = [10, 50, 100, 500]
+# Number of timed runs of each measurement (the median is reported).
+RUNS = 5
+
+
+def _median_time(function) -> float:
+    """Returns the median wall time (in seconds) of several runs of a function."""
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return median(times)
+
+
+class BenchmarkReconcileRelations(unittest.TestCase):
+    def _set_up_charm(self, relations_count: int) -> Harness:
+        """Returns a leader charm with the given number of reconciled client relations."""
+        harness = Harness(PostgresqlOperatorCharm)
+        self.addCleanup(harness.cleanup)
+        with patch("charm.KubernetesServicePatch", lambda x, y: None):
+            harness.begin()
+        app = harness.charm.app.name
+        with harness.hooks_disabled():
+            harness.set_leader(True)
+            peer_rel_id = harness.add_relation(PEER, app)
+            harness.add_relation_unit(peer_rel_id, f"{app}/1")
+            harness.update_relation_data(peer_rel_id, app, {"cluster_initialised": "True"})
+            for index in range(relations_count):
+                rel_id = harness.add_relation("database", f"application{index}")
+                harness.add_relation_unit(rel_id, f"application{index}/0")
+                harness.update_relation_data(
+                    rel_id,
+                    app,
+                    {
+                        "username": f"relation_id_{rel_id}",
+                        "password": "test-password",
+                        "database": f"database{index}",
+                    },
+                )
+        return harness
+
+    def test_reconcile_relations(self):
+        results = []
+        for relations_count in RELATIONS_COUNTS:
+            harness = self._set_up_charm(relations_count)
+            charm = harness.charm
+            postgresql = Mock()
+            postgresql.list_users.return_value = {
+                f"relation_id_{relation.id}" for relation in charm.model.relations["database"]
+            }
+            postgresql.list_databases.return_value = {
+                f"database{index}" for index in range(relations_count)
+            }
+            with patch.object(PostgresqlOperatorCharm, "postgresql", postgresql), patch.multiple(
+                PostgresqlOperatorCharm,
+                update_config=Mock(),
+                _refresh_storage_size=Mock(),
+                _create_services=Mock(),
+                enable_disable_extensions=Mock(),
+            ), patch("upgrade.PostgreSQLUpgrade.idle", return_value=True), patch.object(
+                charm.postgresql_client_relation.database_provides,
+                "update_relation_data",
+                wraps=charm.postgresql_client_relation.database_provides.update_relation_data,
+            ) as update_relation_data:
+                # The first hook reconciles the relations and writes the endpoints.
+                charm._on_config_changed(None)
+                postgresql.reset_mock()
+                update_relation_data.reset_mock()
+
+                hook_time = _median_time(lambda: charm._on_config_changed(None))
+                hook_queries = len(postgresql.mock_calls)
+                pass_time = _median_time(charm.reconcile_client_relations)
+                pass_queries = len(postgresql.mock_calls) - hook_queries
+                writes = update_relation_data.call_count
+            results.append((relations_count, hook_time, hook_queries, pass_time, pass_queries))
+
+            # A hook without option changes doesn't touch PostgreSQL or the relations, and
+            # a full pass only queries the catalog once (two queries) and writes nothing.
+            self.assertEqual(hook_queries, 0)
+            self.assertEqual(pass_queries, 2 * RUNS)
+            self.assertEqual(writes, 0)
+
+        print("\nrelations  hook time (ms)  hook queries  pass time (ms)  pass queries")
+        for relations_count, hook_time, hook_queries, pass_time, pass_queries in results:
+            print(
+                f"{relations_count:>9}  {hook_time * 1000:>14.2f}  {hook_queries // RUNS:>12}"
+                f"  {pass_time * 1000:>14.2f}  {pass_queries // RUNS:>12}"
+            )
+
+        # The hook time stays flat and the pass time grows (at most) linearly
+        # with the number of relations.
+        first, last = results[0], results[-1]
+        self.assertLess(last[1], 2 * first[1] + 0.01)
+        self.assertLess(last[3] / last[0], 3 * first[3] / first[0])
@@ -7,6 +7,8 @@ import pytest
 from ops import JujuVersion
 from pytest_mock import MockerFixture
 
+from patroni import Patroni, _load_template
+
 
 @pytest.fixture(autouse=True)
 def juju_has_secrets(mocker: MockerFixture):
@@ -47,3 +49,11 @@ def only_without_juju_secrets(juju_has_secrets):
     """
     if juju_has_secrets:
         pytest.skip("Skipping legacy secrets tests")
+
+
+@pytest.fixture(autouse=True)
+def reset_patroni_caches():
+    """Discard the data cached by the Patroni class during a hook between tests."""
+    Patroni.invalidate_cluster_snapshot()
+    Patroni._rock_postgresql_version = None
+    _load_template.cache_clear()
@@ -0,0 +1,62 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import unittest
+from datetime import datetime
+
+from backup_scheduler import CronSchedule, get_due_backup_type
+
+
+class TestBackupScheduler(unittest.TestCase):
+    def test_cron_schedule(self):
+        schedule = CronSchedule("*/15 2-4 * * 0")
+        self.assertEqual(schedule.minutes, {0, 15, 30, 45})
+        self.assertEqual(schedule.hours, {2, 3, 4})
+        self.assertEqual(schedule.weekdays, {0})
+        # 2023-01-01 is a Sunday.
+        self.assertTrue(schedule.is_due(datetime(2023, 1, 1, 3, 45)))
+        self.assertFalse(schedule.is_due(datetime(2023, 1, 1, 3, 46)))
+        self.assertFalse(schedule.is_due(datetime(2023, 1, 1, 5, 0)))
+        self.assertFalse(schedule.is_due(datetime(2023, 1, 2, 3, 45)))
+
+        # Test lists, steps starting from a value and Sunday as 7.
+        schedule = CronSchedule("0,30 5/6 * 1-3 7")
+        self.assertEqual(schedule.minutes, {0, 30})
+        self.assertEqual(schedule.hours, {5, 11, 17, 23})
+        self.assertEqual(schedule.months, {1, 2, 3})
+        self.assertTrue(schedule.is_due(datetime(2023, 1, 1, 17, 30)))
+
+        # Test that a date matching either of the restricted days fields is due.
+        schedule = CronSchedule("0 0 15 * 1")
+        self.assertTrue(schedule.is_due(datetime(2023, 1, 15)))
+        self.assertTrue(schedule.is_due(datetime(2023, 1, 2)))
+        self.assertFalse(schedule.is_due(datetime(2023, 1, 3)))
+
+        # Test that a days field starting with `*` isn't restricted, as in cron.
+        schedule = CronSchedule("0 0 */2 * 1")
+        self.assertTrue(schedule.is_due(datetime(2023, 1, 9)))
+        self.assertFalse(schedule.is_due(datetime(2023, 1, 2)))
+
+        # Test invalid schedules.
+        for expression in [
+            "",
+            "0 2 * *",
+            "60 * * * *",
+            "* * 0 * *",
+            "5-1 * * * *",
+            "*/0 * * * *",
+            "a * * * *",
+        ]:
+            with self.assertRaises(ValueError):
+                CronSchedule(expression)
+
+    def test_get_due_backup_type(self):
+        schedules = [
+            ("full", CronSchedule("0 2 * * 0")),
+            ("diff", None),
+            ("incr", CronSchedule("0 */2 * * *")),
+        ]
+        # Test that the full backup takes precedence over the incremental one.
+        self.assertEqual(get_due_backup_type(schedules, datetime(2023, 1, 1, 2)), "full")
+        self.assertEqual(get_due_backup_type(schedules, datetime(2023, 1, 2, 2)), "incr")
+        self.assertIsNone(get_due_backup_type(schedules, datetime(2023, 1, 2, 3)))
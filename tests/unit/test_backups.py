@@ -15,6 +15,7 @@ from tenacity import RetryError, wait_fixed
 
 from charm import PostgresqlOperatorCharm
 from constants import PEER
+from patroni import ClusterSnapshot
 from tests.unit.helpers import _FakeApiError
 
 ANOTHER_CLUSTER_REPOSITORY_ERROR_MESSAGE = "the S3 repository has backups from another cluster"
@@ -404,46 +405,73 @@ class TestPostgreSQLBackups(unittest.TestCase):
         # Test when there are no backups.
         self.assertEqual(
             self.charm.backup._format_backup_list([]),
-            """backup-id             | backup-type  | backup-status
-----------------------------------------------------""",
+            """backup-id             | backup-type  | reference-backup-id   | backup-status
+----------------------------------------------------------------------------""",
         )
 
         # Test when there are backups.
         backup_list = [
-            ("2023-01-01T09:00:00Z", "physical", "failed: fake error"),
-            ("2023-01-01T10:00:00Z", "physical", "finished"),
+            ("2023-01-01T09:00:00Z", "full", "None", "failed: fake error"),
+            ("2023-01-01T10:00:00Z", "full", "None", "finished"),
+            ("2023-01-01T11:00:00Z", "incremental", "2023-01-01T10:00:00Z", "finished"),
         ]
         self.assertEqual(
             self.charm.backup._format_backup_list(backup_list),
-            """backup-id             | backup-type  | backup-status
-----------------------------------------------------
-2023-01-01T09:00:00Z  | physical     | failed: fake error
-2023-01-01T10:00:00Z  | physical     | finished""",
+            """backup-id             | backup-type  | reference-backup-id   | backup-status
+----------------------------------------------------------------------------
+2023-01-01T09:00:00Z  | full         | None                  | failed: fake error
+2023-01-01T10:00:00Z  | full         | None                  | finished
+2023-01-01T11:00:00Z  | incremental  | 2023-01-01T10:00:00Z  | finished""",
         )
 
     @patch("charm.PostgreSQLBackups._execute_command")
     def test_generate_backup_list_output(self, _execute_command):
         # Test when no backups are returned.
-        _execute_command.return_value = ('[{"backup":[]}]', None)
+        _execute_command.return_value = ('[{"backup":[],"name":"test-stanza"}]', None)
         self.assertEqual(
             self.charm.backup._generate_backup_list_output(),
-            """backup-id             | backup-type  | backup-status
-----------------------------------------------------""",
+            """backup-id             | backup-type  | reference-backup-id   | backup-status
+----------------------------------------------------------------------------""",
         )
 
         # Test when backups are returned.
         _execute_command.return_value = (
-            '[{"backup":[{"label":"20230101-090000F","error":"fake error"},{"label":"20230101-100000F","error":null}]}]',
+            '[{"backup":[{"label":"20230101-090000F","type":"full","prior":null,"error":"fake error"},'
+            '{"label":"20230101-100000F","type":"full","prior":null,"error":null},'
+            '{"label":"20230101-100000F_20230101-110000D","type":"diff","prior":"20230101-100000F","error":null},'
+            '{"label":"20230101-100000F_20230101-120000I","type":"incr","prior":"20230101-100000F_20230101-110000D","error":null}],'
+            '"name":"test-stanza"}]',
             None,
         )
         self.assertEqual(
             self.charm.backup._generate_backup_list_output(),
-            """backup-id             | backup-type  | backup-status
-----------------------------------------------------
-2023-01-01T09:00:00Z  | physical     | failed: fake error
-2023-01-01T10:00:00Z  | physical     | finished""",
+            """backup-id             | backup-type  | reference-backup-id   | backup-status
+----------------------------------------------------------------------------
+2023-01-01T09:00:00Z  | full         | None                  | failed: fake error
+2023-01-01T10:00:00Z  | full         | None                  | finished
+2023-01-01T11:00:00Z  | differential | 2023-01-01T10:00:00Z  | finished
+2023-01-01T12:00:00Z  | incremental  | 2023-01-01T11:00:00Z  | finished""",
+        )
+
+    def test_get_backup_chain(self):
+        backups = {
+            "2023-01-01T10:00:00Z": {"reference": None},
+            "2023-01-01T11:00:00Z": {"reference": "2023-01-01T10:00:00Z"},
+            "2023-01-01T12:00:00Z": {"reference": "2023-01-01T11:00:00Z"},
+            "2023-01-01T13:00:00Z": {"reference": "2023-01-01T09:00:00Z"},
+        }
+        self.assertEqual(
+            self.charm.backup._get_backup_chain("2023-01-01T10:00:00Z", backups),
+            ["2023-01-01T10:00:00Z"],
+        )
+        self.assertEqual(
+            self.charm.backup._get_backup_chain("2023-01-01T12:00:00Z", backups),
+            ["2023-01-01T10:00:00Z", "2023-01-01T11:00:00Z", "2023-01-01T12:00:00Z"],
         )
 
+        # Test when a backup in the chain is missing (e.g. it failed or it was expired).
+        self.assertEqual(self.charm.backup._get_backup_chain("2023-01-01T13:00:00Z", backups), [])
+
     @patch("charm.PostgreSQLBackups._execute_command")
     def test_list_backups(self, _execute_command):
         # Test when no backups are available.
@@ -761,7 +789,7 @@ class TestPostgreSQLBackups(unittest.TestCase):
         _update_config,
     ):
         # Test when the unit cannot perform a backup.
-        mock_event = MagicMock()
+        mock_event = MagicMock(params={})
         _can_unit_perform_backup.return_value = (False, "fake validation message")
         self.charm.backup._on_create_backup_action(mock_event)
         mock_event.fail.assert_called_once()
@@ -892,9 +920,37 @@ Juju Version: test-juju-version
         mock_event.fail.assert_not_called()
         mock_event.set_results.assert_called_once_with({"backup-status": "backup created"})
 
+        # Test when an invalid backup type is requested.
+        mock_event.reset_mock()
+        _execute_command.reset_mock()
+        mock_event.params = {"type": "logical"}
+        self.charm.backup._on_create_backup_action(mock_event)
+        _execute_command.assert_not_called()
+        mock_event.fail.assert_called_once()
+        mock_event.set_results.assert_not_called()
+
+        # Test an incremental backup.
+        mock_event.reset_mock()
+        mock_event.params = {"type": "incremental"}
+        self.charm.backup._on_create_backup_action(mock_event)
+        _execute_command.assert_called_once_with(
+            [
+                "pgbackrest",
+                f"--stanza={self.charm.backup.stanza_name}",
+                "--log-level-console=debug",
+                "--type=incr",
+                "backup",
+            ]
+        )
+        mock_event.fail.assert_not_called()
+        mock_event.set_results.assert_called_once_with({"backup-status": "backup created"})
+
+    @patch("charm.PostgresqlOperatorCharm.get_available_cpu_cores", return_value=8)
     @patch("charm.PostgreSQLBackups._generate_backup_list_output")
     @patch("charm.PostgreSQLBackups._are_backup_settings_ok")
-    def test_on_list_backups_action(self, _are_backup_settings_ok, _generate_backup_list_output):
+    def test_on_list_backups_action(
+        self, _are_backup_settings_ok, _generate_backup_list_output, _
+    ):
         # Test when not all backup settings are ok.
         mock_event = MagicMock()
         _are_backup_settings_ok.return_value = (False, "fake validation message")
@@ -930,7 +986,8 @@ Juju Version: test-juju-version
                 "backups": """backup-id             | backup-type  | backup-status
 ----------------------------------------------------
 2023-01-01T09:00:00Z  | physical     | failed: fake error
-2023-01-01T10:00:00Z  | physical     | finished"""
+2023-01-01T10:00:00Z  | physical     | finished""",
+                "transfer-settings": "process-max=4, compress-type=zst, repo1-bundle=y",
             }
         )
         mock_event.fail.assert_not_called()
@@ -942,12 +999,14 @@ Juju Version: test-juju-version
     @patch("charm.PostgreSQLBackups._restart_database")
     @patch("lightkube.Client.delete")
     @patch("ops.model.Container.stop")
-    @patch("charm.PostgreSQLBackups._list_backups")
+    @patch("charm.PostgreSQLBackups._get_backups")
+    @patch("charm.PostgreSQLBackups._get_repository_info")
     @patch("charm.PostgreSQLBackups._pre_restore_checks")
     def test_on_restore_action(
         self,
         _pre_restore_checks,
-        _list_backups,
+        _get_repository_info,
+        _get_backups,
         _stop,
         _delete,
         _restart_database,
@@ -961,7 +1020,7 @@ Juju Version: test-juju-version
         _pre_restore_checks.return_value = False
         self.charm.unit.status = ActiveStatus()
         self.charm.backup._on_restore_action(mock_event)
-        _list_backups.assert_not_called()
+        _get_backups.assert_not_called()
         _stop.assert_not_called()
         _delete.assert_not_called()
         _restart_database.assert_not_called()
@@ -976,10 +1035,24 @@ Juju Version: test-juju-version
         # Test when the user provides an invalid backup id.
         mock_event.params = {"backup-id": "2023-01-01T10:00:00Z"}
         _pre_restore_checks.return_value = True
-        _list_backups.return_value = {"2023-01-01T09:00:00Z": self.charm.backup.stanza_name}
+        stanza = f"{self.charm.model.name}.{self.charm.cluster_name}"
+        _get_backups.return_value = {
+            "2023-01-01T09:00:00Z": {
+                "label": "20230101-090000F",
+                "reference": None,
+                "stanza": stanza,
+            },
+            "2023-01-01T11:00:00Z": {
+                "label": "20230101-090000F_20230101-110000I",
+                "reference": "2023-01-01T10:00:00Z",
+                "stanza": stanza,
+            },
+        }
         self.charm.unit.status = ActiveStatus()
         self.charm.backup._on_restore_action(mock_event)
-        _list_backups.assert_called_once_with(show_failed=False)
+        _get_backups.assert_called_once_with(
+            show_failed=False, repository_info=_get_repository_info.return_value
+        )
         mock_event.fail.assert_called_once()
         _stop.assert_not_called()
         _delete.assert_not_called()
@@ -991,6 +1064,14 @@ Juju Version: test-juju-version
         mock_event.set_results.assert_not_called()
         self.assertNotIsInstance(self.charm.unit.status, MaintenanceStatus)
 
+        # Test when the backup is based on a failed or expired backup.
+        mock_event.reset_mock()
+        mock_event.params = {"backup-id": "2023-01-01T11:00:00Z"}
+        self.charm.backup._on_restore_action(mock_event)
+        mock_event.fail.assert_called_once()
+        _stop.assert_not_called()
+        mock_event.set_results.assert_not_called()
+
         # Test when the charm fails to stop the workload.
         mock_event.reset_mock()
         mock_event.params = {"backup-id": "2023-01-01T09:00:00Z"}
@@ -1061,7 +1142,8 @@ Juju Version: test-juju-version
             self.harness.get_relation_data(self.peer_rel_id, self.charm.app),
             {
                 "restoring-backup": "20230101-090000F",
-                "restore-stanza": f"{self.charm.model.name}.{self.charm.cluster_name}",
+                "restore-stanza": stanza,
+                "restore-type": "immediate",
             },
         )
         _create_pgdata.assert_called_once()
@@ -1081,10 +1163,23 @@ Juju Version: test-juju-version
 
         # Test when no backup id is provided.
         mock_event.reset_mock()
+        mock_event.params = {}
         _are_backup_settings_ok.return_value = (True, None)
         self.assertEqual(self.charm.backup._pre_restore_checks(mock_event), False)
         mock_event.fail.assert_called_once()
 
+        # Test when more than one restore target or an invalid target is provided.
+        for params in [
+            {"restore-to-time": "2023-01-01T09:00:00Z", "restore-to-xid": "1000"},
+            {"restore-to-time": "yesterday"},
+            {"restore-to-lsn": "3000000"},
+            {"restore-to-xid": "-1"},
+        ]:
+            mock_event.reset_mock()
+            mock_event.params = params
+            self.assertEqual(self.charm.backup._pre_restore_checks(mock_event), False)
+            mock_event.fail.assert_called_once()
+
         # Test when the workload container is not accessible yet.
         mock_event.reset_mock()
         mock_event.params = {"backup-id": "2023-01-01T09:00:00Z"}
@@ -1120,9 +1215,10 @@ Juju Version: test-juju-version
         self.assertEqual(self.charm.backup._pre_restore_checks(mock_event), True)
         mock_event.fail.assert_not_called()
 
+    @patch("charm.PostgresqlOperatorCharm.get_available_cpu_cores", return_value=8)
     @patch("ops.model.Container.push")
     @patch("charm.PostgreSQLBackups._retrieve_s3_parameters")
-    def test_render_pgbackrest_conf_file(self, _retrieve_s3_parameters, _push):
+    def test_render_pgbackrest_conf_file(self, _retrieve_s3_parameters, _push, _):
         # Set up a mock for the `open` method, set returned data to postgresql.conf template.
         with open("templates/pgbackrest.conf.j2", "r") as f:
             mock = mock_open(read_data=f.read())
@@ -1165,6 +1261,8 @@ Juju Version: test-juju-version
             stanza=self.charm.backup.stanza_name,
             storage_path=self.charm._storage_path,
             user="backup",
+            retention_full=9999999,
+            transfer_settings={"process-max": "4", "compress-type": "zst", "repo1-bundle": "y"},
         )
 
         # Patch the `open` method with our mock.
@@ -1350,6 +1448,55 @@ Juju Version: test-juju-version
         _stop.assert_not_called()
         _restart.assert_called_once()
 
+    @patch("charm.PostgreSQLBackups._construct_endpoint")
+    @patch("boto3.session.Session.resource")
+    @patch("charm.PostgreSQLBackups._retrieve_s3_parameters")
+    def test_get_wal_file_archive_time(
+        self, _retrieve_s3_parameters, _resource, _construct_endpoint
+    ):
+        wal_file = "000000010000000000000008"
+        _retrieve_s3_parameters.return_value = (
+            {
+                "bucket": "test-bucket",
+                "access-key": "test-access-key",
+                "secret-key": "test-secret-key",
+                "endpoint": "https://s3.amazonaws.com",
+                "path": "/test-path",
+                "region": "us-east-1",
+            },
+            [],
+        )
+        filter_objects = _resource.return_value.Bucket.return_value.objects.filter
+        archive_time = datetime.datetime(2023, 1, 1, 12, tzinfo=datetime.timezone.utc)
+        filter_objects.return_value = [MagicMock(last_modified=archive_time)]
+
+        # Test that the time of the WAL file S3 object is returned.
+        self.assertEqual(
+            self.charm.backup._get_wal_file_archive_time("test-stanza", "14-1", wal_file),
+            archive_time,
+        )
+        filter_objects.assert_called_once_with(
+            Prefix=f"test-path/archive/test-stanza/14-1/0000000100000000/{wal_file}"
+        )
+
+        # Test when the WAL file isn't in the S3 bucket.
+        filter_objects.return_value = []
+        self.assertIsNone(
+            self.charm.backup._get_wal_file_archive_time("test-stanza", "14-1", wal_file)
+        )
+
+        # Test when the S3 bucket can't be accessed.
+        _resource.side_effect = ValueError
+        self.assertIsNone(
+            self.charm.backup._get_wal_file_archive_time("test-stanza", "14-1", wal_file)
+        )
+
+        # Test when the S3 parameters are missing.
+        _retrieve_s3_parameters.return_value = ({}, ["bucket"])
+        self.assertIsNone(
+            self.charm.backup._get_wal_file_archive_time("test-stanza", "14-1", wal_file)
+        )
+
     @patch("tempfile.NamedTemporaryFile")
     @patch("charm.PostgreSQLBackups._construct_endpoint")
     @patch("boto3.session.Session.resource")
@@ -1402,3 +1549,425 @@ Juju Version: test-juju-version
         _resource.assert_called_once_with("s3", endpoint_url="https://s3.us-east-1.amazonaws.com")
         _named_temporary_file.assert_called_once()
         upload_file.assert_called_once_with("/tmp/test-file", "test-path/test-file.")
+
+    @patch("ops.model.Application.planned_units")
+    @patch("charm.PostgresqlOperatorCharm.is_tls_enabled", new_callable=PropertyMock)
+    def test_generate_scheduler_service(self, _is_tls_enabled, _planned_units):
+        _is_tls_enabled.return_value = True
+        _planned_units.return_value = 2
+        with self.harness.hooks_disabled():
+            self.harness.update_config(
+                {
+                    "backup-schedule-full": "0 2 * * 0",
+                    "backup-schedule-incremental": "0 */4 * * *",
+                    "backup-retention-days": 14,
+                }
+            )
+        self.assertEqual(
+            self.charm.backup.generate_scheduler_service()["command"],
+            "python3 /var/lib/postgresql/data/backup_scheduler.py"
+            f" --stanza={self.charm.backup.stanza_name} '--full=0 2 * * 0'"
+            " '--incr=0 */4 * * *' --retention-days=14"
+            " --logs-path=/var/lib/postgresql/data/backup-logs",
+        )
+
+        # Test that the backups run in the primary when TLS is not enabled or there
+        # are no replicas.
+        _is_tls_enabled.return_value = False
+        self.assertTrue(
+            self.charm.backup.generate_scheduler_service()["command"].endswith(
+                " --no-backup-standby"
+            )
+        )
+        _is_tls_enabled.return_value = True
+        _planned_units.return_value = 1
+        self.assertTrue(
+            self.charm.backup.generate_scheduler_service()["command"].endswith(
+                " --no-backup-standby"
+            )
+        )
+
+    @patch("charm.Patroni.cluster_snapshot", new_callable=PropertyMock)
+    @patch("ops.model.Application.planned_units")
+    @patch("charm.PostgresqlOperatorCharm.is_tls_enabled", new_callable=PropertyMock)
+    def test_get_backup_member(self, _is_tls_enabled, _planned_units, _cluster_snapshot):
+        _cluster_snapshot.return_value = ClusterSnapshot.from_json(
+            {
+                "members": [
+                    {"name": "postgresql-k8s-0", "role": "leader", "state": "running"},
+                    {"name": "postgresql-k8s-1", "role": "replica", "state": "starting"},
+                    {"name": "postgresql-k8s-2", "role": "sync_standby", "state": "streaming"},
+                    {"name": "postgresql-k8s-3", "role": "replica", "state": "streaming"},
+                ]
+            }
+        )
+
+        # Test that the primary creates the backups when TLS is not enabled.
+        _is_tls_enabled.return_value = False
+        _planned_units.return_value = 4
+        self.assertEqual(self.charm.backup._get_backup_member(), "postgresql-k8s-0")
+
+        # Test that the first running replica creates them when TLS is enabled.
+        _is_tls_enabled.return_value = True
+        self.assertEqual(self.charm.backup._get_backup_member(), "postgresql-k8s-2")
+
+        # Test a single unit cluster with TLS enabled.
+        _planned_units.return_value = 1
+        self.assertEqual(self.charm.backup._get_backup_member(), "postgresql-k8s-0")
+
+    @patch("ops.model.Container.stop")
+    @patch("ops.model.Container.start")
+    @patch("charm.PostgreSQLBackups._get_backup_member")
+    def test_update_backup_scheduler(self, _get_backup_member, _start, _stop):
+        # Test when the service wasn't added to the Pebble plan yet.
+        self.harness.set_can_connect("postgresql", True)
+        self.charm.backup.update_backup_scheduler()
+        _get_backup_member.assert_not_called()
+
+        # Test when there are no backup schedules.
+        container = self.charm.unit.get_container("postgresql")
+        container.add_layer("postgresql", self.charm._postgresql_layer())
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.app.name, {"stanza": self.charm.backup.stanza_name}
+            )
+        self.charm.backup.update_backup_scheduler()
+        _get_backup_member.assert_not_called()
+        _start.assert_not_called()
+        _stop.assert_not_called()
+
+        # Test when this unit isn't the one that creates the backups.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup-schedule-full": "0 2 * * 0"})
+        _get_backup_member.return_value = "postgresql-k8s-1"
+        self.charm.backup.update_backup_scheduler()
+        _start.assert_not_called()
+        _stop.assert_not_called()
+
+        # Test when the cluster members couldn't be retrieved.
+        _get_backup_member.side_effect = RetryError(last_attempt=1)
+        self.charm.backup.update_backup_scheduler()
+        _start.assert_not_called()
+
+        # Test that the script is pushed and the service is started in this unit.
+        _get_backup_member.side_effect = None
+        _get_backup_member.return_value = "postgresql-k8s-0"
+        self.charm.backup.update_backup_scheduler()
+        _start.assert_called_once_with("pgbackrest scheduler")
+        with open("src/backup_scheduler.py") as file:
+            self.assertEqual(
+                container.pull("/var/lib/postgresql/data/backup_scheduler.py").read(), file.read()
+            )
+
+        # Test that the service is stopped when another unit creates the backups.
+        container.pebble.start_services(["pgbackrest scheduler"])
+        _get_backup_member.return_value = "postgresql-k8s-1"
+        self.charm.backup.update_backup_scheduler()
+        _stop.assert_called_once_with("pgbackrest scheduler")
+
+        # Test that the service is updated and restarted when its command changes
+        # (e.g. after TLS is enabled).
+        _start.reset_mock()
+        _stop.reset_mock()
+        _get_backup_member.return_value = "postgresql-k8s-0"
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup-retention-days": 7})
+        self.charm.backup.update_backup_scheduler()
+        _stop.assert_called_once_with("pgbackrest scheduler")
+        _start.assert_called_once_with("pgbackrest scheduler")
+        self.assertIn(
+            "--retention-days=7", container.get_plan().services["pgbackrest scheduler"].command
+        )
+
+    @patch("charm.PostgreSQLBackups._upload_content_to_s3")
+    @patch("charm.PostgreSQLBackups._retrieve_s3_parameters")
+    @patch("charm.PostgreSQLBackups._are_backup_settings_ok")
+    def test_upload_scheduled_backup_logs(
+        self, _are_backup_settings_ok, _retrieve_s3_parameters, _upload_content_to_s3
+    ):
+        self.harness.set_can_connect("postgresql", True)
+        container = self.charm.unit.get_container("postgresql")
+        logs_path = "/var/lib/postgresql/data/backup-logs"
+        successful_backup_logs = "Stdout:\nINFO: new backup label = 20230101-090000F\n"
+        failed_backup_logs = "Stdout:\n\n\nStderr:\nERROR: [056]: unable to find primary\n"
+        _retrieve_s3_parameters.return_value = ({"path": "/test-path"}, [])
+
+        # Test when there are no logs to upload.
+        self.charm.backup._upload_scheduled_backup_logs()
+        _upload_content_to_s3.assert_not_called()
+
+        # Test when the backup settings aren't valid.
+        container.push(f"{logs_path}/20230101-090000.log", successful_backup_logs, make_dirs=True)
+        container.push(f"{logs_path}/20230102-090000.log", failed_backup_logs)
+        _are_backup_settings_ok.return_value = (False, "error")
+        self.charm.backup._upload_scheduled_backup_logs()
+        _upload_content_to_s3.assert_not_called()
+
+        # Test that the logs are uploaded to the backup id path and only the uploaded ones
+        # are removed from the workload container.
+        _are_backup_settings_ok.return_value = (True, None)
+        _upload_content_to_s3.side_effect = [True, False]
+        self.charm.backup._upload_scheduled_backup_logs()
+        _upload_content_to_s3.assert_has_calls(
+            [
+                call(
+                    successful_backup_logs,
+                    f"/test-path/backup/{self.charm.backup.stanza_name}/20230101-090000F/backup.log",
+                    {"path": "/test-path"},
+                ),
+                call(
+                    failed_backup_logs,
+                    f"/test-path/backup/{self.charm.backup.stanza_name}/20230102-090000F/backup.log",
+                    {"path": "/test-path"},
+                ),
+            ]
+        )
+        self.assertEqual(
+            [file.name for file in container.list_files(logs_path)], ["20230102-090000.log"]
+        )
+
+    @patch("charm.PostgresqlOperatorCharm.get_available_cpu_cores")
+    def test_get_transfer_settings(self, _get_available_cpu_cores):
+        # Test the defaults, derived from the available CPU cores.
+        _get_available_cpu_cores.return_value = 1
+        self.assertEqual(
+            self.charm.backup._get_transfer_settings(),
+            {"process-max": "1", "compress-type": "zst", "repo1-bundle": "y"},
+        )
+        _get_available_cpu_cores.return_value = 12.5
+        self.assertEqual(self.charm.backup._get_transfer_settings()["process-max"], "6")
+
+        # Test the values set through the config.
+        _get_available_cpu_cores.reset_mock()
+        with self.harness.hooks_disabled():
+            self.harness.update_config(
+                {
+                    "backup-buffer-size": "4MiB",
+                    "backup-bundle": False,
+                    "backup-compress-level": 3,
+                    "backup-compress-type": "lz4",
+                    "backup-process-max": 2,
+                }
+            )
+        self.assertEqual(
+            self.charm.backup._get_transfer_settings(),
+            {
+                "process-max": "2",
+                "compress-type": "lz4",
+                "compress-level": "3",
+                "buffer-size": "4MiB",
+                "repo1-bundle": "n",
+            },
+        )
+        _get_available_cpu_cores.assert_not_called()
+
+    def test_get_archive_lag(self):
+        # Test when pgBackRest isn't archiving the WAL files.
+        self.assertEqual(self.charm.backup.get_archive_lag(), 0)
+
+        # Test when the workload container isn't reachable.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.app.name, {"stanza": self.charm.backup.stanza_name}
+            )
+        self.assertEqual(self.charm.backup.get_archive_lag(), 0)
+
+        # Test that only the WAL files waiting to be archived are counted.
+        self.harness.set_can_connect("postgresql", True)
+        container = self.charm.unit.get_container("postgresql")
+        archive_status = "/var/lib/postgresql/data/pgdata/pg_wal/archive_status"
+        for name in ["000000010000000000000001.done", "000000010000000000000002.ready"]:
+            container.push(f"{archive_status}/{name}", "", make_dirs=True)
+        container.push(f"{archive_status}/000000010000000000000003.ready", "")
+        self.assertEqual(self.charm.backup.get_archive_lag(), 2)
+
+    @patch("charm.PostgresqlOperatorCharm.get_available_cpu_cores", return_value=4)
+    @patch("charm.PostgreSQLBackups._retrieve_s3_parameters")
+    def test_render_pgbackrest_conf_file_archive_async(self, _retrieve_s3_parameters, _):
+        _retrieve_s3_parameters.return_value = (
+            {
+                "bucket": "test-bucket",
+                "access-key": "test-access-key",
+                "secret-key": "test-secret-key",
+                "endpoint": "https://storage.googleapis.com",
+                "path": "test-path/",
+                "region": "us-east-1",
+                "s3-uri-style": "path",
+            },
+            [],
+        )
+        self.harness.set_can_connect("postgresql", True)
+        container = self.charm.unit.get_container("postgresql")
+        spool_path = "/var/lib/postgresql/data/pgbackrest-spool"
+        container.make_dir("/etc", make_parents=True)
+
+        # Test that the spool directory is created and no WAL files are dropped by default.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup-archive-async": True})
+        self.assertTrue(self.charm.backup._render_pgbackrest_conf_file())
+        self.assertTrue(container.isdir(spool_path))
+        content = container.pull("/etc/pgbackrest.conf").read()
+        self.assertIn(f"archive-async=y\nspool-path={spool_path}\n", content)
+        self.assertNotIn("archive-push-queue-max", content)
+
+        # Test the queue max set through the config.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup-archive-push-queue-max": "1GiB"})
+        self.charm.backup._render_pgbackrest_conf_file()
+        content = container.pull("/etc/pgbackrest.conf").read()
+        self.assertIn("archive-push-queue-max=1GiB\n", content)
+
+        # Test that nothing is rendered when the asynchronous archiving is disabled.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup-archive-async": False})
+        self.charm.backup._render_pgbackrest_conf_file()
+        content = container.pull("/etc/pgbackrest.conf").read()
+        self.assertNotIn("archive-async", content)
+        self.assertNotIn("archive-push-queue-max", content)
+
+    def test_parse_restore_target(self):
+        self.assertEqual(self.charm.backup._parse_restore_target({}), ("immediate", None))
+        self.assertEqual(
+            self.charm.backup._parse_restore_target({"restore-to-time": "2023-01-01T09:00:00Z"}),
+            ("time", "2023-01-01 09:00:00+00:00"),
+        )
+        self.assertEqual(
+            self.charm.backup._parse_restore_target(
+                {"restore-to-time": "2023-01-01T11:30:00.5+02:00"}
+            ),
+            ("time", "2023-01-01 09:30:00.500000+00:00"),
+        )
+        self.assertEqual(
+            self.charm.backup._parse_restore_target({"restore-to-lsn": "0/3000028"}),
+            ("lsn", "0/3000028"),
+        )
+        self.assertEqual(
+            self.charm.backup._parse_restore_target({"restore-to-xid": 1000}), ("xid", "1000")
+        )
+
+    @patch("charm.PostgreSQLBackups._get_wal_file_archive_time")
+    @patch("backups.datetime")
+    @patch("charm.PostgreSQLBackups._execute_command")
+    def test_choose_backup_to_restore(
+        self, _execute_command, _datetime, _get_wal_file_archive_time
+    ):
+        for method in ["fromisoformat", "strftime", "strptime"]:
+            getattr(_datetime, method).side_effect = getattr(datetime.datetime, method)
+        _datetime.now.return_value = datetime.datetime(2023, 1, 2, tzinfo=datetime.timezone.utc)
+        _get_wal_file_archive_time.return_value = datetime.datetime(
+            2023, 1, 1, 12, tzinfo=datetime.timezone.utc
+        )
+        repository_info = {
+            "name": "test-stanza",
+            "archive": [
+                {
+                    "id": "14-1",
+                    "min": "000000010000000000000001",
+                    "max": "000000010000000000000008",
+                }
+            ],
+            "backup": [
+                {
+                    "label": "20230101-090000F",
+                    "type": "full",
+                    "prior": None,
+                    "error": None,
+                    # 2023-01-01T09:01:00Z
+                    "timestamp": {"start": 1672563600, "stop": 1672563660},
+                    "lsn": {"start": "0/2000028", "stop": "0/2000100"},
+                    "archive": {
+                        "start": "000000010000000000000002",
+                        "stop": "000000010000000000000002",
+                    },
+                },
+                {
+                    "label": "20230101-090000F_20230101-100000I",
+                    "type": "incr",
+                    "prior": "20230101-090000F",
+                    "error": None,
+                    # 2023-01-01T10:01:00Z
+                    "timestamp": {"start": 1672567200, "stop": 1672567260},
+                    "lsn": {"start": "0/5000028", "stop": "0/5000100"},
+                    "archive": {
+                        "start": "000000010000000000000005",
+                        "stop": "000000010000000000000005",
+                    },
+                },
+            ],
+        }
+        choose = self.charm.backup._choose_backup_to_restore
+
+        # Test a restore of a backup without a target.
+        self.assertEqual(
+            choose("2023-01-01T10:00:00Z", "immediate", None, repository_info),
+            ("2023-01-01T10:00:00Z", None),
+        )
+        self.assertEqual(
+            choose("2023-01-01T11:00:00Z", "immediate", None, repository_info),
+            (None, "Invalid backup-id: 2023-01-01T11:00:00Z"),
+        )
+
+        # Test that the latest backup finished before the target is chosen.
+        self.assertEqual(
+            choose(None, "time", "2023-01-01 10:30:00+00:00", repository_info),
+            ("2023-01-01T10:00:00Z", None),
+        )
+        _get_wal_file_archive_time.assert_called_once_with(
+            "test-stanza", "14-1", "000000010000000000000008"
+        )
+        # Test that the archive time isn't needed when a later backup proves the target
+        # was archived.
+        _get_wal_file_archive_time.reset_mock()
+        self.assertEqual(
+            choose(None, "time", "2023-01-01 10:00:30+00:00", repository_info),
+            ("2023-01-01T09:00:00Z", None),
+        )
+        _get_wal_file_archive_time.assert_not_called()
+        self.assertEqual(
+            choose(None, "lsn", "0/4000000", repository_info)[0], "2023-01-01T09:00:00Z"
+        )
+        self.assertEqual(choose(None, "xid", "1000", repository_info)[0], "2023-01-01T10:00:00Z")
+
+        # Test targets before the first backup.
+        self.assertIsNone(choose(None, "time", "2023-01-01 09:00:30+00:00", repository_info)[0])
+        self.assertIsNone(choose("2023-01-01T10:00:00Z", "lsn", "0/4000000", repository_info)[0])
+
+        # Test targets after the archived WAL files.
+        self.assertEqual(
+            choose(None, "time", "2023-01-03 00:00:00+00:00", repository_info),
+            (None, "Restore target time 2023-01-03 00:00:00+00:00 is in the future"),
+        )
+        self.assertEqual(
+            choose(None, "time", "2023-01-01 13:00:00+00:00", repository_info),
+            (
+                None,
+                "Restore target time 2023-01-01 13:00:00+00:00 is after the last archived WAL"
+                " file (000000010000000000000008, archived at 2023-01-01 12:00:00+00:00)",
+            ),
+        )
+        _get_wal_file_archive_time.return_value = None
+        self.assertEqual(
+            choose(None, "time", "2023-01-01 11:00:00+00:00", repository_info),
+            (
+                None,
+                "Failed to check that the WAL files up to 2023-01-01 11:00:00+00:00"
+                " were archived",
+            ),
+        )
+        self.assertEqual(choose(None, "lsn", "0/8FFFFFF", repository_info)[1], None)
+        self.assertEqual(
+            choose(None, "lsn", "0/9000000", repository_info),
+            (
+                None,
+                "Restore target LSN 0/9000000 is after the last archived WAL file"
+                " (000000010000000000000008)",
+            ),
+        )
+
+        # Test when the WAL files after the backup weren't archived.
+        repository_info["archive"][0]["max"] = "000000010000000000000004"
+        self.assertEqual(
+            choose(None, "xid", "1000", repository_info),
+            (None, "The WAL files needed to restore the backup weren't archived"),
+        )
+        _execute_command.assert_not_called()
@@ -1,10 +1,14 @@
 # Copyright 2021 Canonical Ltd.
 # See LICENSE file for licensing details.
 
+import os
 import unittest
-from unittest.mock import MagicMock, Mock, PropertyMock, patch
+from unittest.mock import MagicMock, Mock, PropertyMock, call, patch
 
-from charms.postgresql_k8s.v0.postgresql import PostgreSQLUpdateUserPasswordError
+from charms.postgresql_k8s.v0.postgresql import (
+    PostgreSQLInvalidParameterError,
+    PostgreSQLUpdateUserPasswordError,
+)
 from lightkube.resources.core_v1 import Endpoints, Pod, Service
 from ops.model import (
     ActiveStatus,
@@ -17,7 +21,7 @@ from ops.pebble import ServiceStatus
 from ops.testing import Harness
 from tenacity import RetryError
 
-from charm import PostgresqlOperatorCharm
+from charm import PostgresqlOperatorCharm, _emit_hook_profile
 from constants import (
     PEER,
     SECRET_CACHE_LABEL,
@@ -25,6 +29,7 @@ from constants import (
     SECRET_INTERNAL_LABEL,
     SECRET_LABEL,
 )
+from patroni import ClusterSnapshot
 from tests.helpers import patch_network_get
 from tests.unit.helpers import _FakeApiError
 
@@ -272,8 +277,10 @@ class TestCharm(unittest.TestCase):
     @patch("charm.Patroni.get_primary")
     @patch("ops.model.Container.pebble")
     @patch("upgrade.PostgreSQLUpgrade.idle", return_value="idle")
+    @patch("charm.PostgresqlOperatorCharm._refresh_storage_size")
     def test_on_update_status(
         self,
+        _refresh_storage_size,
         _,
         _pebble,
         _get_primary,
@@ -325,8 +332,9 @@ class TestCharm(unittest.TestCase):
     @patch("charm.Patroni.get_primary")
     @patch("ops.model.Container.pebble")
     @patch("upgrade.PostgreSQLUpgrade.idle", return_value=True)
+    @patch("charm.PostgresqlOperatorCharm._refresh_storage_size")
     def test_on_update_status_with_error_on_get_primary(
-        self, _, _pebble, _get_primary, _member_started
+        self, _refresh_storage_size, _, _pebble, _get_primary, _member_started
     ):
         # Mock the access to the list of Pebble services.
         _pebble.get_services.return_value = ["service data"]
@@ -348,8 +356,10 @@ class TestCharm(unittest.TestCase):
     @patch("charm.Patroni.member_started", new_callable=PropertyMock)
     @patch("ops.model.Container.pebble")
     @patch("upgrade.PostgreSQLUpgrade.idle", return_value=True)
+    @patch("charm.PostgresqlOperatorCharm._refresh_storage_size")
     def test_on_update_status_after_restore_operation(
         self,
+        _refresh_storage_size,
         _,
         _pebble,
         _member_started,
@@ -467,6 +477,32 @@ class TestCharm(unittest.TestCase):
             res=Pod, name="postgresql-k8s-0", namespace=self.charm.model.name
         )
         self.assertEqual(_client.return_value.apply.call_count, 2)
+        replicas_service = _client.return_value.apply.call_args_list[1].kwargs["obj"]
+        self.assertEqual(replicas_service.spec.selector["role"], "replica")
+        self.assertNotIn("read-eligible", replicas_service.spec.selector)
+        self.assertEqual([port.name for port in replicas_service.spec.ports], ["api", "database"])
+
+        # Test that the replicas service selects the read-eligible pods
+        # when the lag-aware routing is enabled.
+        _client.reset_mock()
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"read-only-lag-aware-routing": True})
+        self.charm._create_services()
+        primary_service = _client.return_value.apply.call_args_list[0].kwargs["obj"]
+        self.assertNotIn("read-eligible", primary_service.spec.selector)
+        replicas_service = _client.return_value.apply.call_args_list[1].kwargs["obj"]
+        self.assertEqual(replicas_service.spec.selector["read-eligible"], "true")
+
+        # Test that the PgBouncer port is published only when PgBouncer is enabled.
+        _client.reset_mock()
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"pgbouncer-enabled": True})
+        self.charm._create_services()
+        for apply_call in _client.return_value.apply.call_args_list:
+            self.assertEqual(
+                [port.name for port in apply_call.kwargs["obj"].spec.ports],
+                ["api", "database", "pgbouncer"],
+            )
 
         # Test when the charm fails to get first pod info.
         _client.reset_mock()
@@ -507,6 +543,106 @@ class TestCharm(unittest.TestCase):
             obj=expected_patch,
         )
 
+    @patch("charm.Patroni.cluster_snapshot", new_callable=PropertyMock)
+    @patch("charm.Client")
+    def test_update_read_eligible_labels(self, _client, _cluster_snapshot):
+        def pod(name, label=None):
+            return MagicMock(
+                metadata=MagicMock(labels={"read-eligible": label} if label else {}),
+                **{"metadata.name": name},
+            )
+
+        _cluster_snapshot.return_value = ClusterSnapshot.from_json(
+            {
+                "members": [
+                    {"name": "postgresql-k8s-0", "role": "leader", "state": "running"},
+                    {
+                        "name": "postgresql-k8s-1",
+                        "role": "replica",
+                        "state": "streaming",
+                        "lag": 0,
+                    },
+                    {
+                        "name": "postgresql-k8s-2",
+                        "role": "sync_standby",
+                        "state": "streaming",
+                        "lag": 2097152,
+                    },
+                    {
+                        "name": "postgresql-k8s-3",
+                        "role": "replica",
+                        "state": "starting",
+                        "lag": "unknown",
+                    },
+                ]
+            }
+        )
+        _client.return_value.list.return_value = [
+            pod("postgresql-k8s-0"),
+            pod("postgresql-k8s-1"),
+            pod("postgresql-k8s-2", "true"),
+            pod("postgresql-k8s-3", "false"),
+        ]
+
+        # Test that nothing is done when the lag-aware routing is disabled.
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+        self.charm._update_read_eligible_labels()
+        _client.return_value.list.assert_not_called()
+
+        # Test that only the pods whose label value changes are patched.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"read-only-lag-aware-routing": True})
+        self.charm._update_read_eligible_labels()
+        _client.return_value.list.assert_called_once_with(
+            Pod, namespace=self.charm._namespace, labels={"cluster-name": "patroni-postgresql-k8s"}
+        )
+        self.assertEqual(
+            _client.return_value.patch.call_args_list,
+            [
+                call(
+                    Pod,
+                    name=name,
+                    namespace=self.charm._namespace,
+                    obj={"metadata": {"labels": {"read-eligible": label}}},
+                )
+                for name, label in [
+                    ("postgresql-k8s-0", "true"),
+                    ("postgresql-k8s-1", "true"),
+                    ("postgresql-k8s-2", "false"),
+                ]
+            ],
+        )
+
+        # Test that all the running replicas are eligible when all of them are lagging.
+        _client.return_value.patch.reset_mock()
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"read-only-max-lag": 0})
+        _cluster_snapshot.return_value.members[1].lag = 1
+        self.charm._update_read_eligible_labels()
+        self.assertEqual(
+            [
+                (call.kwargs["name"], call.kwargs["obj"]["metadata"]["labels"]["read-eligible"])
+                for call in _client.return_value.patch.call_args_list
+            ],
+            [("postgresql-k8s-0", "true"), ("postgresql-k8s-1", "true")],
+        )
+
+        # Test that the other units only label their own pod.
+        _client.return_value.list.reset_mock()
+        _client.return_value.patch.reset_mock()
+        _client.return_value.get.return_value = pod("postgresql-k8s-0", "false")
+        with self.harness.hooks_disabled():
+            self.harness.set_leader(False)
+        self.charm._update_read_eligible_labels()
+        _client.return_value.list.assert_not_called()
+        _client.return_value.patch.assert_called_once_with(
+            Pod,
+            name="postgresql-k8s-0",
+            namespace=self.charm._namespace,
+            obj={"metadata": {"labels": {"read-eligible": "true"}}},
+        )
+
     @patch("charm.Patroni.reload_patroni_configuration")
     @patch("charm.PostgresqlOperatorCharm._patch_pod_labels")
     @patch("charm.PostgresqlOperatorCharm._create_services")
@@ -559,6 +695,25 @@ class TestCharm(unittest.TestCase):
                     "user": "postgres",
                     "group": "postgres",
                 },
+                "pgbackrest scheduler": {
+                    "override": "replace",
+                    "summary": "pgBackRest scheduled backups",
+                    "command": "python3 /var/lib/postgresql/data/backup_scheduler.py"
+                    f" --stanza={self.charm.backup.stanza_name}"
+                    " --logs-path=/var/lib/postgresql/data/backup-logs --no-backup-standby",
+                    "startup": "disabled",
+                    "user": "postgres",
+                    "group": "postgres",
+                },
+                "pgbouncer": {
+                    "override": "replace",
+                    "summary": "pgbouncer connection pooler",
+                    "command": "pgbouncer /var/lib/postgresql/data/pgbouncer.ini",
+                    "startup": "disabled",
+                    "after": [self._postgresql_service],
+                    "user": "postgres",
+                    "group": "postgres",
+                },
             },
             "checks": {
                 self._postgresql_service: {
@@ -572,6 +727,567 @@ class TestCharm(unittest.TestCase):
         }
         self.assertDictEqual(plan, expected)
 
+    @patch("charm.PostgresqlOperatorCharm._generate_metrics_service")
+    @patch("ops.model.Container.get_plan")
+    @patch("upgrade.PostgreSQLUpgrade.is_no_sync_member", new_callable=PropertyMock)
+    @patch("charm.Patroni.reload_patroni_configuration")
+    @patch("charm.Patroni.member_started", new_callable=PropertyMock, return_value=True)
+    @patch(
+        "charm.PostgresqlOperatorCharm._is_workload_running",
+        new_callable=PropertyMock,
+        return_value=True,
+    )
+    @patch("charm.Patroni.render_patroni_yml_file", return_value="first-hash")
+    @patch(
+        "charm.PostgresqlOperatorCharm._get_resources_budget",
+        return_value={"memory": 10**9, "cpu": 2, "storage": 10**10},
+    )
+    @patch("charm.PostgresqlOperatorCharm.postgresql")
+    def test_update_config(
+        self,
+        _postgresql,
+        _,
+        _render_patroni_yml_file,
+        __,
+        ___,
+        _reload_patroni_configuration,
+        ____,
+        _____,
+        ______,
+    ):
+        _postgresql.is_tls_enabled.return_value = False
+        _postgresql.is_restart_pending.return_value = False
+        _postgresql.build_postgresql_parameters.side_effect = lambda *args, **kwargs: {
+            "shared_buffers": "128MB"
+        }
+
+        # Test that Patroni is reloaded after its configuration changes.
+        self.assertTrue(self.charm.update_config())
+        _reload_patroni_configuration.assert_called_once()
+        _postgresql.build_postgresql_parameters.assert_called_once_with(
+            "production",
+            10**9,
+            None,
+            available_cpu_cores=2,
+            storage_size=10**10,
+            workload_type="mixed",
+        )
+        self.assertEqual(self.charm._stored.patroni_config_hash, "first-hash")
+        # Test that the hash is kept in the local unit state instead of the peer relation.
+        self.assertNotIn(
+            "patroni-config-hash",
+            self.harness.get_relation_data(self.rel_id, self.charm.unit.name),
+        )
+
+        # Test that Patroni is not reloaded again when nothing changed.
+        _reload_patroni_configuration.reset_mock()
+        self.assertTrue(self.charm.update_config())
+        _reload_patroni_configuration.assert_not_called()
+
+        # Test that Patroni is reloaded when the configuration changes again.
+        _render_patroni_yml_file.return_value = "second-hash"
+        self.assertTrue(self.charm.update_config())
+        _reload_patroni_configuration.assert_called_once()
+
+        # Test that PostgreSQL is restarted only when a changed parameter needs it.
+        with patch(
+            "charms.rolling_ops.v0.rollingops.RollingOpsManager._on_acquire_lock"
+        ) as _on_acquire_lock:
+            _postgresql.get_parameters_context.return_value = {"work_mem": "user"}
+            with self.harness.hooks_disabled():
+                self.harness.update_config({"parameters": '{"work_mem": "64MB"}'})
+            _render_patroni_yml_file.return_value = "third-hash"
+            self.assertTrue(self.charm.update_config())
+            _postgresql.validate_parameters.assert_called_once_with({"work_mem": "64MB"})
+            _postgresql.get_parameters_context.assert_called_once_with(["work_mem"])
+            _on_acquire_lock.assert_not_called()
+
+            # Test that a parameter that Patroni only takes from the dynamic configuration
+            # is applied through it by the leader, which then requests the restart.
+            _postgresql.get_parameters_context.return_value = {"max_connections": "postmaster"}
+            with self.harness.hooks_disabled():
+                self.harness.set_leader()
+                self.harness.update_config({"parameters": '{"max_connections": "200"}'})
+            _render_patroni_yml_file.return_value = "fourth-hash"
+            with patch(
+                "charm.Patroni.update_dynamic_configuration"
+            ) as _update_dynamic_configuration, patch(
+                "charm.PostgresqlOperatorCharm._update_synchronous_settings"
+            ):
+                self.assertTrue(self.charm.update_config())
+            _update_dynamic_configuration.assert_called_once_with(
+                {"postgresql": {"parameters": {"max_connections": "200"}}}
+            )
+            self.assertEqual(
+                _render_patroni_yml_file.call_args.kwargs["parameters"]["max_connections"], "200"
+            )
+            _on_acquire_lock.assert_called_once()
+            with self.harness.hooks_disabled():
+                self.harness.set_leader(False)
+
+            # Test that PostgreSQL is restarted when the leader changes a parameter
+            # that Patroni only takes from the dynamic configuration.
+            _on_acquire_lock.reset_mock()
+            _postgresql.get_parameters_context.reset_mock()
+            _postgresql.get_parameters_context.return_value = {
+                "max_worker_processes": "postmaster"
+            }
+            with self.harness.hooks_disabled():
+                self.harness.update_relation_data(
+                    self.rel_id,
+                    self.charm.app.name,
+                    {"dcs-parameters": '{"max_connections": "200", "max_worker_processes": "12"}'},
+                )
+            self.assertTrue(self.charm.update_config())
+            _postgresql.get_parameters_context.assert_called_once_with(["max_worker_processes"])
+            _on_acquire_lock.assert_called_once()
+
+    @patch("charm.Patroni.update_dynamic_configuration")
+    @patch("charm.PostgresqlOperatorCharm._update_synchronous_settings")
+    @patch("charm.PostgresqlOperatorCharm._generate_metrics_service")
+    @patch("ops.model.Container.get_plan")
+    @patch("upgrade.PostgreSQLUpgrade.is_no_sync_member", new_callable=PropertyMock)
+    @patch("charm.Patroni.reload_patroni_configuration")
+    @patch("charm.Patroni.member_started", new_callable=PropertyMock, return_value=True)
+    @patch(
+        "charm.PostgresqlOperatorCharm._is_workload_running",
+        new_callable=PropertyMock,
+        return_value=True,
+    )
+    @patch("charm.Patroni.render_patroni_yml_file", return_value="hash")
+    @patch("charm.PostgresqlOperatorCharm._get_resources_budget")
+    @patch("charm.PostgresqlOperatorCharm.postgresql")
+    def test_update_config_after_pod_rescheduling(
+        self,
+        _postgresql,
+        _get_resources_budget,
+        _,
+        __,
+        ___,
+        ____,
+        _____,
+        ______,
+        _______,
+        ________,
+        _update_dynamic_configuration,
+    ):
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+        _postgresql.is_tls_enabled.return_value = False
+        _postgresql.is_restart_pending.return_value = False
+        _postgresql.get_parameters_context.return_value = {"max_worker_processes": "postmaster"}
+        _postgresql.build_postgresql_parameters.side_effect = (
+            lambda *args, available_cpu_cores, **kwargs: {
+                "max_worker_processes": str(available_cpu_cores + 4),
+                "max_parallel_workers": str(available_cpu_cores),
+            }
+        )
+        _get_resources_budget.return_value = {"memory": 10**9, "cpu": 4, "storage": 10**10}
+        with patch(
+            "charms.rolling_ops.v0.rollingops.RollingOpsManager._on_acquire_lock"
+        ) as _on_acquire_lock:
+            self.assertTrue(self.charm.update_config())
+            _update_dynamic_configuration.assert_called_once_with(
+                {"postgresql": {"parameters": {"max_worker_processes": "8"}}}
+            )
+            _on_acquire_lock.assert_not_called()
+
+            # Test that the leader re-tunes max_worker_processes for the whole cluster
+            # and requests a restart after its pod is rescheduled with more CPU cores.
+            _update_dynamic_configuration.reset_mock()
+            _get_resources_budget.return_value = {
+                "memory": 10**9,
+                "cpu": 16,
+                "storage": 10**10,
+            }
+            self.assertTrue(self.charm.update_config())
+            _update_dynamic_configuration.assert_called_once_with(
+                {"postgresql": {"parameters": {"max_worker_processes": "20"}}}
+            )
+            self.assertEqual(
+                sorted(_postgresql.get_parameters_context.call_args.args[0]),
+                ["max_parallel_workers", "max_worker_processes"],
+            )
+            _on_acquire_lock.assert_called_once()
+
+    def test_limit_parallel_workers(self):
+        # Test that the parameters are kept when there is no max_worker_processes.
+        parameters = {"max_parallel_workers": "16"}
+        self.charm._limit_parallel_workers(parameters)
+        self.assertEqual(parameters, {"max_parallel_workers": "16"})
+
+        # Test that the parallel workers are kept within the max_worker_processes
+        # set by the leader for the whole cluster.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.rel_id,
+                self.charm.app.name,
+                {"dcs-parameters": '{"max_worker_processes": "8"}'},
+            )
+        parameters = {"max_worker_processes": "20", "max_parallel_workers": "16"}
+        self.charm._limit_parallel_workers(parameters)
+        self.assertEqual(parameters, {"max_worker_processes": "20", "max_parallel_workers": "8"})
+
+        parameters = {"max_worker_processes": "8", "max_parallel_workers": "4"}
+        self.charm._limit_parallel_workers(parameters)
+        self.assertEqual(parameters, {"max_worker_processes": "8", "max_parallel_workers": "4"})
+
+        # Test that the leader keeps its own parameters.
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+        parameters = {"max_worker_processes": "20", "max_parallel_workers": "16"}
+        self.charm._limit_parallel_workers(parameters)
+        self.assertEqual(parameters, {"max_worker_processes": "20", "max_parallel_workers": "16"})
+
+    @patch("charm.PostgresqlOperatorCharm.is_tls_enabled", new_callable=PropertyMock)
+    @patch("charm.PostgresqlOperatorCharm.get_secret")
+    def test_update_pgbouncer_config(self, _get_secret, _is_tls_enabled):
+        _get_secret.return_value = '"relation_id_2" "password"\n'
+        _is_tls_enabled.return_value = False
+        self.harness.set_can_connect(self._postgresql_container, True)
+        container = self.charm.unit.get_container(self._postgresql_container)
+
+        # Test that nothing is rendered when PgBouncer is disabled.
+        self.charm._update_pgbouncer_config()
+        self.assertFalse(container.exists("/var/lib/postgresql/data/pgbouncer.ini"))
+
+        # Test that the configuration and user list are rendered when PgBouncer is enabled.
+        with self.harness.hooks_disabled():
+            self.harness.update_config(
+                {"pgbouncer-enabled": True, "pgbouncer-pool-mode": "session"}
+            )
+        self.charm._update_pgbouncer_config()
+        config = container.pull("/var/lib/postgresql/data/pgbouncer.ini").read()
+        self.assertIn("listen_port = 6432", config)
+        self.assertIn("pool_mode = session", config)
+        self.assertIn("default_pool_size = 20", config)
+        self.assertNotIn("client_tls_sslmode", config)
+        self.assertEqual(
+            container.pull("/var/lib/postgresql/data/pgbouncer-userlist.txt").read(),
+            '"relation_id_2" "password"\n',
+        )
+
+        # Test that the files are not pushed again when nothing changed.
+        with patch("ops.model.Container.push") as _push:
+            self.charm._update_pgbouncer_config()
+            _push.assert_not_called()
+
+            # Test that the files are pushed again when the user list changes.
+            _get_secret.return_value = '"relation_id_3" "password"\n'
+            self.charm._update_pgbouncer_config()
+            self.assertEqual(_push.call_count, 2)
+
+    @patch("charm.Patroni.update_dynamic_configuration")
+    def test_update_synchronous_settings(self, _update_dynamic_configuration):
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+            self.harness.update_config(
+                {"synchronous-mode": "sync", "synchronous-commit": "remote_write"}
+            )
+
+        # Test that the settings are applied only when they change.
+        self.charm._update_synchronous_settings()
+        settings = _update_dynamic_configuration.call_args.args[0]
+        self.assertTrue(settings["synchronous_mode"])
+        self.assertEqual(
+            settings["postgresql"]["parameters"]["synchronous_commit"], "remote_write"
+        )
+        self.charm._update_synchronous_settings()
+        _update_dynamic_configuration.assert_called_once()
+
+        # Test that the settings are applied again in the next hook if the request fails.
+        _update_dynamic_configuration.reset_mock()
+        _update_dynamic_configuration.side_effect = RetryError(last_attempt=None)
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"synchronous-mode": "async"})
+        self.charm._update_synchronous_settings()
+        _update_dynamic_configuration.side_effect = None
+        self.charm._update_synchronous_settings()
+        self.assertEqual(_update_dynamic_configuration.call_count, 2)
+        self.assertFalse(_update_dynamic_configuration.call_args.args[0]["synchronous_mode"])
+
+    @patch("charm.Patroni.update_dynamic_configuration")
+    def test_update_dcs_parameters(self, _update_dynamic_configuration):
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+
+        # Test that the parameters are applied only when they change.
+        self.charm._update_dcs_parameters({"max_worker_processes": "12"})
+        self.charm._update_dcs_parameters({"max_worker_processes": "12"})
+        _update_dynamic_configuration.assert_called_once_with(
+            {"postgresql": {"parameters": {"max_worker_processes": "12"}}}
+        )
+        self.assertEqual(
+            self.charm._get_cluster_dcs_parameters({}), {"max_worker_processes": "12"}
+        )
+
+        # Test that the parameters that aren't set anymore are removed.
+        _update_dynamic_configuration.reset_mock()
+        self.charm._update_dcs_parameters({"max_connections": "200"})
+        _update_dynamic_configuration.assert_called_once_with(
+            {
+                "postgresql": {
+                    "parameters": {"max_worker_processes": None, "max_connections": "200"}
+                }
+            }
+        )
+
+        # Test that the parameters are applied again in the next hook if the request fails.
+        _update_dynamic_configuration.reset_mock()
+        _update_dynamic_configuration.side_effect = RetryError(last_attempt=None)
+        self.charm._update_dcs_parameters({})
+        self.assertEqual(self.charm._get_cluster_dcs_parameters({}), {"max_connections": "200"})
+        _update_dynamic_configuration.side_effect = None
+        self.charm._update_dcs_parameters({})
+        self.assertEqual(_update_dynamic_configuration.call_count, 2)
+        self.assertEqual(self.charm._get_cluster_dcs_parameters({"wal_log_hints": "on"}), {})
+
+    @patch("charm.PostgresqlOperatorCharm.postgresql")
+    def test_get_user_parameters(self, _postgresql):
+        # Test that no parameters are returned when they're not set.
+        self.assertEqual(self.charm._get_user_parameters(), {})
+        _postgresql.validate_parameters.assert_not_called()
+
+        # Test that the parameters are returned after they're validated.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"parameters": '{"WORK_MEM": "64MB", "jit": false}'})
+        self.assertEqual(self.charm._get_user_parameters(), {"work_mem": "64MB", "jit": "off"})
+        _postgresql.validate_parameters.assert_called_once_with({"work_mem": "64MB", "jit": "off"})
+
+        # Test that the same parameters are not validated again.
+        _postgresql.validate_parameters.reset_mock()
+        self.assertEqual(self.charm._get_user_parameters(), {"work_mem": "64MB", "jit": "off"})
+        _postgresql.validate_parameters.assert_not_called()
+
+        # Test that the last valid parameters are kept when the new ones are invalid.
+        _postgresql.validate_parameters.side_effect = PostgreSQLInvalidParameterError(
+            "invalid value 1TB for work_mem"
+        )
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"parameters": '{"work_mem": "1TB"}'})
+        self.assertEqual(self.charm._get_user_parameters(), {"work_mem": "64MB", "jit": "off"})
+        self.assertIsInstance(self.charm.unit.status, BlockedStatus)
+
+        # Test that the unit is unblocked when the parameters are fixed.
+        _postgresql.validate_parameters.side_effect = None
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"parameters": '{"work_mem": "128MB"}'})
+        self.assertEqual(self.charm._get_user_parameters(), {"work_mem": "128MB"})
+        self.assertIsInstance(self.charm.unit.status, ActiveStatus)
+
+    @patch("charm.PostgreSQL")
+    @patch("charm.Patroni")
+    def test_cached_objects(self, _patroni, _postgresql):
+        # Test that the objects are built only once during the hook execution.
+        self.assertIs(self.charm._patroni, self.charm._patroni)
+        self.assertIs(self.charm.postgresql, self.charm.postgresql)
+        _patroni.assert_called_once()
+        _postgresql.assert_called_once()
+
+        # Test that changing a password discards the cached objects.
+        self.charm.set_secret("app", "operator-password", "new-password")
+        _postgresql.return_value.close_all.assert_called_once()
+        self.charm._patroni
+        self.charm.postgresql
+        self.assertEqual(_patroni.call_count, 2)
+        self.assertEqual(_postgresql.call_count, 2)
+
+        # Test that updating the endpoints also discards them.
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+        self.charm._update_endpoints()
+        self.charm._patroni
+        self.assertEqual(_patroni.call_count, 3)
+        self.assertEqual(self.charm._hook_counters["Patroni objects"], 3)
+
+    @patch("charm.PostgreSQLBackups.get_archive_lag")
+    @patch("charm.Patroni.member_started", new_callable=PropertyMock)
+    @patch("charm.Patroni.get_primary")
+    def test_set_primary_status_message(self, _get_primary, _member_started, _get_archive_lag):
+        # Test the primary status message.
+        _get_primary.return_value = self.charm.unit.name
+        _get_archive_lag.return_value = 63
+        self.charm._set_primary_status_message()
+        self.assertEqual(self.charm.unit.status, ActiveStatus("Primary"))
+
+        # Test that a growing WAL archiving queue is reported.
+        _get_archive_lag.return_value = 64
+        self.charm._set_primary_status_message()
+        self.assertEqual(
+            self.charm.unit.status,
+            ActiveStatus("Primary (WAL archiving lagging: 64 files pending)"),
+        )
+
+        # Test a replica.
+        _get_archive_lag.reset_mock()
+        _get_primary.return_value = "postgresql-k8s/1"
+        _member_started.return_value = True
+        self.charm._set_primary_status_message()
+        self.assertEqual(self.charm.unit.status, ActiveStatus())
+        _get_archive_lag.assert_not_called()
+
+    @patch("charm.PostgreSQL")
+    def test_on_commit(self, _postgresql):
+        self.charm.postgresql
+        self.charm._on_commit(Mock())
+        _postgresql.return_value.close_all.assert_called_once()
+
+    @patch("charm.tracer")
+    def test_emit_hook_profile(self, _tracer):
+        _tracer.summary.return_value = "summary"
+        with patch.dict(
+            os.environ,
+            {
+                "JUJU_DISPATCH_PATH": "hooks/update-status",
+                "JUJU_CHARM_DIR": "/var/lib/juju/agents/unit-postgresql-k8s-0/charm/",
+            },
+        ), self.assertLogs("charm", "INFO") as logs:
+            _emit_hook_profile()
+        self.assertIn("Hook hooks/update-status profile: summary", logs.output[0])
+        _tracer.save_profile.assert_called_once_with(
+            "/var/lib/juju/agents/unit-postgresql-k8s-0/state/.hook-profiles.json",
+            "hooks/update-status",
+            counters=_tracer.counters,
+        )
+
+        # Test that the profile is only logged when the charm directory is unknown.
+        _tracer.save_profile.reset_mock()
+        with patch.dict(os.environ, clear=True), self.assertLogs("charm", "INFO"):
+            _emit_hook_profile()
+        _tracer.save_profile.assert_not_called()
+
+    @patch("charm.Client")
+    def test_get_available_memory(self, _client):
+        pod = _client.return_value.get.return_value
+        pod.metadata.uid = "first-uid"
+        pod.spec.nodeName = "node"
+        container = MagicMock()
+        container.name = "postgresql"
+        container.resources.limits = {"memory": "1Gi", "cpu": "500m"}
+        pod.spec.containers = [container]
+        pod.status.allocatable = {"memory": "2Gi", "cpu": "4"}
+
+        # Test that the container limits constrain the node resources.
+        self.assertEqual(self.charm.get_available_memory(), 1073741824)
+        self.assertEqual(self.charm.get_available_cpu_cores(), 0.5)
+        _client.assert_called_once()
+        # The pod is fetched only once, as well as the node.
+        self.assertEqual(_client.return_value.get.call_count, 2)
+        self.assertEqual(self.charm._stored.resources_budget["pod-uid"], "first-uid")
+        self.assertNotIn(
+            "resources-budget", self.harness.get_relation_data(self.rel_id, self.charm.unit.name)
+        )
+
+        # Test that the node is not queried again while the pod is the same.
+        self.charm._cached_pod = None
+        self.assertEqual(self.charm.get_available_memory(), 1073741824)
+        self.assertEqual(_client.return_value.get.call_count, 3)
+
+        # Test that the resources are read again when the pod is recreated.
+        self.charm._cached_pod = None
+        pod.metadata.uid = "second-uid"
+        container.resources.limits = {}
+        container.resources.requests = {}
+        self.assertEqual(self.charm.get_available_memory(), 2147483648)
+        self.assertEqual(self.charm.get_available_cpu_cores(), 4)
+        self.assertEqual(_client.return_value.get.call_count, 5)
+
+        # Test that the CPU request is used when there is no CPU limit.
+        self.charm._cached_pod = None
+        pod.metadata.uid = "third-uid"
+        container.resources.requests = {"cpu": "2"}
+        self.assertEqual(self.charm.get_available_cpu_cores(), 2)
+
+    @patch("charm.PostgresqlOperatorCharm.reconcile_client_relations")
+    @patch("charm.PostgresqlOperatorCharm.enable_disable_extensions")
+    @patch("charm.PostgresqlOperatorCharm._create_services")
+    @patch("charm.PostgresqlOperatorCharm._update_read_eligible_labels")
+    @patch("charm.PostgresqlOperatorCharm._refresh_storage_size")
+    @patch("charm.PostgresqlOperatorCharm.update_config")
+    @patch("upgrade.PostgreSQLUpgrade.idle", return_value=True)
+    def test_on_config_changed(
+        self, _, __, ___, ____, _create_services, ______, _reconcile_client_relations
+    ):
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+            self.harness.update_relation_data(
+                self.rel_id, self.charm.app.name, {"cluster_initialised": "True"}
+            )
+
+        # Test that the client relations are reconciled only when the options
+        # that affect them change.
+        self.charm._on_config_changed(None)
+        _reconcile_client_relations.assert_called_once()
+        self.charm._on_config_changed(None)
+        _reconcile_client_relations.assert_called_once()
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"plugin_citext_enable": True})
+        self.charm._on_config_changed(None)
+        self.assertEqual(_reconcile_client_relations.call_count, 2)
+
+        # Test that they are reconciled again when the previous pass failed
+        # or the charm is blocked by the extensions requested through a relation.
+        _reconcile_client_relations.reset_mock()
+        _reconcile_client_relations.return_value = False
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"pgbouncer-enabled": True})
+        self.charm._on_config_changed(None)
+        self.charm._on_config_changed(None)
+        self.assertEqual(_reconcile_client_relations.call_count, 2)
+        _reconcile_client_relations.return_value = True
+        self.charm._on_config_changed(None)
+        self.charm.unit.status = BlockedStatus("extensions requested through relation")
+        self.charm._on_config_changed(None)
+        self.assertEqual(_reconcile_client_relations.call_count, 4)
+
+        # Test that the services are updated only when the options that affect them change
+        # or the previous update failed.
+        _create_services.reset_mock()
+        self.charm._on_config_changed(None)
+        _create_services.assert_not_called()
+        _create_services.side_effect = [_FakeApiError, None]
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"read-only-lag-aware-routing": True})
+        self.charm._on_config_changed(None)
+        self.charm._on_config_changed(None)
+        self.charm._on_config_changed(None)
+        self.assertEqual(_create_services.call_count, 2)
+
+    @patch("charm.PostgresqlOperatorCharm.update_config")
+    @patch("charm.PostgresqlOperatorCharm._get_storage_size")
+    @patch("charm.PostgresqlOperatorCharm._get_resources_budget")
+    def test_refresh_storage_size(self, _get_resources_budget, _get_storage_size, _update_config):
+        _get_resources_budget.return_value = {
+            "pod-uid": "first-uid",
+            "memory": 10**9,
+            "cpu": 2,
+            "storage": 10**10,
+        }
+        _get_storage_size.return_value = 10**10
+        self.charm._refresh_storage_size()
+        _update_config.assert_not_called()
+
+        # Test that the size isn't checked again until the interval passes, unless forced.
+        _get_storage_size.reset_mock()
+        _get_storage_size.return_value = 2 * 10**10
+        self.charm._refresh_storage_size()
+        _get_storage_size.assert_not_called()
+
+        # Test that a Kubernetes API error is logged and the check is retried later.
+        _get_storage_size.side_effect = _FakeApiError
+        with self.assertLogs("charm", "WARNING"):
+            self.charm._refresh_storage_size(force=True)
+        _update_config.assert_not_called()
+
+        # Test that the parameters are re-tuned when the volume claim is expanded.
+        _get_storage_size.side_effect = None
+        self.charm._refresh_storage_size(force=True)
+        _update_config.assert_called_once()
+        self.assertEqual(
+            dict(self.charm._stored.resources_budget),
+            {"pod-uid": "first-uid", "memory": 10**9, "cpu": 2, "storage": 2 * 10**10},
+        )
+
     def test_scope_obj(self):
         assert self.charm._scope_obj("app") == self.charm.framework.model.app
         assert self.charm._scope_obj("unit") == self.charm.framework.model.unit
@@ -204,6 +204,7 @@ class TestDbProvides(unittest.TestCase):
                 (extensions, set()),
                 (extensions, set()),
                 (extensions, set()),
+                (extensions, set()),
             ]
             postgresql_mock.create_user = PropertyMock(
                 side_effect=[None, None, PostgreSQLCreateUserError, None, None]
@@ -213,9 +214,6 @@ class TestDbProvides(unittest.TestCase):
             )
             postgresql_mock.get_postgresql_version = PropertyMock(
                 side_effect=[
-                    POSTGRESQL_VERSION,
-                    POSTGRESQL_VERSION,
-                    POSTGRESQL_VERSION,
                     POSTGRESQL_VERSION,
                     POSTGRESQL_VERSION,
                     PostgreSQLGetPostgreSQLVersionError,
@@ -245,7 +243,7 @@ class TestDbProvides(unittest.TestCase):
             postgresql_mock.create_user.assert_called_once_with(user, "test-password", False)
             postgresql_mock.create_database.assert_called_once_with(DATABASE, user, plugins=[])
             _enable_disable_extensions.assert_called_once()
-            self.assertEqual(postgresql_mock.get_postgresql_version.call_count, 2)
+            postgresql_mock.get_postgresql_version.assert_called_once()
             _update_unit_status.assert_called_once()
             expected_data = {
                 "allowed-units": "application/0",
@@ -267,6 +265,24 @@ class TestDbProvides(unittest.TestCase):
             self.assertEqual(self.harness.get_relation_data(self.rel_id, self.unit), expected_data)
             self.assertNotIsInstance(self.harness.model.unit.status, BlockedStatus)
 
+            # Assert that the database changes are skipped when nothing relevant changed,
+            # but the databags are still refreshed.
+            postgresql_mock.create_user.reset_mock()
+            postgresql_mock.create_database.reset_mock()
+            _enable_disable_extensions.reset_mock()
+            postgresql_mock.get_postgresql_version.reset_mock()
+            _update_unit_status.reset_mock()
+            with self.harness.hooks_disabled():
+                self.harness.update_relation_data(self.rel_id, self.app, {"master": ""})
+            self.assertTrue(self.harness.charm.legacy_db_relation.set_up_relation(relation))
+            postgresql_mock.create_user.assert_not_called()
+            postgresql_mock.create_database.assert_not_called()
+            _enable_disable_extensions.assert_not_called()
+            postgresql_mock.get_postgresql_version.assert_not_called()
+            _update_unit_status.assert_called_once()
+            self.assertEqual(self.harness.get_relation_data(self.rel_id, self.app), expected_data)
+            self.assertEqual(self.harness.get_relation_data(self.rel_id, self.unit), expected_data)
+
             # Assert that the correct calls were made when the database name is
             # provided only in the unit databag.
             postgresql_mock.create_user.reset_mock()
@@ -290,7 +306,7 @@ class TestDbProvides(unittest.TestCase):
             postgresql_mock.create_user.assert_called_once_with(user, "test-password", False)
             postgresql_mock.create_database.assert_called_once_with(DATABASE, user, plugins=[])
             _enable_disable_extensions.assert_called_once()
-            self.assertEqual(postgresql_mock.get_postgresql_version.call_count, 2)
+            postgresql_mock.get_postgresql_version.assert_called_once()
             _update_unit_status.assert_called_once()
             self.assertEqual(self.harness.get_relation_data(self.rel_id, self.app), expected_data)
             self.assertEqual(self.harness.get_relation_data(self.rel_id, self.unit), expected_data)
@@ -354,6 +370,30 @@ class TestDbProvides(unittest.TestCase):
             _update_unit_status.assert_not_called()
             self.assertIsInstance(self.harness.model.unit.status, BlockedStatus)
 
+    @patch("relations.db.DbProvides.set_up_relation")
+    def test_reconcile_relations(self, _set_up_relation):
+        relation = self.harness.model.get_relation(RELATION_NAME, self.rel_id)
+        user = f"relation_id_{self.rel_id}"
+        fingerprint_key = f"{RELATION_NAME}-{self.rel_id}-fingerprint"
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(self.rel_id, self.unit, {"database": DATABASE})
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.app, {fingerprint_key: "fingerprint"}
+            )
+
+        # Test that the fingerprint is kept when the user and the database exist.
+        self.legacy_db_relation.reconcile_relations({user}, {DATABASE})
+        _set_up_relation.assert_called_once_with(relation)
+        self.assertIn(fingerprint_key, self.harness.get_relation_data(self.peer_rel_id, self.app))
+
+        # Test that the setup is forced when the database is missing.
+        _set_up_relation.reset_mock()
+        self.legacy_db_relation.reconcile_relations({user}, set())
+        _set_up_relation.assert_called_once_with(relation)
+        self.assertNotIn(
+            fingerprint_key, self.harness.get_relation_data(self.peer_rel_id, self.app)
+        )
+
     @patch("relations.db.DbProvides._check_for_blocking_relations")
     @patch("charm.PostgresqlOperatorCharm._has_blocked_status", new_callable=PropertyMock)
     def test_update_unit_status(self, _has_blocked_status, _check_for_blocking_relations):
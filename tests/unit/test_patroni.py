@@ -2,17 +2,30 @@
 # Copyright 2021 Canonical Ltd.
 # See LICENSE file for licensing details.
 
+import hashlib
 import unittest
-from unittest.mock import MagicMock, PropertyMock, mock_open, patch
+from unittest.mock import MagicMock, PropertyMock, call, mock_open, patch
 
+import requests
 import tenacity
+import yaml
 from jinja2 import Template
 from ops.testing import Harness
 from tenacity import RetryError, stop_after_delay, wait_fixed
 
 from charm import PostgresqlOperatorCharm
 from constants import REWIND_USER
-from patroni import Patroni, SwitchoverFailedError
+from patroni import (
+    API_CONNECT_TIMEOUT,
+    API_REQUEST_TIMEOUT,
+    MEMBER_HEALTHY,
+    MEMBER_LAGGING,
+    MEMBER_UNREACHABLE,
+    ClusterSnapshot,
+    MemberHealth,
+    Patroni,
+    SwitchoverFailedError,
+)
 from tests.helpers import STORAGE_PATH, patch_network_get
 
 
@@ -39,7 +52,7 @@ class TestPatroni(unittest.TestCase):
             False,
         )
 
-    @patch("requests.get")
+    @patch("requests.Session.get")
     def test_get_primary(self, _get):
         # Mock Patroni cluster API.
         _get.return_value.json.return_value = {
@@ -53,15 +66,102 @@ class TestPatroni(unittest.TestCase):
         # Test returning pod name.
         primary = self.patroni.get_primary()
         self.assertEqual(primary, "postgresql-k8s-1")
-        _get.assert_called_once_with("http://postgresql-k8s-0:8008/cluster", verify=True)
+        _get.assert_called_once_with(
+            "http://postgresql-k8s-0:8008/cluster", verify=True, timeout=API_REQUEST_TIMEOUT
+        )
 
-        # Test returning unit name.
+        # Test returning unit name (from the same cluster snapshot).
         _get.reset_mock()
         primary = self.patroni.get_primary(unit_name_pattern=True)
         self.assertEqual(primary, "postgresql-k8s/1")
-        _get.assert_called_once_with("http://postgresql-k8s-0:8008/cluster", verify=True)
+        _get.assert_not_called()
+
+        # Test that the cluster info is requested again after the snapshot is invalidated.
+        self.patroni.invalidate_cluster_snapshot()
+        primary = self.patroni.get_primary(unit_name_pattern=True)
+        self.assertEqual(primary, "postgresql-k8s/1")
+        _get.assert_called_once_with(
+            "http://postgresql-k8s-0:8008/cluster", verify=True, timeout=API_REQUEST_TIMEOUT
+        )
+
+    @patch("requests.Session.get")
+    def test_cluster_snapshot(self, _get):
+        _get.return_value.json.return_value = {
+            "members": [
+                {"name": "postgresql-k8s-0", "role": "leader", "state": "running", "timeline": 2},
+                {
+                    "name": "postgresql-k8s-1",
+                    "role": "sync_standby",
+                    "state": "streaming",
+                    "lag": 0,
+                    "timeline": 2,
+                    "tags": {"nosync": False},
+                },
+                {
+                    "name": "postgresql-k8s-2",
+                    "role": "replica",
+                    "state": "starting",
+                    "lag": "unknown",
+                },
+            ]
+        }
+
+        # The snapshot is shared between different instances of the class.
+        snapshot = self.patroni.cluster_snapshot
+        self.assertIs(self.charm._patroni.cluster_snapshot, snapshot)
+        _get.assert_called_once()
+
+        self.assertEqual(snapshot.primary.name, "postgresql-k8s-0")
+        self.assertEqual(snapshot.primary.timeline, 2)
+        self.assertEqual(
+            [member.unit_name for member in snapshot.sync_standbys], ["postgresql-k8s/1"]
+        )
+        self.assertEqual(snapshot.get_member("postgresql-k8s-1").tags, {"nosync": False})
+        self.assertIsNone(snapshot.get_member("postgresql-k8s-2").lag)
+        self.assertIsNone(snapshot.get_member("postgresql-k8s-3"))
+        self.assertEqual(self.patroni.get_sync_standby_names(), ["postgresql-k8s/1"])
+        self.assertEqual(
+            self.patroni.cluster_members,
+            {"postgresql-k8s-0", "postgresql-k8s-1", "postgresql-k8s-2"},
+        )
+        self.assertFalse(self.patroni.are_all_members_ready())
+        _get.assert_called_once()
+
+        # Test the fallback to the other members when the current one doesn't answer.
+        self.patroni.invalidate_cluster_snapshot()
+        _get.reset_mock()
+        response = _get.return_value
+        _get.side_effect = [ConnectionError, response]
+        self.assertEqual(self.patroni.get_primary(), "postgresql-k8s-0")
+        self.assertEqual(_get.call_args_list[1][0][0], "http://postgresql-k8s-0:8008/cluster")
 
-    @patch("requests.get")
+    @patch("requests.Session.get")
+    def test_member_replication_lag(self, _get):
+        _get.return_value.json.return_value = {
+            "members": [
+                {"name": "postgresql-k8s-0", "role": "replica", "lag": 1024},
+            ]
+        }
+        self.assertEqual(self.patroni.member_replication_lag, "1024")
+
+        self.patroni.invalidate_cluster_snapshot()
+        _get.return_value.json.return_value = {
+            "members": [
+                {"name": "postgresql-k8s-0", "role": "replica", "lag": "unknown"},
+            ]
+        }
+        self.assertEqual(self.patroni.member_replication_lag, "unknown")
+
+    def test_http_session_reuse(self):
+        # The same session is shared between the different instances of the class.
+        session = self.patroni._http
+        self.assertIsInstance(session, requests.Session)
+        self.assertIs(self.charm._patroni._http, session)
+        self.assertGreaterEqual(
+            session.get_adapter("https://postgresql-k8s-1:8008")._pool_connections, 4
+        )
+
+    @patch("requests.Session.get")
     def test_is_creating_backup(self, _get):
         # Test when one member is creating a backup.
         response = _get.return_value
@@ -74,15 +174,20 @@ class TestPatroni(unittest.TestCase):
         self.assertTrue(self.patroni.is_creating_backup)
 
         # Test when no member is creating a backup.
+        self.patroni.invalidate_cluster_snapshot()
         response.json.return_value = {
             "members": [{"name": "postgresql-k8s-0"}, {"name": "postgresql-k8s-1"}]
         }
         self.assertFalse(self.patroni.is_creating_backup)
 
-    @patch("requests.get")
-    @patch("charm.Patroni.get_primary")
+    @patch("requests.Session.get")
+    @patch("charm.Patroni.cluster_snapshot", new_callable=PropertyMock)
     @patch("patroni.stop_after_delay", return_value=stop_after_delay(0))
-    def test_is_replication_healthy(self, _, __, _get):
+    def test_is_replication_healthy(self, _, _cluster_snapshot, _get):
+        _cluster_snapshot.return_value = ClusterSnapshot.from_json(
+            {"members": [{"name": "postgresql-k8s-0", "role": "leader"}]}
+        )
+
         # Test when replication is healthy.
         _get.return_value.status_code = 200
         self.assertTrue(self.patroni.is_replication_healthy)
@@ -95,6 +200,75 @@ class TestPatroni(unittest.TestCase):
         ]
         self.assertFalse(self.patroni.is_replication_healthy)
 
+    @patch("charm.Patroni.get_replication_health")
+    @patch("charm.Patroni.cluster_snapshot", new_callable=PropertyMock)
+    @patch("patroni.stop_after_delay", return_value=stop_after_delay(0))
+    def test_get_unhealthy_members(self, _, _cluster_snapshot, _get_replication_health):
+        # Test when replication is healthy.
+        _get_replication_health.return_value = {
+            "postgresql-k8s-0": MemberHealth(MEMBER_HEALTHY),
+            "postgresql-k8s-1": MemberHealth(MEMBER_HEALTHY, 0),
+        }
+        self.assertEqual(self.patroni.get_unhealthy_members(), {})
+
+        # Test that the members blocking the replication are returned.
+        _get_replication_health.return_value = {
+            "postgresql-k8s-0": MemberHealth(MEMBER_HEALTHY),
+            "postgresql-k8s-1": MemberHealth(MEMBER_LAGGING, 1048576),
+        }
+        self.assertEqual(
+            self.patroni.get_unhealthy_members(),
+            {"postgresql-k8s-1": MemberHealth(MEMBER_LAGGING, 1048576)},
+        )
+
+        # Test when the cluster topology can't be retrieved.
+        _get_replication_health.side_effect = RetryError(last_attempt=MagicMock())
+        with self.assertRaises(RetryError):
+            self.patroni.get_unhealthy_members()
+
+    @patch("requests.Session.get")
+    @patch("charm.Patroni.cluster_snapshot", new_callable=PropertyMock)
+    def test_get_replication_health(self, _cluster_snapshot, _get):
+        _cluster_snapshot.return_value = ClusterSnapshot.from_json(
+            {
+                "members": [
+                    {"name": "postgresql-k8s-0", "role": "leader"},
+                    {"name": "postgresql-k8s-1", "role": "replica", "lag": 0},
+                    {"name": "postgresql-k8s-2", "role": "replica", "lag": 1048576},
+                ]
+            }
+        )
+
+        def get(url, **kwargs):
+            self.assertEqual(kwargs["timeout"], API_REQUEST_TIMEOUT)
+            if url.startswith("http://postgresql-k8s-1:8008"):
+                raise requests.ConnectionError
+            return MagicMock(status_code=200 if url.startswith("http://postgresql-k8s-0") else 503)
+
+        _get.side_effect = get
+
+        health = self.patroni.get_replication_health()
+        self.assertEqual(
+            health,
+            {
+                "postgresql-k8s-0": MemberHealth(MEMBER_HEALTHY),
+                "postgresql-k8s-1": MemberHealth(MEMBER_UNREACHABLE, 0),
+                "postgresql-k8s-2": MemberHealth(MEMBER_LAGGING, 1048576),
+            },
+        )
+        self.assertEqual(str(health["postgresql-k8s-2"]), "lagging (lag: 1048576 bytes)")
+
+        # The primary is checked through the leader endpoint and the replicas
+        # through the replica endpoint.
+        self.assertEqual(
+            sorted(call[0][0] for call in _get.call_args_list),
+            [
+                "http://postgresql-k8s-0:8008/leader",
+                "http://postgresql-k8s-1:8008/replica?lag=16kB",
+                "http://postgresql-k8s-2:8008/replica?lag=16kB",
+            ],
+        )
+
     @patch("os.chmod")
     @patch("os.chown")
     @patch("pwd.getpwnam")
@@ -141,6 +315,8 @@ class TestPatroni(unittest.TestCase):
             rewind_password=self.patroni._rewind_password,
             minority_count=self.patroni._members_count // 2,
             version="14",
+            synchronous_mode=True,
+            synchronous_commit="on",
         )
 
         # Setup a mock for the `open` method, set returned data to postgresql.conf template.
@@ -175,20 +351,33 @@ class TestPatroni(unittest.TestCase):
             rewind_password=self.patroni._rewind_password,
             minority_count=self.patroni._members_count // 2,
             version="14",
+            synchronous_mode=True,
+            synchronous_commit="on",
         )
         self.assertNotEqual(expected_content_with_tls, expected_content)
 
         # Patch the `open` method with our mock.
         with patch("builtins.open", mock, create=True):
             # Call the method
-            self.patroni.render_patroni_yml_file(enable_tls=True)
+            config_hash = self.patroni.render_patroni_yml_file(enable_tls=True)
 
-        # Ensure the correct rendered template is sent to _render_file method.
+        # Ensure the correct rendered template is sent to _render_file method
+        # (and that the template was compiled only once).
         _render_file.assert_called_once_with(
             f"{STORAGE_PATH}/patroni.yml",
             expected_content_with_tls,
             0o644,
         )
+        self.assertNotIn(call("templates/patroni.yml.j2", "r"), mock.call_args_list[1:])
+        self.assertEqual(
+            config_hash, hashlib.sha256(expected_content_with_tls.encode("utf-8")).hexdigest()
+        )
+
+        # Test that the file is not written again when its content doesn't change.
+        _render_file.reset_mock()
+        with patch("builtins.open", mock_open(read_data=expected_content_with_tls), create=True):
+            self.assertEqual(self.patroni.render_patroni_yml_file(enable_tls=True), config_hash)
+        _render_file.assert_not_called()
 
         # Also, ensure the right parameters are in the expected content
         # (as it was already validated with the above render file call).
@@ -199,9 +388,49 @@ class TestPatroni(unittest.TestCase):
         )
         self.assertIn("ssl_key_file: /var/lib/postgresql/data/key.pem", expected_content_with_tls)
 
+        # Test that the replicas fetch the WAL files from the archive only with the
+        # asynchronous archiving.
+        _render_file.reset_mock()
+        with patch("builtins.open", mock, create=True):
+            self.patroni.render_patroni_yml_file(stanza="test-stanza")
+            self.patroni.render_patroni_yml_file(stanza="test-stanza", archive_async=True)
+        restore_command = (
+            "restore_command: 'pgbackrest --stanza=test-stanza archive-get %f \"%p\"'"
+        )
+        self.assertNotIn(restore_command, _render_file.call_args_list[0].args[1])
+        self.assertIn(restore_command, _render_file.call_args_list[1].args[1])
+
+        # Test that the WAL files are fetched from the restored stanza during a restore.
+        _render_file.reset_mock()
+        with patch("builtins.open", mock, create=True):
+            self.patroni.render_patroni_yml_file(
+                stanza="test-stanza",
+                restore_stanza="other-stanza",
+                backup_id="20230101-090000F",
+                archive_async=True,
+            )
+        self.assertIn(
+            "restore_command: 'pgbackrest --stanza=other-stanza archive-get %f \"%p\"'",
+            _render_file.call_args_list[0].args[1],
+        )
+
+        # Test that the parameters that Patroni only takes from the dynamic configuration
+        # are only rendered in the bootstrap section.
+        _render_file.reset_mock()
+        with patch("builtins.open", mock, create=True):
+            self.patroni.render_patroni_yml_file(
+                parameters={"max_worker_processes": "12", "work_mem": "4MB"}
+            )
+        content = yaml.safe_load(_render_file.call_args.args[1])
+        self.assertEqual(
+            content["bootstrap"]["dcs"]["postgresql"]["parameters"]["max_worker_processes"], "12"
+        )
+        self.assertNotIn("max_worker_processes", content["postgresql"]["parameters"])
+        self.assertEqual(content["postgresql"]["parameters"]["work_mem"], "4MB")
+
     @patch("patroni.stop_after_delay", return_value=stop_after_delay(0))
     @patch("patroni.wait_fixed", return_value=wait_fixed(0))
-    @patch("requests.get")
+    @patch("requests.Session.get")
     def test_primary_endpoint_ready(self, _get, _, __):
         # Test with an issue when trying to connect to the Patroni API.
         _get.side_effect = RetryError
@@ -219,7 +448,7 @@ class TestPatroni(unittest.TestCase):
         self.assertTrue(self.patroni.primary_endpoint_ready)
 
     @patch("patroni.stop_after_delay", return_value=tenacity.stop_after_delay(0))
-    @patch("requests.post")
+    @patch("requests.Session.post")
     @patch("patroni.Patroni.get_primary")
     def test_switchover(self, _get_primary, _post, __):
         # Test a successful switchover.
@@ -231,6 +460,7 @@ class TestPatroni(unittest.TestCase):
             "http://postgresql-k8s-0:8008/switchover",
             json={"leader": "postgresql-k8s-0", "candidate": None},
             verify=True,
+            timeout=(API_CONNECT_TIMEOUT, None),
         )
 
         # Test a successful switchover with a candidate name.
@@ -241,6 +471,7 @@ class TestPatroni(unittest.TestCase):
             "http://postgresql-k8s-0:8008/switchover",
             json={"leader": "postgresql-k8s-0", "candidate": "postgresql-k8s-2"},
             verify=True,
+            timeout=(API_CONNECT_TIMEOUT, None),
         )
 
         # Test failed switchovers.
@@ -252,6 +483,7 @@ class TestPatroni(unittest.TestCase):
             "http://postgresql-k8s-0:8008/switchover",
             json={"leader": "postgresql-k8s-0", "candidate": "postgresql-k8s-2"},
             verify=True,
+            timeout=(API_CONNECT_TIMEOUT, None),
         )
 
         _post.reset_mock()
@@ -263,4 +495,49 @@ class TestPatroni(unittest.TestCase):
             "http://postgresql-k8s-0:8008/switchover",
             json={"leader": "postgresql-k8s-0", "candidate": "postgresql-k8s-2"},
             verify=True,
+            timeout=(API_CONNECT_TIMEOUT, None),
         )
+
+    @patch("requests.Session.patch")
+    def test_update_synchronous_settings(self, _patch):
+        # Test the settings of each synchronous replication mode.
+        settings = self.patroni.get_synchronous_settings("sync", "on")
+        self.assertEqual(
+            settings,
+            {
+                "synchronous_mode": True,
+                "synchronous_node_count": 1,
+                "postgresql": {
+                    "parameters": {
+                        "synchronous_commit": "on",
+                        "synchronous_standby_names": "*",
+                    }
+                },
+            },
+        )
+        sync_settings = self.patroni.get_synchronous_settings("sync", "remote_apply")
+        self.assertTrue(sync_settings["synchronous_mode"])
+        self.assertEqual(
+            sync_settings["postgresql"]["parameters"]["synchronous_commit"], "remote_apply"
+        )
+        async_settings = self.patroni.get_synchronous_settings("async", "remote_write")
+        self.assertFalse(async_settings["synchronous_mode"])
+        self.assertEqual(
+            async_settings["postgresql"]["parameters"]["synchronous_standby_names"], ""
+        )
+
+        # Test that the settings are sent to the Patroni dynamic configuration endpoint.
+        self.patroni.update_dynamic_configuration(settings)
+        _patch.assert_called_once_with(
+            "http://postgresql-k8s-0:8008/config",
+            json=settings,
+            verify=True,
+            timeout=API_REQUEST_TIMEOUT,
+        )
+
+        # Test when the request fails.
+        _patch.return_value.raise_for_status.side_effect = requests.exceptions.HTTPError
+        with self.assertRaises(RetryError):
+            self.patroni.update_dynamic_configuration.retry_with(wait=tenacity.wait_fixed(0))(
+                self.patroni, settings
+            )
@@ -0,0 +1,317 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+import unittest
+from unittest.mock import call, patch
+
+import psycopg2
+from charms.postgresql_k8s.v0.postgresql import (
+    PostgreSQL,
+    PostgreSQLCheckBackupInProgressError,
+    PostgreSQLEnableDisableExtensionError,
+    PostgreSQLInvalidParameterError,
+)
+from psycopg2 import sql
+
+
+class TestPostgreSQL(unittest.TestCase):
+    def test_build_postgresql_parameters(self):
+        # Test the default parameters of the testing profile.
+        self.assertEqual(
+            PostgreSQL.build_postgresql_parameters("testing", 8 * 10**9),
+            {"shared_buffers": "128MB"},
+        )
+
+        # Test the parameters derived only from the memory.
+        parameters = PostgreSQL.build_postgresql_parameters("production", 8 * 10**9)
+        self.assertEqual(parameters["shared_buffers"], "2000MB")
+        self.assertEqual(parameters["effective_cache_size"], "6000MB")
+        self.assertEqual(parameters["maintenance_work_mem"], "476MB")
+        self.assertEqual(parameters["work_mem"], "19531kB")
+        self.assertEqual(parameters["wal_buffers"], "16384kB")
+        self.assertEqual(parameters["min_wal_size"], "1024MB")
+        self.assertEqual(parameters["max_wal_size"], "4096MB")
+        self.assertEqual(parameters["checkpoint_completion_target"], "0.9")
+        self.assertNotIn("max_worker_processes", parameters)
+        # Test that the storage related planner settings keep the PostgreSQL defaults.
+        self.assertNotIn("effective_io_concurrency", parameters)
+        self.assertNotIn("random_page_cost", parameters)
+
+        # Test that the memory limit is used when it's lower than the available memory.
+        parameters = PostgreSQL.build_postgresql_parameters("production", 8 * 10**9, 10**9)
+        self.assertEqual(parameters["shared_buffers"], "250MB")
+
+        # Test the parallelism settings of an analytical workload.
+        parameters = PostgreSQL.build_postgresql_parameters(
+            "production", 8 * 10**9, available_cpu_cores=16, workload_type="olap"
+        )
+        self.assertEqual(parameters["max_worker_processes"], "20")
+        self.assertEqual(parameters["max_parallel_workers"], "16")
+        self.assertEqual(parameters["max_parallel_workers_per_gather"], "8")
+        self.assertEqual(parameters["max_parallel_maintenance_workers"], "4")
+        self.assertEqual(parameters["autovacuum_max_workers"], "4")
+        self.assertEqual(parameters["maintenance_work_mem"], "953MB")
+        self.assertEqual(parameters["work_mem"], "3662kB")
+        self.assertEqual(parameters["max_wal_size"], "16384MB")
+
+        # Test the parallelism settings of a transactional workload with few cores.
+        parameters = PostgreSQL.build_postgresql_parameters(
+            "production", 8 * 10**9, available_cpu_cores=0.5, workload_type="oltp"
+        )
+        self.assertEqual(parameters["max_worker_processes"], "8")
+        self.assertEqual(parameters["max_parallel_workers"], "1")
+        self.assertEqual(parameters["max_parallel_workers_per_gather"], "0")
+        self.assertEqual(parameters["max_parallel_maintenance_workers"], "0")
+        self.assertEqual(parameters["autovacuum_max_workers"], "3")
+
+        # Test that the WAL size is limited by the storage size.
+        parameters = PostgreSQL.build_postgresql_parameters(
+            "production", 8 * 10**9, storage_size=2 * 2**30, workload_type="oltp"
+        )
+        self.assertEqual(parameters["min_wal_size"], "128MB")
+        self.assertEqual(parameters["max_wal_size"], "512MB")
+
+    @patch("charms.postgresql_k8s.v0.postgresql.PostgreSQL._get_parameters_settings")
+    def test_validate_parameters(self, _get_parameters_settings):
+        postgresql = PostgreSQL("primary", "current", "operator", "password", "postgres")
+        _get_parameters_settings.return_value = {
+            "work_mem": ("user", "integer", "kB", "64", "2147483647", None),
+            "shared_buffers": ("postmaster", "integer", "8kB", "16", "1073741823", None),
+            "checkpoint_timeout": ("sighup", "integer", "s", "30", "86400", None),
+            "jit": ("user", "bool", None, None, None, None),
+            "wal_compression": ("superuser", "enum", None, None, None, ["pglz", "lz4", "off"]),
+            "random_page_cost": ("user", "real", None, "0", "1.79769e+308", None),
+            "block_size": ("internal", "integer", None, "8192", "8192", None),
+        }
+
+        # Test valid values, including different units from the parameters ones.
+        self.assertEqual(
+            postgresql.validate_parameters(
+                {
+                    "work_mem": "64MB",
+                    "shared_buffers": "1GB",
+                    "checkpoint_timeout": "15min",
+                    "jit": "off",
+                    "wal_compression": "LZ4",
+                    "random_page_cost": "1.1",
+                    "pg_stat_statements.max": "10000",
+                }
+            ),
+            {
+                "work_mem": "user",
+                "shared_buffers": "postmaster",
+                "checkpoint_timeout": "sighup",
+                "jit": "user",
+                "wal_compression": "superuser",
+                "random_page_cost": "user",
+                "pg_stat_statements.max": "user",
+            },
+        )
+
+        # Test invalid parameters and values.
+        for parameters in [
+            {"work_mem": "32kB"},
+            {"work_mem": "64xB"},
+            {"checkpoint_timeout": "1MB"},
+            {"jit": "maybe"},
+            {"wal_compression": "zstd"},
+            {"block_size": "8192"},
+            {"unknown_parameter": "1"},
+        ]:
+            with self.assertRaises(PostgreSQLInvalidParameterError):
+                postgresql.validate_parameters(parameters)
+
+    @patch("charms.postgresql_k8s.v0.postgresql.PostgreSQL._connect_to_database")
+    def test_enable_disable_extensions(self, _connect_to_database):
+        postgresql = PostgreSQL("primary", "current", "operator", "password", "postgres")
+        cursor = _connect_to_database.return_value.cursor.return_value.__enter__.return_value
+        execute = cursor.execute
+        fetchall = cursor.fetchall
+
+        # Test that only the extensions not in the desired state are changed.
+        fetchall.return_value = [("plpgsql",), ("citext",), ("hstore",)]
+        postgresql.enable_disable_extensions(
+            {"citext": True, "hstore": False, "pg_trgm": True, "unaccent": False}, "test-db"
+        )
+        _connect_to_database.assert_called_once_with(database="test-db")
+        execute.assert_has_calls(
+            [
+                call("SELECT extname FROM pg_extension;"),
+                call(sql.SQL("DROP EXTENSION IF EXISTS {};").format(sql.Identifier("hstore"))),
+                call(
+                    sql.SQL("CREATE EXTENSION IF NOT EXISTS {};").format(sql.Identifier("pg_trgm"))
+                ),
+            ]
+        )
+        self.assertEqual(execute.call_count, 3)
+        _connect_to_database.return_value.close.assert_called_once()
+
+        # Test that a failing extension doesn't prevent the changes to the other ones.
+        execute.reset_mock()
+        fetchall.return_value = [("plpgsql",), ("hstore",)]
+        execute.side_effect = [
+            None,
+            psycopg2.errors.DependentObjectsStillExist,
+            psycopg2.errors.UniqueViolation,
+            None,
+        ]
+        with self.assertRaises(PostgreSQLEnableDisableExtensionError) as e:
+            postgresql.enable_disable_extensions(
+                {"hstore": False, "citext": True, "pg_trgm": True}, "test-db"
+            )
+        self.assertEqual(str(e.exception), "hstore in test-db")
+        self.assertEqual(execute.call_count, 4)
+        execute.side_effect = None
+
+        # Test that all the databases are updated, using one connection for each one.
+        _connect_to_database.reset_mock()
+        execute.reset_mock()
+        databases_cursor = _connect_to_database.return_value.__enter__.return_value.cursor
+        databases_cursor.return_value.__enter__.return_value.fetchall.return_value = [
+            ("db1",),
+            ("db2",),
+        ]
+        fetchall.return_value = [("plpgsql",)]
+        postgresql.enable_disable_extensions({"citext": False})
+        _connect_to_database.assert_has_calls(
+            [call(), call(database="db1"), call(database="db2")], any_order=True
+        )
+        self.assertEqual(_connect_to_database.call_count, 3)
+
+    @patch("charms.postgresql_k8s.v0.postgresql.PostgreSQL._connect_to_database")
+    def test_delete_user(self, _connect_to_database):
+        postgresql = PostgreSQL("primary", "current", "operator", "password", "postgres")
+        cursor = _connect_to_database.return_value.cursor.return_value.__enter__.return_value
+        database_cursor = (
+            _connect_to_database.return_value.__enter__.return_value.cursor.return_value
+        ).__enter__.return_value
+
+        # Test that nothing is done when the user doesn't exist.
+        cursor.fetchone.return_value = None
+        postgresql.delete_user("relation_id_2")
+        _connect_to_database.assert_called_once_with()
+        cursor.execute.assert_called_once_with(
+            "SELECT 1 FROM pg_catalog.pg_user WHERE usename = %s;", ("relation_id_2",)
+        )
+
+        # Test that the objects are reassigned in each database before dropping the user.
+        _connect_to_database.reset_mock()
+        cursor.fetchone.return_value = (1,)
+        cursor.fetchall.return_value = [("postgres",), ("db1",), ("db2",)]
+        postgresql.delete_user("relation_id_2")
+        _connect_to_database.assert_has_calls(
+            [call("postgres"), call("db1"), call("db2")], any_order=True
+        )
+        self.assertEqual(_connect_to_database.call_count, 4)
+        self.assertEqual(database_cursor.execute.call_count, 6)
+        cursor.execute.assert_called_with(
+            sql.SQL("DROP ROLE {};").format(sql.Identifier("relation_id_2"))
+        )
+        _connect_to_database.return_value.close.assert_called()
+
+    @patch("charms.postgresql_k8s.v0.postgresql.PostgreSQL._connect_to_database")
+    def test_is_backup_in_progress(self, _connect_to_database):
+        postgresql = PostgreSQL("primary", "current", "operator", "password", "postgres")
+        cursor = (
+            _connect_to_database.return_value.__enter__.return_value.cursor.return_value
+        ).__enter__.return_value
+
+        # Test with and without a pgBackRest backup session in the primary.
+        cursor.fetchone.return_value = (1,)
+        self.assertTrue(postgresql.is_backup_in_progress())
+        cursor.fetchone.return_value = (0,)
+        self.assertFalse(postgresql.is_backup_in_progress())
+
+        # Test when the primary can't be reached.
+        _connect_to_database.side_effect = psycopg2.OperationalError
+        with self.assertRaises(PostgreSQLCheckBackupInProgressError):
+            postgresql.is_backup_in_progress()
+
+    @patch("charms.postgresql_k8s.v0.postgresql.PostgreSQL._connect_to_database")
+    def test_create_database(self, _connect_to_database):
+        postgresql = PostgreSQL(
+            "primary", "current", "operator", "password", "postgres", ["operator"]
+        )
+        cursor = _connect_to_database.return_value.cursor.return_value.__enter__.return_value
+        database_cursor = (
+            _connect_to_database.return_value.__enter__.return_value.cursor.return_value
+        ).__enter__.return_value
+
+        # Test that the database is created when it doesn't exist.
+        cursor.fetchone.return_value = None
+        postgresql.create_database("test-db", "relation_id_2", plugins=["citext"])
+        self.assertEqual(
+            cursor.execute.call_args_list[1],
+            call(sql.SQL("CREATE DATABASE {};").format(sql.Identifier("test-db"))),
+        )
+        self.assertEqual(cursor.execute.call_count, 3)
+        # The database privileges are checked and granted in a single statement.
+        self.assertEqual(
+            [
+                part.wrapped
+                for part in cursor.execute.call_args_list[2][0][0].seq
+                if isinstance(part, sql.Literal)
+            ],
+            ["test-db", ["relation_id_2", "admin", "operator"]],
+        )
+        # The privileges on the objects and the extensions are set up in a single statement.
+        _connect_to_database.assert_called_with(database="test-db")
+        database_cursor.execute.assert_called_once()
+        self.assertEqual(
+            [
+                part.wrapped
+                for part in database_cursor.execute.call_args[0][0].seq
+                if isinstance(part, sql.Literal)
+            ],
+            ["relation_id_2", ["citext"]],
+        )
+
+        # Test that an existing database is not created again.
+        cursor.reset_mock()
+        database_cursor.reset_mock()
+        cursor.fetchone.return_value = ("test-db",)
+        postgresql.create_database("test-db", "relation_id_2")
+        self.assertEqual(cursor.execute.call_count, 2)
+        database_cursor.execute.assert_called_once()
+
+    @patch("psycopg2.connect")
+    def test_connect_to_database(self, _connect):
+        # Test that the connections are not cached by default.
+        postgresql = PostgreSQL("primary", "current", "operator", "password", "postgres")
+        postgresql._connect_to_database()
+        postgresql._connect_to_database()
+        self.assertEqual(_connect.call_count, 2)
+        self.assertIsNone(_connect.call_args.kwargs["connection_factory"])
+        self.assertEqual(postgresql._connections, {})
+
+        _connect.reset_mock()
+        postgresql = PostgreSQL(
+            "primary", "current", "operator", "password", "postgres", cache_connections=True
+        )
+        _connect.return_value.closed = 0
+
+        # Test that the connections to the default database are reused.
+        connection = postgresql._connect_to_database()
+        self.assertIs(postgresql._connect_to_database(), connection)
+        _connect.assert_called_once()
+        connection.poll.assert_called_once()
+
+        # Test that there is one connection for each host.
+        postgresql._connect_to_database(connect_to_current_host=True)
+        self.assertEqual(_connect.call_count, 2)
+
+        # Test that the connections to other databases are not cached.
+        postgresql._connect_to_database(database="other-database")
+        postgresql._connect_to_database(database="other-database")
+        self.assertEqual(_connect.call_count, 4)
+
+        # Test that a connection closed by the server is replaced.
+        connection.poll.side_effect = psycopg2.OperationalError
+        postgresql._connect_to_database()
+        self.assertEqual(_connect.call_count, 5)
+        connection.force_close.assert_called_once()
+
+        # Test that all the cached connections are closed at once.
+        _connect.return_value.force_close.reset_mock()
+        postgresql.close_all()
+        self.assertEqual(_connect.return_value.force_close.call_count, 2)
+        self.assertEqual(postgresql._connections, {})
@@ -0,0 +1,168 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import unittest
+from unittest.mock import Mock, patch
+
+from ops.testing import Harness
+
+from charm import PostgresqlOperatorCharm
+from constants import PEER
+
+RELATION_NAME = "database"
+RELATIONS = 20
+
+
+class TestPostgreSQLProvider(unittest.TestCase):
+    @patch("charm.KubernetesServicePatch", lambda x, y: None)
+    def setUp(self):
+        self.harness = Harness(PostgresqlOperatorCharm)
+        self.addCleanup(self.harness.cleanup)
+
+        # Set up the initial relation and hooks.
+        self.harness.set_leader(True)
+        self.harness.begin()
+        self.app = self.harness.charm.app.name
+        self.unit = self.harness.charm.unit.name
+        self.peer_rel_id = self.harness.add_relation(PEER, self.app)
+        self.harness.add_relation_unit(self.peer_rel_id, f"{self.app}/1")
+
+        # Define some client relations with their credentials already set.
+        self.rel_ids = []
+        with self.harness.hooks_disabled():
+            for index in range(RELATIONS):
+                rel_id = self.harness.add_relation(RELATION_NAME, f"application{index}")
+                self.harness.add_relation_unit(rel_id, f"application{index}/0")
+                self.harness.update_relation_data(
+                    rel_id,
+                    self.app,
+                    {
+                        "username": f"relation_id_{rel_id}",
+                        "password": "test-password",
+                        "database": f"database{index}",
+                    },
+                )
+                self.rel_ids.append(rel_id)
+        self.provider = self.harness.charm.postgresql_client_relation
+        self.endpoints = f"{self.harness.charm.primary_endpoint}:5432"
+        self.read_only_endpoints = f"{self.harness.charm.replicas_endpoint}:5432"
+
+    def test_reconcile_relations(self):
+        users = {f"relation_id_{rel_id}" for rel_id in self.rel_ids}
+        databases = {f"database{index}" for index in range(RELATIONS)}
+        with patch.object(
+            PostgresqlOperatorCharm, "postgresql", Mock()
+        ) as postgresql_mock, patch.object(
+            self.provider.database_provides,
+            "update_relation_data",
+            wraps=self.provider.database_provides.update_relation_data,
+        ) as _update_relation_data:
+            # Test the first reconciliation (all the endpoints are written).
+            self.provider.reconcile_relations(users, databases)
+            postgresql_mock.create_user.assert_not_called()
+            postgresql_mock.create_database.assert_not_called()
+            self.assertEqual(_update_relation_data.call_count, RELATIONS)
+            for rel_id in self.rel_ids:
+                relation_data = self.harness.get_relation_data(rel_id, self.app)
+                self.assertEqual(relation_data["endpoints"], self.endpoints)
+                self.assertEqual(relation_data["read-only-endpoints"], self.read_only_endpoints)
+
+            # Test that nothing is written when nothing changed.
+            _update_relation_data.reset_mock()
+            self.provider.reconcile_relations(users, databases)
+            _update_relation_data.assert_not_called()
+
+            # Test that only the missing user and database are recreated.
+            user = f"relation_id_{self.rel_ids[1]}"
+            self.provider.reconcile_relations(users - {user}, databases - {"database1"})
+            postgresql_mock.create_user.assert_called_once_with(
+                user, "test-password", extra_user_roles=None
+            )
+            postgresql_mock.create_database.assert_called_once_with("database1", user, plugins=[])
+            _update_relation_data.assert_not_called()
+
+            # Test that only the changed field is written when the replicas are removed.
+            with self.harness.hooks_disabled():
+                self.harness.remove_relation_unit(self.peer_rel_id, f"{self.app}/1")
+            self.provider.reconcile_relations(users, databases)
+            self.assertEqual(_update_relation_data.call_count, RELATIONS)
+            for call in _update_relation_data.call_args_list:
+                self.assertEqual(call.args[1], {"read-only-endpoints": ""})
+
+            # Test that non-leader units do nothing.
+            _update_relation_data.reset_mock()
+            with self.harness.hooks_disabled():
+                self.harness.set_leader(False)
+            self.provider.reconcile_relations(set(), set())
+            _update_relation_data.assert_not_called()
+
+    def test_pooler_endpoints(self):
+        users = {f"relation_id_{rel_id}" for rel_id in self.rel_ids}
+        databases = {f"database{index}" for index in range(RELATIONS)}
+        with patch.object(PostgresqlOperatorCharm, "postgresql", Mock()):
+            # Test that the PgBouncer endpoints are shared in their own fields.
+            with self.harness.hooks_disabled():
+                self.harness.update_config({"pgbouncer-enabled": True})
+            self.provider.reconcile_relations(users, databases)
+            relation_data = self.harness.get_relation_data(self.rel_ids[0], self.app)
+            self.assertEqual(relation_data["endpoints"], self.endpoints)
+            self.assertEqual(relation_data["read-only-endpoints"], self.read_only_endpoints)
+            self.assertEqual(
+                relation_data["pooler-endpoints"], f"{self.harness.charm.primary_endpoint}:6432"
+            )
+            self.assertEqual(
+                relation_data["read-only-pooler-endpoints"],
+                f"{self.harness.charm.replicas_endpoint}:6432",
+            )
+
+            # Test that they're removed when PgBouncer is disabled.
+            with self.harness.hooks_disabled():
+                self.harness.update_config({"pgbouncer-enabled": False})
+            self.provider.reconcile_relations(users, databases)
+            relation_data = self.harness.get_relation_data(self.rel_ids[0], self.app)
+            self.assertEqual(relation_data["endpoints"], self.endpoints)
+            self.assertNotIn("pooler-endpoints", relation_data)
+            self.assertNotIn("read-only-pooler-endpoints", relation_data)
+
+    @patch("relations.db.DbProvides.reconcile_relations")
+    @patch("relations.postgresql_provider.PostgreSQLProvider.reconcile_relations")
+    def test_reconcile_client_relations(
+        self, _provider_reconcile_relations, _db_reconcile_relations
+    ):
+        with patch.object(PostgresqlOperatorCharm, "postgresql", Mock()) as postgresql_mock:
+            postgresql_mock.list_users.return_value = {"user"}
+            postgresql_mock.list_databases.return_value = {"database"}
+
+            # Test that the users and databases are fetched once for all the relations.
+            self.harness.charm.reconcile_client_relations()
+            postgresql_mock.list_users.assert_called_once()
+            postgresql_mock.list_databases.assert_called_once()
+            _provider_reconcile_relations.assert_called_once_with({"user"}, {"database"})
+            self.assertEqual(_db_reconcile_relations.call_count, 2)
+
+    @patch("charm.PostgresqlOperatorCharm.get_read_only_members")
+    def test_get_read_only_endpoints(self, _get_read_only_members):
+        # Test the service mode.
+        self.assertEqual(self.provider._get_read_only_endpoints(), self.read_only_endpoints)
+        _get_read_only_members.assert_not_called()
+
+        # Test the host-list mode.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"read-only-endpoints-mode": "host-list"})
+        _get_read_only_members.return_value = {"postgresql-k8s-10", "postgresql-k8s-2"}
+        model = self.harness.model.name
+        self.assertEqual(
+            self.provider._get_read_only_endpoints(),
+            f"postgresql-k8s-2.postgresql-k8s-endpoints.{model}.svc.cluster.local:5432,"
+            f"postgresql-k8s-10.postgresql-k8s-endpoints.{model}.svc.cluster.local:5432",
+        )
+
+        # Test the fallback to the service when there is no replica available.
+        for members in [set(), None]:
+            _get_read_only_members.return_value = members
+            self.assertEqual(self.provider._get_read_only_endpoints(), self.read_only_endpoints)
+
+        # Test when there are no replicas.
+        with self.harness.hooks_disabled():
+            self.harness.remove_relation_unit(self.peer_rel_id, f"{self.app}/1")
+        self.assertEqual(self.provider._get_read_only_endpoints(), "")
@@ -0,0 +1,122 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, Mock
+
+from tenacity import Retrying, stop_after_attempt, wait_fixed
+
+from tracing import HookTracer
+
+
+class Client:
+    def get(self, name):
+        return name
+
+    def list(self):  # noqa: A003
+        yield from ["first", "second"]
+
+    def delete(self):
+        raise ValueError("failed")
+
+
+class TestHookTracer(unittest.TestCase):
+    def setUp(self):
+        self.tracer = HookTracer()
+
+    def test_trace_methods(self):
+        client = Client()
+        client.list = Mock(return_value=[])
+        self.tracer.trace_methods(client, "kubernetes", ["get", "list", "delete", "missing"])
+
+        # Test that the calls and the errors are recorded.
+        self.assertEqual(client.get("pod"), "pod")
+        with self.assertRaises(ValueError):
+            client.delete()
+        stats = self.tracer.stats["kubernetes"]
+        self.assertEqual(stats.calls, 2)
+        self.assertEqual(stats.errors, 1)
+
+        # Test that the mocks are not wrapped.
+        self.assertIsInstance(client.list, Mock)
+
+        # Test that the results of generators are still returned.
+        other_client = Client()
+        self.tracer.trace_methods(other_client, "other", ["list"])
+        self.assertEqual(list(other_client.list()), ["first", "second"])
+        self.assertEqual(self.tracer.stats["other"].calls, 1)
+
+    def test_retry_callback(self):
+        function = Mock(side_effect=[Exception, Exception, "result"])
+        for attempt in Retrying(
+            stop=stop_after_attempt(3),
+            wait=wait_fixed(0),
+            before_sleep=self.tracer.retry_callback("patroni"),
+        ):
+            with attempt:
+                function()
+        self.assertEqual(self.tracer.stats["patroni"].retries, 2)
+
+    def test_trace_boto3_session(self):
+        session = MagicMock()
+        self.tracer.trace_boto3_session(session)
+        handlers = {call.args[0]: call.args[1] for call in session.events.register.call_args_list}
+        self.assertEqual(set(handlers), {"before-call.s3", "after-call.s3", "after-call-error.s3"})
+
+        # Test a successful and a failed call.
+        for status_code in [200, 404]:
+            context = {}
+            handlers["before-call.s3"](context=context)
+            handlers["after-call.s3"](context=context, http_response=Mock(status_code=status_code))
+        # Test a call that failed before getting a response.
+        handlers["after-call-error.s3"](context={}, exception=Exception())
+
+        stats = self.tracer.stats["s3"]
+        self.assertEqual(stats.calls, 3)
+        self.assertEqual(stats.errors, 2)
+
+    def test_summary(self):
+        self.assertRegex(self.tracer.summary(), r"^\d+\.\d{2}s; no external calls$")
+
+        with self.tracer.span("pebble"):
+            pass
+        self.tracer.stats["patroni"].retries += 2
+        self.assertRegex(
+            self.tracer.summary({"secrets": 3}),
+            r"^\d+\.\d{2}s; patroni=0 calls \(2 retries\) in 0\.00s; "
+            r"pebble=1 calls in \d+\.\d{2}s; secrets=3$",
+        )
+
+        # Test that the recorded calls and counters are discarded.
+        self.tracer.counters["secrets"] += 1
+        self.tracer.reset()
+        self.assertEqual(self.tracer.stats, {})
+        self.assertEqual(self.tracer.counters, {})
+
+    def test_save_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profiles.json")
+
+            # Test that only the last profiles are kept.
+            for index in range(4):
+                with self.tracer.span("postgresql"):
+                    pass
+                self.tracer.save_profile(path, f"hook{index}", {"secrets": index}, max_profiles=3)
+            with open(path) as file:
+                profiles = json.load(file)
+            self.assertEqual(
+                [profile["hook"] for profile in profiles], ["hook1", "hook2", "hook3"]
+            )
+            self.assertEqual(profiles[-1]["counters"], {"secrets": 3})
+            self.assertEqual(profiles[-1]["calls"]["postgresql"]["calls"], 4)
+            self.assertEqual(os.listdir(directory), ["profiles.json"])
+
+            # Test that a corrupted file is replaced.
+            with open(path, "w") as file:
+                file.write("invalid")
+            self.tracer.save_profile(path, "hook")
+            with open(path) as file:
+                self.assertEqual(len(json.load(file)), 1)
@@ -8,11 +8,13 @@ from charms.data_platform_libs.v0.upgrade import (
     ClusterNotReadyError,
     KubernetesClientError,
 )
+from charms.postgresql_k8s.v0.postgresql import PostgreSQLCheckBackupInProgressError
 from lightkube.resources.apps_v1 import StatefulSet
+from ops.model import BlockedStatus
 from ops.testing import Harness
 
 from charm import PostgresqlOperatorCharm
-from patroni import SwitchoverFailedError
+from patroni import MEMBER_LAGGING, MemberHealth, SwitchoverFailedError
 from tests.unit.helpers import _FakeApiError
 
 
@@ -77,7 +79,7 @@ class TestUpgrade(unittest.TestCase):
 
     @patch("charms.data_platform_libs.v0.upgrade.DataUpgrade.set_unit_failed")
     @patch("charms.data_platform_libs.v0.upgrade.DataUpgrade.set_unit_completed")
-    @patch("charm.Patroni.is_replication_healthy", new_callable=PropertyMock)
+    @patch("charm.Patroni.get_unhealthy_members")
     @patch("charm.Patroni.cluster_members", new_callable=PropertyMock)
     @patch("upgrade.wait_fixed", return_value=tenacity.wait_fixed(0))
     @patch("charm.Patroni.member_started", new_callable=PropertyMock)
@@ -86,7 +88,7 @@ class TestUpgrade(unittest.TestCase):
         _member_started,
         _,
         _cluster_members,
-        _is_replication_healthy,
+        _get_unhealthy_members,
         _set_unit_completed,
         _set_unit_failed,
     ):
@@ -122,6 +124,13 @@ class TestUpgrade(unittest.TestCase):
         mock_event.defer.assert_not_called()
         _set_unit_completed.assert_not_called()
         _set_unit_failed.assert_called_once()
+        self.assertEqual(
+            self.charm.unit.status,
+            BlockedStatus(
+                f"upgrade failed: {self.charm.unit.name} not in the cluster."
+                " Check logs for rollback instruction"
+            ),
+        )
 
         # Test when the member has already joined the cluster, but replication
         # is not healthy yet.
@@ -131,17 +140,26 @@ class TestUpgrade(unittest.TestCase):
             self.charm.unit.name.replace("/", "-"),
             "postgresql-k8s-1",
         ]
-        _is_replication_healthy.return_value = False
+        _get_unhealthy_members.return_value = {
+            "postgresql-k8s-1": MemberHealth(MEMBER_LAGGING, 1048576)
+        }
         self.charm.upgrade._on_postgresql_pebble_ready(mock_event)
         mock_event.defer.assert_not_called()
         _set_unit_completed.assert_not_called()
         _set_unit_failed.assert_called_once()
+        self.assertEqual(
+            self.charm.unit.status,
+            BlockedStatus(
+                "upgrade failed: replication unhealthy in postgresql-k8s-1 lagging"
+                " (lag: 1048576 bytes). Check logs for rollback instruction"
+            ),
+        )
 
         # Test when replication is healthy.
         _member_started.reset_mock()
         _set_unit_failed.reset_mock()
         mock_event.defer.reset_mock()
-        _is_replication_healthy.return_value = True
+        _get_unhealthy_members.return_value = {}
         self.charm.upgrade._on_postgresql_pebble_ready(mock_event)
         _member_started.assert_called_once()
         mock_event.defer.assert_not_called()
@@ -166,12 +184,14 @@ class TestUpgrade(unittest.TestCase):
     @patch("charm.Patroni.get_sync_standby_names")
     @patch("charm.PostgresqlOperatorCharm.update_config")
     @patch("charm.Patroni.get_primary")
+    @patch("charm.PostgreSQL.is_backup_in_progress")
     @patch("charm.Patroni.is_creating_backup", new_callable=PropertyMock)
     @patch("charm.Patroni.are_all_members_ready")
     def test_pre_upgrade_check(
         self,
         _are_all_members_ready,
         _is_creating_backup,
+        _is_backup_in_progress,
         _get_primary,
         _update_config,
         _get_sync_standby_names,
@@ -182,9 +202,12 @@ class TestUpgrade(unittest.TestCase):
         self.harness.set_leader(True)
 
         # Set some side effects to test multiple situations.
-        _are_all_members_ready.side_effect = [False, True, True, True, True, True, True]
-        _is_creating_backup.side_effect = [True, False, False, False, False, False]
-        _switchover.side_effect = [None, SwitchoverFailedError]
+        _are_all_members_ready.side_effect = [False] + [True] * 9
+        _is_creating_backup.side_effect = [True] + [False] * 8
+        _is_backup_in_progress.side_effect = [True, PostgreSQLCheckBackupInProgressError] + [
+            False
+        ] * 6
+        _switchover.side_effect = [None, SwitchoverFailedError, None]
 
         # Test when not all members are ready.
         with self.assertRaises(ClusterNotReadyError):
@@ -193,9 +216,11 @@ class TestUpgrade(unittest.TestCase):
         _set_list_of_sync_standbys.assert_not_called()
         _set_rolling_update_partition.assert_not_called()
 
-        # Test when a backup is being created.
-        with self.assertRaises(ClusterNotReadyError):
-            self.charm.upgrade.pre_upgrade_check()
+        # Test when a backup is being created, through the action or the scheduled backups,
+        # and when it can't be checked.
+        for _ in range(3):
+            with self.assertRaises(ClusterNotReadyError):
+                self.charm.upgrade.pre_upgrade_check()
         _switchover.assert_not_called()
         _set_list_of_sync_standbys.assert_not_called()
         _set_rolling_update_partition.assert_not_called()
@@ -245,6 +270,16 @@ class TestUpgrade(unittest.TestCase):
         _set_list_of_sync_standbys.assert_called_once()
         _set_rolling_update_partition.assert_not_called()
 
+        # Test when there are no sync-standbys in the asynchronous mode.
+        _set_list_of_sync_standbys.reset_mock()
+        _get_sync_standby_names.return_value = []
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"synchronous-mode": "async"})
+        self.charm.upgrade.pre_upgrade_check()
+        _switchover.assert_called_once_with(unit_zero_name)
+        _set_list_of_sync_standbys.assert_not_called()
+        _set_rolling_update_partition.assert_called_once_with(self.charm.app.planned_units() - 1)
+
     @patch("charm.Patroni.get_sync_standby_names")
     def test_set_list_of_sync_standbys(self, _get_sync_standby_names):
         # Mock some return values.
@@ -4,7 +4,7 @@
 import re
 import unittest
 
-from utils import new_password
+from utils import any_cpu_to_cores, new_password
 
 
 class TestUtils(unittest.TestCase):
@@ -18,3 +18,10 @@ class TestUtils(unittest.TestCase):
         second_password = new_password()
         self.assertIsNotNone(re.fullmatch("[a-zA-Z0-9\b]{16}$", second_password))
         self.assertNotEqual(second_password, first_password)
+
+    def test_any_cpu_to_cores(self):
+        self.assertEqual(any_cpu_to_cores("2"), 2)
+        self.assertEqual(any_cpu_to_cores("500m"), 0.5)
+        self.assertEqual(any_cpu_to_cores("1.5"), 1.5)
+        with self.assertRaises(ValueError):
+            any_cpu_to_cores("1Gi")